@@ -62,6 +62,13 @@ class App extends Component {
 
     let csrfToken = document.querySelector("[name=csrfmiddlewaretoken]").value;
 
+    // the same key for retries of the same order, so server won't duplicate it
+    let payload = JSON.stringify(data);
+    if (payload !== this.checkoutPayload){
+      this.checkoutPayload = payload;
+      this.checkoutKey = `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+    }
+
     try {
       let response = await fetch(url, {
         method: 'post',
@@ -69,8 +76,9 @@ class App extends Component {
           'Accept': 'application/json',
           'Content-Type': 'application/json',
           'X-CSRFToken': csrfToken,
+          'Idempotency-Key': this.checkoutKey,
         },
-        body: JSON.stringify(data),
+        body: payload,
       });
 
       if (!response.ok){
@@ -79,6 +87,7 @@ class App extends Component {
       }
       let responseData = await response.json();
 
+      this.checkoutPayload = null;
       this.setState({
         cart: [],
       });
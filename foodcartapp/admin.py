@@ -8,9 +8,15 @@ from django.utils.html import format_html
 from django.utils.http import url_has_allowed_host_and_scheme
 
 from django.conf import settings
+from django.db import transaction
+
+from location.tasks import schedule_geocoding
+
+from .availability import get_availability_index
+from .candidates import schedule_refresh
 from .models import (
     Product, ProductCategory, Restaurant, RestaurantMenuItem,
-    Order, OrderPosition
+    Order, OrderPosition, Banner
 )
 
 
@@ -118,6 +124,20 @@ class ProductAdmin(admin.ModelAdmin):
     pass
 
 
+@admin.register(Banner)
+class BannerAdmin(admin.ModelAdmin):
+    list_display = [
+        'title',
+        'text',
+        'order',
+        'active_from',
+        'active_until',
+    ]
+    list_editable = [
+        'order',
+    ]
+
+
 class OrderPositionInline(admin.TabularInline):
     model = OrderPosition
     extra = 0
@@ -127,21 +147,31 @@ class OrderAdminForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-        self.fields['performer'].queryset = Restaurant.objects\
-            .get_available_for_order(self.instance)
+        product_ids = []
+        if self.instance.pk:
+            product_ids = self.instance.positions\
+                .values_list('product_id', flat=True)
+        self.fields['performer'].queryset = Restaurant.objects.filter(
+            id__in=get_availability_index().get_restaurant_ids(product_ids)
+        )
 
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     form = OrderAdminForm
     inlines = [OrderPositionInline]
-    list_display = ('firstname', 'lastname', 'phonenumber', 'address')
+    list_display = (
+        'firstname', 'lastname', 'phonenumber', 'address', 'total'
+    )
+    readonly_fields = ('total',)
 
     def save_model(self, request, obj, form, change):
         """If restaurant selected - change status to APPOINTED"""
         if obj.performer and obj.status == '10':
             obj.status = '20'
         obj.save()
+        if 'address' in form.changed_data:
+            transaction.on_commit(lambda: schedule_geocoding([obj.address]))
 
     def save_formset(self, request, form, formset, change):
         """Saves product prices as of the order creation moment"""
@@ -151,6 +181,7 @@ class OrderAdmin(admin.ModelAdmin):
         for instance in instances:
             instance.price = instance.product.price
             instance.save()
+        schedule_refresh(order_ids=[form.instance.pk])
 
     def response_post_save_change(self, request, obj):
         default_response = super().response_post_save_change(request, obj)
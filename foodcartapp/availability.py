@@ -0,0 +1,100 @@
+import threading
+import time
+
+from .models import Restaurant, RestaurantMenuItem
+from .versions import bump_version, get_version
+
+AVAILABILITY_VERSION = 'availability'
+MAX_INDEX_AGE = 5 * 60
+
+NO_PRODUCTS = frozenset()
+
+
+class AvailabilityIndex:
+    """Sets of products available in each restaurant.
+
+    Changes of menu items made by this process are applied in place,
+    changes made by other workers are picked up by version stamp.
+    The index is rebuilt from scratch at least every MAX_INDEX_AGE
+    to fix a change lost in a race of two workers.
+    """
+    def __init__(self, version: int):
+        self.version = version
+        self.built_at = time.monotonic()
+        products = {
+            restaurant_id: set()
+            for restaurant_id in Restaurant.objects.values_list(
+                'id', flat=True
+            )
+        }
+        available_items = RestaurantMenuItem.objects\
+            .filter(availability=True)\
+            .values_list('restaurant_id', 'product_id')
+        for restaurant_id, product_id in available_items:
+            products.setdefault(restaurant_id, set()).add(product_id)
+        self.products = {
+            restaurant_id: frozenset(product_ids)
+            for restaurant_id, product_ids in products.items()
+        }
+
+    def is_fresh(self, version: int) -> bool:
+        return self.version == version \
+            and time.monotonic() - self.built_at < MAX_INDEX_AGE
+
+    def get_products(self, restaurant_id: int) -> frozenset:
+        return self.products.get(restaurant_id, NO_PRODUCTS)
+
+    def can_perform(self, restaurant_id: int, product_ids) -> bool:
+        return self.get_products(restaurant_id).issuperset(product_ids)
+
+    def get_restaurant_ids(self, product_ids) -> list:
+        """Returns ids of restaurants having all the products available."""
+        product_ids = set(product_ids)
+        if not product_ids:
+            return []
+        return [
+            restaurant_id
+            for restaurant_id, available_products in self.products.items()
+            if available_products.issuperset(product_ids)
+        ]
+
+    def set_availability(self, restaurant_id: int, product_id: int,
+                         available: bool):
+        products = self.get_products(restaurant_id)
+        if available:
+            products = products | {product_id}
+        else:
+            products = products - {product_id}
+        self.products = {**self.products, restaurant_id: products}
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_availability_index() -> AvailabilityIndex:
+    """Returns per-process index, rebuilt when other workers change menus."""
+    global _index
+    version = get_version(AVAILABILITY_VERSION)
+    index = _index
+    if index and index.is_fresh(version):
+        return index
+    with _index_lock:
+        if not _index or not _index.is_fresh(version):
+            _index = AvailabilityIndex(version)
+        return _index
+
+
+def update_availability(restaurant_id: int, product_id: int,
+                        available: bool):
+    """Applies committed change of a menu item to the index.
+
+    If the index of this process was up to date, it is patched and
+    keeps being up to date, otherwise it is rebuilt on next access.
+    """
+    with _index_lock:
+        previous_version = get_version(AVAILABILITY_VERSION)
+        version = bump_version(AVAILABILITY_VERSION)
+        if _index and _index.version == previous_version:
+            _index.set_availability(restaurant_id, product_id, available)
+            _index.version = version
@@ -0,0 +1,82 @@
+import json
+import threading
+from typing import NamedTuple
+
+from django.utils import timezone
+
+from .models import Banner
+from .response_cache import encode_bodies
+from .versions import get_version
+
+
+BANNERS_VERSION = 'banners'
+
+
+class BannersSnapshot(NamedTuple):
+    version: int
+    bodies: dict
+    valid_until: [timezone.datetime, None]
+    # Version stamp of this content, the later of data version and
+    # the last active window boundary passed
+    stamp: int
+
+
+_local_snapshot = None
+_build_lock = threading.Lock()
+
+
+def build_banners_snapshot(version: int) -> BannersSnapshot:
+    now = timezone.now()
+    banners = list(Banner.objects.all())
+    dumped_banners = [
+        {
+            'title': banner.title,
+            'src': banner.image.url,
+            'text': banner.text,
+        } for banner in banners if banner.is_active(now)
+    ]
+    boundaries = [
+        moment
+        for banner in banners
+        for moment in (banner.active_from, banner.active_until)
+        if moment
+    ]
+    passed_boundary = max(
+        (moment for moment in boundaries if moment <= now), default=None
+    )
+    stamp = version
+    if passed_boundary:
+        stamp = max(version, int(passed_boundary.timestamp() * 1e9))
+    return BannersSnapshot(
+        version,
+        encode_bodies(json.dumps(
+            dumped_banners, ensure_ascii=False, separators=(',', ':')
+        ).encode()),
+        min((moment for moment in boundaries if moment > now), default=None),
+        stamp,
+    )
+
+
+def get_banners_snapshot() -> BannersSnapshot:
+    """Returns rendered banners from the worker memory.
+
+    Snapshot is rebuilt when banners version changes or when some
+    banner enters or leaves its active window.
+    """
+    global _local_snapshot
+
+    version = get_version(BANNERS_VERSION)
+    snapshot = _local_snapshot
+    if snapshot and snapshot.version == version and (
+        not snapshot.valid_until or snapshot.valid_until > timezone.now()
+    ):
+        return snapshot
+
+    with _build_lock:
+        snapshot = _local_snapshot
+        if not snapshot or snapshot.version != version or (
+            snapshot.valid_until and snapshot.valid_until <= timezone.now()
+        ):
+            snapshot = build_banners_snapshot(version)
+            _local_snapshot = snapshot
+    return snapshot
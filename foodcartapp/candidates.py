@@ -0,0 +1,109 @@
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from location.geofunctions import get_address_coordinates
+
+from .matching import get_matching_engine
+from .models import Order, OrderCandidate
+
+ACTIVE_STATUSES = ['10', '20', '30', '40']
+REFRESH_CHUNK_SIZE = 500
+
+
+def get_unassigned_orders():
+    return Order.objects.filter(
+        status__in=ACTIVE_STATUSES, performer__isnull=True
+    )
+
+
+def refresh_candidates(orders) -> int:
+    """Recomputes candidate restaurants of unassigned orders.
+
+    Takes an Order queryset. Candidates within
+    RESTAURANT_SEARCH_RADIUS_KM are ranked by distance and stored,
+    up to ORDER_CANDIDATES_LIMIT per order, the nearest
+    ORDER_CANDIDATES_EXACT_LIMIT of them by the exact geodesic. Orders
+    with addresses not geocoded yet get no candidates until their
+    coordinates are saved.
+    Returns number of refreshed orders.
+    """
+    order_ids = list(
+        orders.filter(status__in=ACTIVE_STATUSES, performer__isnull=True)
+        .values_list('id', flat=True).distinct()
+    )
+    engine = get_matching_engine()
+    for start in range(0, len(order_ids), REFRESH_CHUNK_SIZE):
+        chunk_ids = order_ids[start:start + REFRESH_CHUNK_SIZE]
+        chunk = Order.objects\
+            .filter(id__in=chunk_ids)\
+            .prefetch_related('positions')
+        address_coordinates = get_address_coordinates(
+            {order.address for order in chunk}
+        )
+        located_orders = {}
+        for order in chunk:
+            order_location = address_coordinates.get(order.address)
+            if not order_location or order_location[0] is None:
+                continue
+            located_orders[order.id] = (
+                order_location,
+                {position.product_id for position in order.positions.all()},
+            )
+        candidates = engine.match(
+            located_orders,
+            max_distance_km=settings.RESTAURANT_SEARCH_RADIUS_KM,
+            limit=settings.ORDER_CANDIDATES_LIMIT,
+            exact_limit=settings.ORDER_CANDIDATES_EXACT_LIMIT,
+        )
+        with transaction.atomic():
+            OrderCandidate.objects.filter(order_id__in=chunk_ids).delete()
+            OrderCandidate.objects.bulk_create([
+                OrderCandidate(
+                    order_id=order_id,
+                    restaurant_id=restaurant_id,
+                    distance=distance,
+                    rank=rank,
+                )
+                for order_id, order_candidates in candidates.items()
+                for rank, (distance, restaurant_id)
+                in enumerate(order_candidates, start=1)
+            ])
+    return len(order_ids)
+
+
+class CandidateRefresh:
+    """Changes collected in one transaction, refreshed once on commit."""
+    def __init__(self):
+        self.product_ids = set()
+        self.order_ids = set()
+        self.finished = False
+
+    def run(self):
+        if self.finished:
+            return
+        self.finished = True
+        refresh_candidates(get_unassigned_orders().filter(
+            Q(positions__product_id__in=self.product_ids)
+            | Q(id__in=self.order_ids)
+        ))
+
+
+_pending = threading.local()
+
+
+def schedule_refresh(product_ids=(), order_ids=()):
+    """Refreshes candidates of orders with the products after commit.
+
+    All calls made within one transaction share a single refresh. A
+    refresh left from a rolled back transaction just joins the next
+    one, which only costs extra recalculation.
+    """
+    refresh = getattr(_pending, 'refresh', None)
+    if refresh is None or refresh.finished:
+        refresh = _pending.refresh = CandidateRefresh()
+    refresh.product_ids.update(product_ids)
+    refresh.order_ids.update(order_ids)
+    transaction.on_commit(refresh.run)
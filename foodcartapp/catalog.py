@@ -0,0 +1,180 @@
+import base64
+import binascii
+import json
+import threading
+import time
+from typing import NamedTuple
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Product
+from .response_cache import encode_bodies
+from .versions import get_version
+
+
+CATALOG_VERSION = 'catalog'
+SNAPSHOT_KEY = 'catalog:snapshot:encoded'
+BUILD_LOCK_KEY = 'catalog:snapshot:encoded:lock'
+BUILD_LOCK_TIMEOUT = 30
+BUILD_WAIT_TIMEOUT = 5
+BUILD_WAIT_STEP = 0.05
+STREAM_CHUNK_SIZE = 500
+
+CATALOG_FIELDS = {
+    'id': ['id'],
+    'name': ['name'],
+    'price': ['price'],
+    'special_status': ['special_status'],
+    'description': ['description'],
+    'category': ['category__id', 'category__name'],
+    'image': ['image'],
+    'restaurant': ['id', 'name'],
+}
+
+
+class CatalogSnapshot(NamedTuple):
+    version: int
+    bodies: dict
+
+
+PRODUCT_SERIALIZERS = {
+    'id': lambda product: product.id,
+    'name': lambda product: product.name,
+    'price': lambda product: product.price,
+    'special_status': lambda product: product.special_status,
+    'description': lambda product: product.description,
+    'category': lambda product: {
+        'id': product.category.id,
+        'name': product.category.name,
+    } if product.category else None,
+    'image': lambda product: product.image.url,
+    'restaurant': lambda product: {
+        'id': product.id,
+        'name': product.name,
+    },
+}
+
+
+_local_snapshot = None
+_build_lock = threading.Lock()
+
+
+def serialize_product(product, fields=CATALOG_FIELDS) -> dict:
+    return {field: PRODUCT_SERIALIZERS[field](product) for field in fields}
+
+
+def dump_json(data) -> str:
+    return json.dumps(
+        data,
+        cls=DjangoJSONEncoder,
+        ensure_ascii=False,
+        separators=(',', ':'),
+    )
+
+
+def build_catalog() -> bytes:
+    products = Product.objects.select_related('category').available()
+    dumped_products = [serialize_product(product) for product in products]
+    return dump_json(dumped_products).encode()
+
+
+def _build_snapshot(version: int) -> CatalogSnapshot:
+    snapshot = CatalogSnapshot(version, encode_bodies(build_catalog()))
+    cache.set(SNAPSHOT_KEY, snapshot, timeout=None)
+    return snapshot
+
+
+def _wait_for_snapshot(version: int) -> [CatalogSnapshot, None]:
+    deadline = time.monotonic() + BUILD_WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(BUILD_WAIT_STEP)
+        snapshot = cache.get(SNAPSHOT_KEY)
+        if snapshot and snapshot.version >= version:
+            return snapshot
+    return None
+
+
+def get_catalog_snapshot() -> CatalogSnapshot:
+    """Returns serialized catalog, rebuilding it on version change.
+
+    Rebuilds are coalesced: within a process only one thread builds,
+    across processes only the holder of the cache lock builds while
+    the others serve the previous snapshot or wait for the new one.
+    """
+    global _local_snapshot
+
+    version = get_version(CATALOG_VERSION)
+    snapshot = _local_snapshot
+    if snapshot and snapshot.version == version:
+        return snapshot
+
+    with _build_lock:
+        snapshot = cache.get(SNAPSHOT_KEY)
+        if not snapshot or snapshot.version != version:
+            if cache.add(BUILD_LOCK_KEY, version, BUILD_LOCK_TIMEOUT):
+                try:
+                    snapshot = _build_snapshot(version)
+                finally:
+                    cache.delete(BUILD_LOCK_KEY)
+            elif not snapshot:
+                snapshot = _wait_for_snapshot(version) \
+                    or _build_snapshot(version)
+        _local_snapshot = snapshot
+
+    return snapshot
+
+
+def encode_cursor(product_id: int) -> str:
+    return base64.urlsafe_b64encode(str(product_id).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, ValueError):
+        raise ValueError(f'Invalid cursor: {cursor}')
+
+
+def get_catalog_queryset(category=None, special=None, fields=CATALOG_FIELDS):
+    """Returns available products ordered by id for keyset pagination.
+
+    Only the columns needed for the requested fields are selected.
+    """
+    products = Product.objects.available().order_by('id')
+    if category is not None:
+        products = products.filter(category_id=category)
+    if special is not None:
+        products = products.filter(special_status=special)
+    if 'category' in fields:
+        products = products.select_related('category')
+    model_fields = {'id'}
+    for field in fields:
+        model_fields.update(CATALOG_FIELDS[field])
+    return products.only(*model_fields)
+
+
+def get_catalog_page(products, limit: int, after_id: int = None) -> tuple:
+    """Returns one page of products and cursor of the next page."""
+    if after_id is not None:
+        products = products.filter(id__gt=after_id)
+    page = list(products[:limit + 1])
+    next_cursor = encode_cursor(page[limit - 1].id) \
+        if len(page) > limit else None
+    return page[:limit], next_cursor
+
+
+def iter_catalog_json(products, fields=CATALOG_FIELDS):
+    """Yields catalog as a JSON array piece by piece.
+
+    Queryset is fetched in chunks, so the whole catalog never sits
+    in memory at once.
+    """
+    yield '['
+    for number, product in enumerate(
+        products.iterator(chunk_size=STREAM_CHUNK_SIZE)
+    ):
+        if number:
+            yield ','
+        yield dump_json(serialize_product(product, fields))
+    yield ']'
@@ -0,0 +1,165 @@
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Order, OrderCandidate
+
+FORBIDDEN_COST = 1e9
+UNASSIGNED_COST = 1e6
+BUSY_STATUSES = ['20', '30']
+
+
+def solve_assignment(cost: np.ndarray) -> list:
+    """Solves min-cost assignment of rows to columns, rows <= columns.
+
+    Hungarian method with shortest augmenting paths, O(rows^2 * columns)
+    in the worst case, the scan over columns is vectorized. Returns
+    column index for every row.
+    """
+    rows, columns = cost.shape
+    row_potentials = np.zeros(rows + 1)
+    column_potentials = np.zeros(columns + 1)
+    # Column 0 is a fake one, matched rows are numbered from 1
+    matched_rows = np.zeros(columns + 1, dtype=int)
+    previous_columns = np.zeros(columns + 1, dtype=int)
+    for row in range(1, rows + 1):
+        matched_rows[0] = row
+        column = 0
+        min_reduced_costs = np.full(columns + 1, np.inf)
+        visited = np.zeros(columns + 1, dtype=bool)
+        while matched_rows[column]:
+            visited[column] = True
+            current_row = matched_rows[column]
+            reduced_costs = cost[current_row - 1] \
+                - row_potentials[current_row] - column_potentials[1:]
+            improved = ~visited[1:] \
+                & (reduced_costs < min_reduced_costs[1:])
+            min_reduced_costs[1:][improved] = reduced_costs[improved]
+            previous_columns[1:][improved] = column
+
+            unvisited_costs = np.where(
+                visited[1:], np.inf, min_reduced_costs[1:]
+            )
+            next_column = int(np.argmin(unvisited_costs)) + 1
+            delta = unvisited_costs[next_column - 1]
+            row_potentials[matched_rows[visited]] += delta
+            column_potentials[visited] -= delta
+            min_reduced_costs[1:][~visited[1:]] -= delta
+            column = next_column
+
+        while column:
+            previous_column = previous_columns[column]
+            matched_rows[column] = matched_rows[previous_column]
+            column = previous_column
+
+    assignment = [None] * rows
+    for column in range(1, columns + 1):
+        if matched_rows[column]:
+            assignment[matched_rows[column] - 1] = column - 1
+    return assignment
+
+
+def get_free_capacities(restaurant_ids, capacity: int) -> dict:
+    busy = dict(
+        Order.objects
+        .filter(status__in=BUSY_STATUSES, performer_id__in=restaurant_ids)
+        .values_list('performer_id')
+        .annotate(count=Count('id'))
+    )
+    return {
+        restaurant_id: max(capacity - busy.get(restaurant_id, 0), 0)
+        for restaurant_id in restaurant_ids
+    }
+
+
+def plan_dispatch(candidates: dict, capacities: dict) -> dict:
+    """Assigns orders to restaurants minimizing total distance.
+
+    candidates maps order id to [(distance, restaurant id)],
+    capacities maps restaurant id to number of orders it may take.
+    As many orders as possible are assigned, an order stays without
+    restaurant only if its candidates have no capacity left.
+    """
+    order_ids = list(candidates)
+    demand = Counter(
+        restaurant_id
+        for order_candidates in candidates.values()
+        for _, restaurant_id in order_candidates
+    )
+    slots = [
+        restaurant_id
+        for restaurant_id, order_count in demand.items()
+        for _ in range(min(capacities.get(restaurant_id, 0), order_count))
+    ]
+    if not order_ids or not slots:
+        return {}
+
+    slot_columns = {}
+    for column, restaurant_id in enumerate(slots):
+        slot_columns.setdefault(restaurant_id, []).append(column)
+    # Extra columns let every order stay unassigned at a high cost
+    cost = np.full(
+        (len(order_ids), len(slots) + len(order_ids)), FORBIDDEN_COST
+    )
+    cost[:, len(slots):] = UNASSIGNED_COST
+    for row, order_id in enumerate(order_ids):
+        for distance, restaurant_id in candidates[order_id]:
+            cost[row, slot_columns.get(restaurant_id, [])] = distance
+
+    plan = {}
+    for row, column in enumerate(solve_assignment(cost)):
+        if column < len(slots) and cost[row, column] < FORBIDDEN_COST:
+            plan[order_ids[row]] = slots[column]
+    return plan
+
+
+def dispatch_new_orders(limit: int = 500, capacity: int = None,
+                        dry_run: bool = False) -> dict:
+    """Assigns restaurants to the oldest new orders in one go.
+
+    Uses stored order candidates and at most capacity active orders
+    per restaurant. Assigned orders are switched to APPOINTED by a
+    single bulk update. Returns the plan {order id: restaurant id}.
+    """
+    capacity = settings.DISPATCH_RESTAURANT_CAPACITY \
+        if capacity is None else capacity
+    order_ids = list(
+        Order.objects
+        .filter(status='10', performer__isnull=True)
+        .order_by('created_at')
+        .values_list('id', flat=True)[:limit]
+    )
+    candidates = {order_id: [] for order_id in order_ids}
+    stored_candidates = OrderCandidate.objects\
+        .filter(order_id__in=order_ids)\
+        .order_by('rank')\
+        .values_list('order_id', 'distance', 'restaurant_id')
+    for order_id, distance, restaurant_id in stored_candidates:
+        candidates[order_id].append((distance, restaurant_id))
+
+    restaurant_ids = {
+        restaurant_id
+        for order_candidates in candidates.values()
+        for _, restaurant_id in order_candidates
+    }
+    plan = plan_dispatch(
+        candidates, get_free_capacities(restaurant_ids, capacity)
+    )
+    if dry_run or not plan:
+        return plan
+
+    with transaction.atomic():
+        orders = list(
+            Order.objects
+            .select_for_update()
+            .filter(id__in=plan, status='10', performer__isnull=True)
+        )
+        for order in orders:
+            order.performer_id = plan[order.id]
+            order.status = '20'
+        Order.objects.bulk_update(orders, ['performer', 'status'])
+        OrderCandidate.objects.filter(order__in=orders).delete()
+    return {order.id: order.performer_id for order in orders}
@@ -0,0 +1,120 @@
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+KEY_MAX_LENGTH = 255
+CACHE_KEY_TEMPLATE = 'idempotency:{key}'
+
+
+def get_fingerprint(data) -> str:
+    dumped_data = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(dumped_data.encode()).hexdigest()
+
+
+def find_stored_response(key: str) -> [tuple, None]:
+    """Looks for saved response in cache first, then in the database."""
+    stored_response = cache.get(CACHE_KEY_TEMPLATE.format(key=key))
+    if stored_response:
+        return stored_response
+
+    expired_before = timezone.now() \
+        - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+    idempotency_key = IdempotencyKey.objects.filter(key=key).first()
+    if not idempotency_key:
+        return None
+    if idempotency_key.created_at < expired_before:
+        idempotency_key.delete()
+        return None
+    stored_response = (
+        idempotency_key.fingerprint,
+        idempotency_key.response_status,
+        idempotency_key.response_data,
+    )
+    cache_stored_response(key, stored_response)
+    return stored_response
+
+
+def cache_stored_response(key: str, stored_response: tuple):
+    cache.set(
+        CACHE_KEY_TEMPLATE.format(key=key),
+        stored_response,
+        settings.IDEMPOTENCY_KEY_TTL,
+    )
+
+
+def replay(stored_response: tuple, fingerprint: str) -> Response:
+    stored_fingerprint, response_status, response_data = stored_response
+    if stored_fingerprint != fingerprint:
+        return Response(
+            {'error': f'{IDEMPOTENCY_HEADER} уже использован с другими '
+                      f'данными.'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    return Response(
+        response_data,
+        status=response_status,
+        headers={REPLAYED_HEADER: 'true'},
+    )
+
+
+def idempotent(view):
+    """Makes DRF view replay its response for a repeated Idempotency-Key.
+
+    Successful response is saved together with the key in the same
+    transaction as the changes made by the view, so a retried request
+    never repeats the writes. Requests without the header are handled
+    as usual.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return view(request, *args, **kwargs)
+        if len(key) > KEY_MAX_LENGTH:
+            return Response(
+                {'error': f'{IDEMPOTENCY_HEADER} длиннее '
+                          f'{KEY_MAX_LENGTH} символов.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        fingerprint = get_fingerprint(request.data)
+        stored_response = find_stored_response(key)
+        if stored_response:
+            return replay(stored_response, fingerprint)
+
+        try:
+            with transaction.atomic():
+                response = view(request, *args, **kwargs)
+                if not status.is_success(response.status_code):
+                    return response
+                IdempotencyKey.objects.create(
+                    key=key,
+                    fingerprint=fingerprint,
+                    response_status=response.status_code,
+                    response_data=response.data,
+                )
+        except IntegrityError:
+            stored_response = find_stored_response(key)
+            if not stored_response:
+                raise
+            return replay(stored_response, fingerprint)
+
+        cache_stored_response(
+            key, (fingerprint, response.status_code, response.data)
+        )
+        return response
+
+    return wrapper
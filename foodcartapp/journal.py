@@ -0,0 +1,222 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import DataError, IntegrityError
+
+from .models import Order, Product
+from .orders import create_orders
+
+logger = logging.getLogger(__name__)
+
+# Errors of a bad entry, as opposed to the database being unavailable
+BROKEN_ENTRY_ERRORS = (
+    DataError, IntegrityError, InvalidOperation, KeyError, TypeError,
+    ValueError,
+)
+
+
+class OrderJournal:
+    """Append-only local journal of accepted orders.
+
+    Journal is a SQLite database in WAL mode with full sync, so an
+    appended entry survives a crash once append() has returned.
+    Entries stay pending until drain() has saved them to the main
+    database. An entry appended with an idempotency key already in
+    the journal is dropped, so concurrent retries of one request
+    journal a single order.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.path, timeout=30, isolation_level=None
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=FULL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                'entry_id TEXT NOT NULL UNIQUE, '
+                'payload TEXT NOT NULL, '
+                'created_at REAL NOT NULL, '
+                'drained_at REAL, '
+                'error TEXT)'
+            )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS entries_pending '
+                'ON entries (drained_at, id)'
+            )
+            columns = [
+                column[1] for column
+                in connection.execute('PRAGMA table_info(entries)')
+            ]
+            if 'idempotency_key' not in columns:
+                connection.execute(
+                    'ALTER TABLE entries ADD COLUMN idempotency_key TEXT'
+                )
+            connection.execute(
+                'CREATE UNIQUE INDEX IF NOT EXISTS entries_idempotency_key '
+                'ON entries (idempotency_key)'
+            )
+            self._local.connection = connection
+        return connection
+
+    def append(self, payload: dict, idempotency_key: str = None) -> str:
+        entry_id = str(uuid.uuid4())
+        self.connection.execute(
+            'INSERT OR IGNORE INTO entries '
+            '(entry_id, payload, created_at, idempotency_key) '
+            'VALUES (?, ?, ?, ?)',
+            (
+                entry_id,
+                json.dumps(payload, ensure_ascii=False),
+                time.time(),
+                idempotency_key,
+            ),
+        )
+        return entry_id
+
+    def fetch_pending(self, limit: int) -> list:
+        rows = self.connection.execute(
+            'SELECT entry_id, payload FROM entries '
+            'WHERE drained_at IS NULL ORDER BY id LIMIT ?',
+            (limit,),
+        )
+        return [(entry_id, json.loads(payload)) for entry_id, payload in rows]
+
+    def mark_drained(self, entry_ids, error: str = None):
+        self.connection.executemany(
+            'UPDATE entries SET drained_at = ?, error = ? WHERE entry_id = ?',
+            [(time.time(), error, entry_id) for entry_id in entry_ids],
+        )
+
+    def count_pending(self) -> int:
+        return self.connection.execute(
+            'SELECT COUNT(*) FROM entries WHERE drained_at IS NULL'
+        ).fetchone()[0]
+
+    def purge_drained(self, older_than: float) -> int:
+        cursor = self.connection.execute(
+            'DELETE FROM entries WHERE drained_at < ? AND error IS NULL',
+            (older_than,),
+        )
+        return cursor.rowcount
+
+
+_journal = None
+
+
+def get_journal() -> OrderJournal:
+    global _journal
+    if _journal is None or _journal.path != settings.ORDER_JOURNAL_PATH:
+        _journal = OrderJournal(settings.ORDER_JOURNAL_PATH)
+    return _journal
+
+
+def dump_order(validated_order: dict) -> dict:
+    return {
+        'firstname': validated_order['firstname'],
+        'lastname': validated_order['lastname'],
+        'phonenumber': str(validated_order['phonenumber']),
+        'address': validated_order['address'],
+        'products': [
+            {
+                'product': position['product'].id,
+                'quantity': position['quantity'],
+                'price': str(position['price']),
+            } for position in validated_order['products']
+        ],
+    }
+
+
+def journal_order(validated_order: dict,
+                  idempotency_key: str = None) -> str:
+    return get_journal().append(
+        dump_order(validated_order), idempotency_key
+    )
+
+
+def load_order(entry_id: str, payload: dict, products: dict) -> dict:
+    return {
+        **payload,
+        'journal_id': entry_id,
+        'products': [
+            {
+                'product': products[position['product']],
+                'quantity': position['quantity'],
+                'price': Decimal(position['price']),
+            } for position in payload['products']
+        ],
+    }
+
+
+def drain(batch_size: int = 500) -> int:
+    """Moves one batch of pending journal entries to the database.
+
+    Replay is exactly-once: every order keeps id of its journal
+    entry, so entries saved before a crash but not marked as drained
+    are skipped on the next run. If the batch can't be saved, entries
+    are saved one by one, and the failing ones are set aside with
+    their error, so they don't block the journal.
+    """
+    journal = get_journal()
+    entries = journal.fetch_pending(batch_size)
+    if not entries:
+        return 0
+
+    entry_ids = [entry_id for entry_id, _ in entries]
+    saved_entry_ids = set(
+        str(journal_id) for journal_id in Order.objects
+        .filter(journal_id__in=entry_ids)
+        .values_list('journal_id', flat=True)
+    )
+    product_ids = {
+        position.get('product')
+        for _, payload in entries
+        for position in payload.get('products', [])
+    }
+    products = Product.objects.only('id').in_bulk(product_ids)
+
+    validated_orders = {}
+    entry_errors = {}
+    for entry_id, payload in entries:
+        if entry_id in saved_entry_ids:
+            continue
+        if any(position.get('product') not in products
+               for position in payload.get('products', [])):
+            entry_errors[entry_id] = 'product not found'
+            continue
+        try:
+            validated_orders[entry_id] = load_order(
+                entry_id, payload, products
+            )
+        except BROKEN_ENTRY_ERRORS as error:
+            entry_errors[entry_id] = repr(error)
+
+    try:
+        create_orders(list(validated_orders.values()))
+    except BROKEN_ENTRY_ERRORS:
+        for entry_id, validated_order in validated_orders.items():
+            try:
+                create_orders([validated_order])
+            except BROKEN_ENTRY_ERRORS as error:
+                logger.warning(
+                    'Journal entry %s is set aside: %r', entry_id, error
+                )
+                entry_errors[entry_id] = repr(error)
+
+    journal.mark_drained(set(entry_ids) - set(entry_errors))
+    for entry_id, error in entry_errors.items():
+        journal.mark_drained([entry_id], error=error)
+    return len(entries)
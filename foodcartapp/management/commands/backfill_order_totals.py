@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from foodcartapp.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Recalculates stored order totals from order positions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--drifted-only', action='store_true',
+            help='Update only orders whose total differs from positions',
+        )
+
+    def handle(self, *args, **options):
+        orders = Order.objects.all()
+        if options['drifted_only']:
+            orders = Order.objects.filter(
+                pk__in=Order.objects.with_total_drift().values('pk')
+            )
+        updated = orders.recalculate_totals()
+        self.stdout.write(f'Updated {updated} orders')
@@ -0,0 +1,111 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from foodcartapp.matching import MatchingEngine
+from location.distances import haversine_matrix
+from location.spatial import GridIndex
+
+
+def match_naively(orders: dict, restaurant_points: dict,
+                  restaurant_products: dict, max_distance_km: float) -> dict:
+    """Order by order loop the engine replaces, kept for comparison."""
+    restaurant_ids = list(restaurant_points)
+    candidates = {}
+    for order_id, (point, product_ids) in orders.items():
+        distances = haversine_matrix(
+            [point], [restaurant_points[key] for key in restaurant_ids]
+        )[0]
+        candidates[order_id] = sorted(
+            (float(distance), restaurant_id)
+            for distance, restaurant_id in zip(distances, restaurant_ids)
+            if distance <= max_distance_km and all(
+                product_id in restaurant_products[restaurant_id]
+                for product_id in product_ids
+            )
+        )
+    return candidates
+
+
+class Command(BaseCommand):
+    help = 'Measures matching of synthetic orders to restaurants'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=10000)
+        parser.add_argument('--restaurants', type=int, default=500)
+        parser.add_argument('--products', type=int, default=200)
+        parser.add_argument('--radius', type=float, default=30)
+        parser.add_argument(
+            '--cell', type=float, default=2,
+            help='Cell width of the restaurant grid, km',
+        )
+        parser.add_argument(
+            '--naive-orders', type=int, default=500,
+            help='Orders matched by the naive loop to compare results',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        generator = random.Random(options['seed'])
+
+        def random_point():
+            return (
+                generator.uniform(55.55, 55.95),
+                generator.uniform(37.35, 37.85),
+            )
+
+        product_ids = range(1, options['products'] + 1)
+        restaurant_points = {
+            restaurant_id: random_point()
+            for restaurant_id in range(1, options['restaurants'] + 1)
+        }
+        restaurant_products = {
+            restaurant_id: frozenset(
+                product_id for product_id in product_ids
+                if generator.random() < 0.9
+            )
+            for restaurant_id in restaurant_points
+        }
+        orders = {
+            order_id: (
+                random_point(),
+                set(generator.sample(product_ids, generator.randint(1, 5))),
+            )
+            for order_id in range(1, options['orders'] + 1)
+        }
+
+        started_at = time.perf_counter()
+        engine = MatchingEngine(
+            GridIndex(restaurant_points, options['cell']), restaurant_products
+        )
+        build_time = time.perf_counter() - started_at
+
+        started_at = time.perf_counter()
+        candidates = engine.match(orders, max_distance_km=options['radius'])
+        match_time = time.perf_counter() - started_at
+
+        sample = dict(list(orders.items())[:options['naive_orders']])
+        started_at = time.perf_counter()
+        naive_candidates = match_naively(
+            sample, restaurant_points, restaurant_products, options['radius']
+        )
+        naive_time = (time.perf_counter() - started_at) \
+            * len(orders) / max(len(sample), 1)
+
+        mismatches = sum(
+            [restaurant_id for _, restaurant_id in candidates[order_id]]
+            != [restaurant_id for _, restaurant_id in naive_candidates[order_id]]
+            for order_id in sample
+        )
+        average_candidates = sum(map(len, candidates.values())) \
+            / max(len(candidates), 1)
+        self.stdout.write(
+            f'{len(orders)} orders x {len(restaurant_points)} restaurants\n'
+            f'engine build:         {build_time:.3f}s\n'
+            f'engine match:         {match_time:.3f}s\n'
+            f'naive loop, estimate: {naive_time:.3f}s '
+            f'({naive_time / match_time:.0f}x slower)\n'
+            f'candidates per order: {average_candidates:.1f}\n'
+            f'mismatches in {len(sample)} sampled orders: {mismatches}'
+        )
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from foodcartapp.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Reports orders whose stored total differs from their positions'
+
+    def handle(self, *args, **options):
+        drifted_orders = Order.objects.with_total_drift()\
+            .order_by('pk')\
+            .values_list('pk', 'total', 'positions_total')
+        drifted = 0
+        for pk, total, positions_total in drifted_orders.iterator():
+            drifted += 1
+            self.stdout.write(
+                f'Order {pk}: stored {total}, positions {positions_total}'
+            )
+        if drifted:
+            raise CommandError(
+                f'{drifted} orders drifted, run backfill_order_totals'
+            )
+        self.stdout.write('All order totals are consistent')
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from foodcartapp.dispatch import dispatch_new_orders
+
+
+class Command(BaseCommand):
+    help = 'Assigns restaurants to new orders minimizing total distance'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit', type=int, default=500,
+            help='Maximum number of orders dispatched in one go',
+        )
+        parser.add_argument(
+            '--capacity', type=int,
+            help='Maximum number of active orders per restaurant',
+        )
+        parser.add_argument(
+            '--interval', type=float,
+            help='Keep running, dispatching new orders every INTERVAL '
+                 'seconds',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report the assignment',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            plan = dispatch_new_orders(
+                options['limit'], options['capacity'], options['dry_run']
+            )
+            verb = 'Would assign' if options['dry_run'] else 'Assigned'
+            self.stdout.write(f'{verb} {len(plan)} orders')
+            if options['verbosity'] > 1:
+                for order_id, restaurant_id in plan.items():
+                    self.stdout.write(f'{order_id} -> {restaurant_id}')
+            if options['interval'] is None:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from foodcartapp.journal import drain, get_journal
+
+
+class Command(BaseCommand):
+    help = 'Saves orders accepted to the intake journal into the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--interval', type=float, default=1,
+            help='Pause in seconds when the journal is empty',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Drain pending entries and exit',
+        )
+        parser.add_argument(
+            '--purge-after', type=float, default=7 * 24 * 60 * 60,
+            help='Delete drained entries older than this many seconds',
+        )
+
+    def handle(self, *args, **options):
+        journal = get_journal()
+        while True:
+            drained = drain(options['batch_size'])
+            if drained:
+                self.stdout.write(f'Drained {drained} orders')
+                continue
+            journal.purge_drained(time.time() - options['purge_after'])
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,39 @@
+import os
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from foodcartapp.models import Banner
+
+BANNERS = [
+    ('Burger', 'burger.jpg', 'Tasty Burger at your door step'),
+    ('Spices', 'food.jpg', 'All Cuisines'),
+    ('New York', 'tasty.jpg', 'Food is incomplete without a tasty dessert'),
+]
+
+
+class Command(BaseCommand):
+    help = 'Creates default banners from images in assets'
+
+    def handle(self, *args, **options):
+        existing_titles = set(Banner.objects.values_list('title', flat=True))
+        created = 0
+        for order, (title, filename, text) in enumerate(BANNERS):
+            if title in existing_titles:
+                continue
+            image_path = os.path.join(settings.BASE_DIR, 'assets', filename)
+            if not os.path.exists(image_path):
+                self.stderr.write(f'Image {image_path} not found, skipped')
+                continue
+            with open(image_path, 'rb') as image:
+                image_name = default_storage.save(filename, File(image))
+            Banner.objects.create(
+                title=title,
+                image=image_name,
+                text=text,
+                order=order,
+            )
+            created += 1
+        self.stdout.write(f'Created {created} banners')
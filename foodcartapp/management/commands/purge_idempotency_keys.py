@@ -0,0 +1,19 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from foodcartapp.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = 'Deletes expired idempotency keys'
+
+    def handle(self, *args, **options):
+        expired_before = timezone.now() \
+            - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+        deleted, _ = IdempotencyKey.objects\
+            .filter(created_at__lt=expired_before)\
+            .delete()
+        self.stdout.write(f'Deleted {deleted} expired keys')
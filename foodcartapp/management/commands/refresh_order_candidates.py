@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from foodcartapp.candidates import get_unassigned_orders, refresh_candidates
+
+
+class Command(BaseCommand):
+    help = 'Recomputes candidate restaurants of all unassigned orders'
+
+    def handle(self, *args, **options):
+        refreshed = refresh_candidates(get_unassigned_orders())
+        self.stdout.write(f'Refreshed candidates of {refreshed} orders')
@@ -0,0 +1,188 @@
+import threading
+from collections import defaultdict
+
+import numpy as np
+
+from location.distances import geodesic_matrix, haversine_matrix
+from location.spatial import GridIndex
+
+from .availability import get_availability_index
+from .restaurant_index import get_restaurant_index
+
+CHUNK_SIZE = 2000
+
+
+class MatchingEngine:
+    """Finds restaurants able to cook orders, for many orders at once.
+
+    Menus are kept as a restaurant x product matrix of missing
+    products. Multiplying the order x product requirement matrix by it
+    counts products each restaurant lacks for each order, orders are
+    feasible where the count is zero. Candidates are ranked by
+    distance. With a distance limit orders are grouped by cell of the
+    restaurant grid and matched only against restaurants in nearby
+    cells.
+    """
+    def __init__(self, grid: GridIndex, restaurant_products: dict):
+        self.grid = grid
+        self.restaurant_ids = np.asarray(grid.keys)
+        product_ids = sorted(set().union(*(
+            restaurant_products.get(restaurant_id, ())
+            for restaurant_id in grid.keys
+        )))
+        self.product_columns = {
+            product_id: column for column, product_id in enumerate(product_ids)
+        }
+        # The last column stands for products no restaurant has
+        self.missing = np.ones(
+            (len(grid.keys), len(product_ids) + 1), dtype=np.float32
+        )
+        for row, restaurant_id in enumerate(grid.keys):
+            columns = [
+                self.product_columns[product_id]
+                for product_id in restaurant_products.get(restaurant_id, ())
+            ]
+            self.missing[row, columns] = 0
+
+    def get_requirements(self, product_sets: list) -> np.ndarray:
+        """Returns order x product matrix of required products."""
+        unknown_column = len(self.product_columns)
+        requirements = np.zeros(
+            (len(product_sets), unknown_column + 1), dtype=np.float32
+        )
+        for row, product_ids in enumerate(product_sets):
+            for product_id in product_ids:
+                requirements[
+                    row, self.product_columns.get(product_id, unknown_column)
+                ] = 1
+        return requirements
+
+    def get_feasibility(self, product_sets: list,
+                        positions=slice(None)) -> np.ndarray:
+        """Returns order x restaurant matrix, True if it can cook the order.
+
+        Columns are restaurants at positions, all of them by default.
+        """
+        missing_counts = self.get_requirements(product_sets) \
+            @ self.missing[positions].T
+        return missing_counts == 0
+
+    def group_by_cell(self, orders: dict, order_ids: list,
+                      max_distance_km: float) -> list:
+        """Returns (order ids, positions of restaurants near them).
+
+        Orders are grouped by grid cell. Cells near most restaurants
+        share one group over all of them, as small groups cost more in
+        overhead than pruning saves.
+        """
+        cells = defaultdict(list)
+        for order_id in order_ids:
+            cells[self.grid.get_cell(*orders[order_id][0])].append(order_id)
+        all_positions = np.arange(len(self.grid))
+        groups = []
+        crowded_order_ids = []
+        for cell, cell_order_ids in cells.items():
+            positions = self.grid.get_positions_near(cell, max_distance_km)
+            if len(positions) > len(all_positions) / 2:
+                crowded_order_ids.extend(cell_order_ids)
+            else:
+                groups.append(
+                    (cell_order_ids, np.asarray(positions, dtype=int))
+                )
+        if crowded_order_ids:
+            groups.append((crowded_order_ids, all_positions))
+        return groups
+
+    def match(self, orders: dict, max_distance_km: float = None,
+              limit: int = None, exact_limit: int = 0) -> dict:
+        """Returns ranked candidates for orders.
+
+        orders maps order id to ((lat, lon), product ids). For every
+        order a list of (distance, restaurant id) is returned, nearest
+        first, limited to max_distance_km and to limit restaurants.
+        Distances of the first exact_limit candidates are refined with
+        the exact geodesic and the candidates are ranked again.
+        """
+        order_ids = list(orders)
+        candidates = {order_id: [] for order_id in order_ids}
+        if not len(self.grid):
+            return candidates
+
+        if max_distance_km is None:
+            groups = [(order_ids, np.arange(len(self.grid)))]
+        else:
+            groups = self.group_by_cell(orders, order_ids, max_distance_km)
+        for group_order_ids, positions in groups:
+            if not len(positions):
+                continue
+            for start in range(0, len(group_order_ids), CHUNK_SIZE):
+                chunk = group_order_ids[start:start + CHUNK_SIZE]
+                candidates.update(self.match_chunk(
+                    orders, chunk, positions, max_distance_km, limit,
+                    exact_limit,
+                ))
+        return candidates
+
+    def match_chunk(self, orders: dict, chunk: list, positions: np.ndarray,
+                    max_distance_km: float, limit: int,
+                    exact_limit: int) -> dict:
+        """Ranks restaurants at positions for a chunk of orders."""
+        order_points = [orders[order_id][0] for order_id in chunk]
+        restaurant_points = self.grid.coordinates[positions]
+        distances = haversine_matrix(order_points, restaurant_points)
+        feasibility = self.get_feasibility(
+            [orders[order_id][1] for order_id in chunk], positions
+        )
+        distances[~feasibility] = np.inf
+        if max_distance_km is not None:
+            distances[distances > max_distance_km] = np.inf
+
+        ranking = np.argsort(distances, axis=1)
+        if exact_limit:
+            top_ranking = ranking[:, :exact_limit]
+            refined = np.zeros(distances.shape, dtype=bool)
+            np.put_along_axis(
+                refined, top_ranking,
+                np.isfinite(np.take_along_axis(distances, top_ranking, 1)), 1,
+            )
+            distances = np.where(
+                refined,
+                geodesic_matrix(order_points, restaurant_points, refined),
+                distances,
+            )
+            if max_distance_km is not None:
+                distances[distances > max_distance_km] = np.inf
+            ranking = np.argsort(distances, axis=1)
+        if limit is not None:
+            ranking = ranking[:, :limit]
+        ranked_distances = np.take_along_axis(distances, ranking, axis=1)
+        candidate_counts = np.isfinite(ranked_distances).sum(axis=1)
+        restaurant_ids = self.restaurant_ids[positions][ranking]
+        return {
+            order_id: list(zip(
+                ranked_distances[row, :candidate_counts[row]].tolist(),
+                restaurant_ids[row, :candidate_counts[row]].tolist(),
+            ))
+            for row, order_id in enumerate(chunk)
+        }
+
+
+_engine = None
+_engine_key = None
+_engine_lock = threading.Lock()
+
+
+def get_matching_engine(restaurant_index=None,
+                        availability_index=None) -> MatchingEngine:
+    """Returns engine over current restaurant and availability indexes."""
+    global _engine, _engine_key
+    restaurant_index = restaurant_index or get_restaurant_index()
+    availability_index = availability_index or get_availability_index()
+    key = (restaurant_index, availability_index, availability_index.version)
+    with _engine_lock:
+        if _engine is None or _engine_key != key:
+            _engine = MatchingEngine(
+                restaurant_index.grid, availability_index.products
+            )
+            _engine_key = key
+        return _engine
@@ -0,0 +1,41 @@
+# Generated by Django 3.2.15 on 2026-10-18 05:23
+
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_order_totals(apps, schema_editor):
+    Order = apps.get_model('foodcartapp', 'Order')
+    OrderPosition = apps.get_model('foodcartapp', 'OrderPosition')
+    positions_total = OrderPosition.objects\
+        .filter(order=OuterRef('pk'))\
+        .values('order')\
+        .annotate(
+            total=Sum(
+                F('quantity') * F('price'),
+                output_field=DecimalField(max_digits=10, decimal_places=2)
+            )
+        )\
+        .values('total')
+    Order.objects.update(total=Coalesce(
+        Subquery(positions_total),
+        0,
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0054_order_journal_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='total',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0, editable=False, max_digits=10, verbose_name='Стоимость'),
+        ),
+        migrations.RunPython(fill_order_totals, migrations.RunPython.noop),
+    ]
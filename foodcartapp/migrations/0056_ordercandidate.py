@@ -0,0 +1,36 @@
+# Generated by Django 3.2.15 on 2026-10-18 05:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0055_order_total'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderCandidate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('distance', models.FloatField(verbose_name='расстояние, км')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='место')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='candidates', to='foodcartapp.order', verbose_name='заказ')),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_candidates', to='foodcartapp.restaurant', verbose_name='ресторан')),
+            ],
+            options={
+                'verbose_name': 'ресторан-кандидат',
+                'verbose_name_plural': 'рестораны-кандидаты',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='ordercandidate',
+            index=models.Index(fields=['order', 'rank'], name='foodcartapp_order_i_7f08f5_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='ordercandidate',
+            unique_together={('order', 'restaurant')},
+        ),
+    ]
@@ -1,36 +1,12 @@
 from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db.models import Sum, F, Subquery, Count, Case, When, IntegerField
+from django.db.models import Sum, F, Subquery, OuterRef, DecimalField
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from phonenumber_field.modelfields import PhoneNumberField
 
 
-class RestaurantQuerySet(models.QuerySet):
-    def get_available_for_order(self, order):
-        order_products = Product.objects.filter(
-            positions__order=order
-        ).only('id')
-
-        restaurant_ids = RestaurantMenuItem.objects.filter(
-            product__in=Subquery(order_products)
-        ).values(
-            'restaurant'
-        ).annotate(
-            unavailable=Count(
-                Case(
-                    When(availability=False, then=1),
-                    When(availability__isnull=True, then=1),
-                    output_field=IntegerField()
-                )
-            )
-        ).filter(unavailable=0).values_list('restaurant', flat=True)
-
-        return self.filter(
-            id__in=Subquery(restaurant_ids)
-        )
-
-
 class Restaurant(models.Model):
     name = models.CharField(
         'название',
@@ -47,8 +23,6 @@ class Restaurant(models.Model):
         blank=True,
     )
 
-    objects = RestaurantQuerySet.as_manager()
-
     class Meta:
         verbose_name = 'ресторан'
         verbose_name_plural = 'рестораны'
@@ -119,11 +93,60 @@ class Product(models.Model):
     class Meta:
         verbose_name = 'товар'
         verbose_name_plural = 'товары'
+        indexes = [
+            models.Index(fields=['category', 'id']),
+            models.Index(fields=['special_status', 'id']),
+        ]
 
     def __str__(self):
         return self.name
 
 
+class Banner(models.Model):
+    title = models.CharField(
+        'заголовок',
+        max_length=50
+    )
+    image = models.ImageField(
+        'картинка'
+    )
+    text = models.CharField(
+        'текст',
+        max_length=200,
+        blank=True,
+    )
+    order = models.PositiveIntegerField(
+        'порядок',
+        default=0,
+        db_index=True,
+    )
+    active_from = models.DateTimeField(
+        'показывать с',
+        null=True,
+        blank=True,
+    )
+    active_until = models.DateTimeField(
+        'показывать до',
+        null=True,
+        blank=True,
+    )
+
+    class Meta:
+        verbose_name = 'баннер'
+        verbose_name_plural = 'баннеры'
+        ordering = ['order', 'id']
+
+    def __str__(self):
+        return self.title
+
+    def is_active(self, moment) -> bool:
+        if self.active_from and self.active_from > moment:
+            return False
+        if self.active_until and self.active_until <= moment:
+            return False
+        return True
+
+
 class RestaurantMenuItem(models.Model):
     restaurant = models.ForeignKey(
         Restaurant,
@@ -149,16 +172,46 @@ class RestaurantMenuItem(models.Model):
         unique_together = [
             ['restaurant', 'product']
         ]
+        indexes = [
+            models.Index(fields=['availability', 'product']),
+        ]
 
     def __str__(self):
         return f"{self.restaurant.name} - {self.product.name}"
 
 
+def get_positions_total_subquery():
+    positions_total = OrderPosition.objects\
+        .filter(order=OuterRef('pk'))\
+        .values('order')\
+        .annotate(
+            total=Sum(
+                F('quantity') * F('price'),
+                output_field=DecimalField(max_digits=10, decimal_places=2)
+            )
+        )\
+        .values('total')
+    return Coalesce(
+        Subquery(positions_total),
+        0,
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
 class OrderQuerySet(models.QuerySet):
-    def fetch_with_total(self):
-        return self.annotate(
-            total=Sum(F('positions__quantity') * F('positions__price'))
-        )
+    def fetch_with_positions_total(self):
+        """Annotates total calculated from positions, for checks only.
+
+        Use stored `total` field everywhere else.
+        """
+        return self.annotate(positions_total=get_positions_total_subquery())
+
+    def with_total_drift(self):
+        return self.fetch_with_positions_total()\
+            .exclude(total=F('positions_total'))
+
+    def recalculate_totals(self) -> int:
+        return self.update(total=get_positions_total_subquery())
 
 
 class Order(models.Model):
@@ -208,6 +261,21 @@ class Order(models.Model):
         null=True,
         blank=True,
     )
+    total = models.DecimalField(
+        'Стоимость',
+        max_digits=10,
+        decimal_places=2,
+        default=0,
+        db_index=True,
+        editable=False,
+    )
+    journal_id = models.UUIDField(
+        'Запись журнала приёма',
+        null=True,
+        blank=True,
+        unique=True,
+        editable=False,
+    )
 
     objects = OrderQuerySet.as_manager()
 
@@ -243,3 +311,48 @@ class OrderPosition(models.Model):
         decimal_places=2,
         validators=[MinValueValidator(0)]
     )
+
+
+class OrderCandidate(models.Model):
+    order = models.ForeignKey(
+        Order,
+        on_delete=models.CASCADE,
+        related_name='candidates',
+        verbose_name='заказ',
+    )
+    restaurant = models.ForeignKey(
+        Restaurant,
+        on_delete=models.CASCADE,
+        related_name='order_candidates',
+        verbose_name='ресторан',
+    )
+    distance = models.FloatField('расстояние, км')
+    rank = models.PositiveSmallIntegerField('место')
+
+    class Meta:
+        verbose_name = 'ресторан-кандидат'
+        verbose_name_plural = 'рестораны-кандидаты'
+        unique_together = [
+            ['order', 'restaurant']
+        ]
+        indexes = [
+            models.Index(fields=['order', 'rank']),
+        ]
+
+    def __str__(self):
+        return f'{self.order_id} - {self.restaurant_id}'
+
+
+class IdempotencyKey(models.Model):
+    key = models.CharField('ключ', max_length=255, unique=True)
+    fingerprint = models.CharField('отпечаток запроса', max_length=64)
+    response_status = models.PositiveSmallIntegerField('код ответа')
+    response_data = models.JSONField('ответ')
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        verbose_name = 'ключ идемпотентности'
+        verbose_name_plural = 'ключи идемпотентности'
+
+    def __str__(self):
+        return self.key
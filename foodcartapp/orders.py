@@ -0,0 +1,78 @@
+import threading
+
+from django.db import connection, transaction
+
+from location.tasks import schedule_geocoding
+
+from .models import Order, OrderPosition
+
+
+def create_orders(validated_orders: list) -> list:
+    """Saves validated orders with their positions in one transaction.
+
+    Orders and positions are inserted by two bulk queries. Backends
+    that can not return ids from bulk insert (SQLite) save orders
+    one by one. After commit addresses are located in background, which
+    then computes candidate restaurants of the orders.
+    """
+    orders = [
+        Order(
+            **{
+                field: value for field, value in order_fields.items()
+                if field != 'products'
+            },
+            total=sum(
+                fields['quantity'] * fields['price']
+                for fields in order_fields['products']
+            ),
+        ) for order_fields in validated_orders
+    ]
+    with transaction.atomic():
+        if connection.features.can_return_rows_from_bulk_insert:
+            Order.objects.bulk_create(orders)
+        else:
+            for order in orders:
+                order.save()
+        OrderPosition.objects.bulk_create([
+            OrderPosition(
+                order=order,
+                product=fields['product'],
+                quantity=fields['quantity'],
+                price=fields['price']
+            )
+            for order, order_fields in zip(orders, validated_orders)
+            for fields in order_fields['products']
+        ])
+        addresses = [order.address for order in orders]
+        transaction.on_commit(lambda: schedule_geocoding(addresses))
+    return orders
+
+
+class TotalsRecalculation:
+    """Orders changed in one transaction, recalculated once on commit."""
+    def __init__(self):
+        self.order_ids = set()
+        self.finished = False
+
+    def run(self):
+        if self.finished:
+            return
+        self.finished = True
+        Order.objects.filter(id__in=self.order_ids).recalculate_totals()
+
+
+_pending = threading.local()
+
+
+def schedule_totals_recalculation(order_ids):
+    """Recalculates stored totals of the orders after commit.
+
+    All calls made within one transaction share a single UPDATE, so
+    changing or deleting many positions, including the cascade of an
+    order delete, costs one query.
+    """
+    recalculation = getattr(_pending, 'recalculation', None)
+    if recalculation is None or recalculation.finished:
+        recalculation = _pending.recalculation = TotalsRecalculation()
+    recalculation.order_ids.update(order_ids)
+    transaction.on_commit(recalculation.run)
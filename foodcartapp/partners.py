@@ -0,0 +1,49 @@
+import hmac
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from rest_framework.authentication import (
+    BaseAuthentication, get_authorization_header
+)
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import BasePermission
+from rest_framework.throttling import SimpleRateThrottle
+
+TOKEN_KEYWORD = 'Token'
+
+
+class PartnerTokenAuthentication(BaseAuthentication):
+    """Authenticates partner channels by tokens from PARTNER_API_TOKENS.
+
+    Partner sends header "Authorization: Token <token>". On success
+    request.auth is the partner name, request.user stays anonymous.
+    """
+    def authenticate(self, request):
+        header = get_authorization_header(request).split()
+        if not header or header[0].lower() != TOKEN_KEYWORD.lower().encode():
+            return None
+        if len(header) != 2:
+            raise AuthenticationFailed('Неверный заголовок Authorization.')
+        token = header[1].decode(errors='replace')
+        for partner, partner_token in settings.PARTNER_API_TOKENS.items():
+            if hmac.compare_digest(token.encode(), partner_token.encode()):
+                return AnonymousUser(), partner
+        raise AuthenticationFailed('Неверный токен.')
+
+    def authenticate_header(self, request):
+        return TOKEN_KEYWORD
+
+
+class IsPartner(BasePermission):
+    def has_permission(self, request, view):
+        return request.auth is not None
+
+
+class PartnerRateThrottle(SimpleRateThrottle):
+    """Limits requests of each partner, rate is set for 'partner' scope."""
+    scope = 'partner'
+
+    def get_cache_key(self, request, view):
+        if request.auth is None:
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': request.auth}
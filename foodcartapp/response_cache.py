@@ -0,0 +1,121 @@
+import gzip
+
+from django.core.cache import cache
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import (
+    get_conditional_response, patch_cache_control, patch_vary_headers
+)
+from django.utils.http import http_date, quote_etag
+
+from .versions import version_timestamp
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+IDENTITY = 'identity'
+RESPONSE_CACHE_TIMEOUT = 60 * 60
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+ENCODERS = {
+    'gzip': lambda body: gzip.compress(body, GZIP_LEVEL, mtime=0),
+}
+if brotli:
+    ENCODERS['br'] = lambda body: brotli.compress(
+        body, quality=BROTLI_QUALITY
+    )
+PREFERRED_ENCODINGS = [
+    encoding for encoding in ('br', 'gzip') if encoding in ENCODERS
+]
+
+
+def encode_bodies(body: bytes) -> dict:
+    """Returns body with all its precompressed variants by encoding."""
+    bodies = {IDENTITY: body}
+    for encoding, encode in ENCODERS.items():
+        bodies[encoding] = encode(body)
+    return bodies
+
+
+def get_cached_bodies(key: str, build_body) -> dict:
+    bodies = cache.get(key)
+    if bodies is None:
+        bodies = encode_bodies(build_body())
+        cache.set(key, bodies, RESPONSE_CACHE_TIMEOUT)
+    return bodies
+
+
+def parse_accept_encoding(header: str) -> dict:
+    qualities = {}
+    for item in header.split(','):
+        encoding, *params = [part.strip() for part in item.split(';')]
+        if not encoding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[encoding.lower()] = quality
+    return qualities
+
+
+def choose_encoding(request) -> str:
+    qualities = parse_accept_encoding(
+        request.META.get('HTTP_ACCEPT_ENCODING', '')
+    )
+    acceptable = [
+        encoding for encoding in PREFERRED_ENCODINGS
+        if qualities.get(encoding, qualities.get('*', 0)) > 0
+    ]
+    if not acceptable:
+        return IDENTITY
+    return max(
+        acceptable,
+        key=lambda encoding: qualities.get(encoding, qualities.get('*')),
+    )
+
+
+def conditional_json_response(request, bodies, etag: str, version: int,
+                              streaming: bool = False) -> HttpResponse:
+    """Answers 304 if client already has this body, otherwise sends it.
+
+    Validators are derived from the data version, so clients and
+    CDN can revalidate cheaply instead of downloading the body again.
+    Bodies are precompressed variants from encode_bodies(), the one
+    matching Accept-Encoding is sent. Bodies may be a callable, then
+    it is evaluated only when needed. For streaming responses callable
+    returns an iterator, which is sent without compression.
+    """
+    encoding = IDENTITY if streaming else choose_encoding(request)
+    if encoding != IDENTITY:
+        etag = f'{etag}-{encoding}'
+    etag = quote_etag(etag)
+    last_modified = int(version_timestamp(version))
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if response is None:
+        if callable(bodies):
+            bodies = bodies()
+        if streaming:
+            response = StreamingHttpResponse(
+                bodies, content_type='application/json'
+            )
+        else:
+            response = HttpResponse(
+                bodies[encoding], content_type='application/json'
+            )
+            if encoding != IDENTITY:
+                response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, public=True, no_cache=True)
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
@@ -0,0 +1,78 @@
+import threading
+import time
+
+from django.conf import settings
+
+from location.geofunctions import get_address_coordinates
+from location.spatial import GridIndex
+
+from .models import Restaurant
+from .versions import get_version
+
+RESTAURANTS_VERSION = 'restaurants'
+UNRESOLVED_REBUILD_INTERVAL = 60
+
+
+class RestaurantIndex:
+    """Spatial index over coordinates of all restaurants.
+
+    Restaurants with addresses not geocoded yet are left out, the
+    index is rebuilt periodically until all of them are resolved.
+    """
+    def __init__(self, version: int):
+        self.version = version
+        self.built_at = time.monotonic()
+        self.restaurants = {
+            restaurant.id: restaurant
+            for restaurant in Restaurant.objects.all()
+        }
+        address_coordinates = get_address_coordinates(
+            [restaurant.address for restaurant in self.restaurants.values()]
+        )
+        points = {}
+        for restaurant_id, restaurant in self.restaurants.items():
+            coordinates = address_coordinates.get(restaurant.address)
+            if coordinates and coordinates[0] is not None:
+                points[restaurant_id] = coordinates
+        self.has_unresolved = len(points) < len(self.restaurants)
+        self.grid = GridIndex(points, settings.RESTAURANT_INDEX_CELL_KM)
+
+    def is_fresh(self, version: int) -> bool:
+        if self.version != version:
+            return False
+        return not self.has_unresolved or \
+            time.monotonic() - self.built_at < UNRESOLVED_REBUILD_INTERVAL
+
+    def within_radius(self, point: tuple, radius_km: float) -> list:
+        """Returns (distance, restaurant) within radius, nearest first."""
+        return [
+            (distance, self.restaurants[restaurant_id])
+            for distance, restaurant_id
+            in self.grid.within_radius(point, radius_km)
+        ]
+
+    def nearest(self, point: tuple, k: int,
+                max_radius_km: float = None) -> list:
+        """Returns (distance, restaurant) of up to k nearest restaurants."""
+        return [
+            (distance, self.restaurants[restaurant_id])
+            for distance, restaurant_id
+            in self.grid.nearest(point, k, max_radius_km)
+        ]
+
+
+_index = None
+_build_lock = threading.Lock()
+
+
+def get_restaurant_index() -> RestaurantIndex:
+    """Returns per-process index, rebuilt when restaurants change."""
+    global _index
+    version = get_version(RESTAURANTS_VERSION)
+    index = _index
+    if index and index.is_fresh(version):
+        return index
+    with _build_lock:
+        if not _index or not _index.is_fresh(version):
+            _index = RestaurantIndex(version)
+        return _index
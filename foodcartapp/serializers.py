@@ -1,12 +1,74 @@
-from rest_framework.serializers import ModelSerializer
+from rest_framework.serializers import (
+    IntegerField, ListSerializer, ModelSerializer, ValidationError
+)
 
-from .models import Order, OrderPosition
+from .models import Order, OrderPosition, Product
+
+
+def load_order_products(product_ids) -> dict:
+    return Product.objects.available()\
+        .only('id', 'price')\
+        .in_bulk(product_ids)
+
+
+def collect_product_ids(orders_data: list) -> set:
+    """Collects product ids from raw orders data, skipping garbage."""
+    product_ids = set()
+    for order_data in orders_data:
+        if not isinstance(order_data, dict):
+            continue
+        positions = order_data.get('products')
+        if not isinstance(positions, list):
+            continue
+        for position in positions:
+            if not isinstance(position, dict):
+                continue
+            try:
+                product_ids.add(int(position.get('product')))
+            except (TypeError, ValueError):
+                continue
+    return product_ids
+
+
+class OrderPositionListSerializer(ListSerializer):
+    """Resolves products of all positions with a single query.
+
+    Products must exist and be available. Prices are taken from
+    the same query result. Products preloaded into the context
+    under 'products' key are used without querying.
+    """
+    def to_internal_value(self, data):
+        positions = super().to_internal_value(data)
+        products = self.context.get('products')
+        if products is None:
+            products = load_order_products(
+                {position['product'] for position in positions}
+            )
+
+        errors = []
+        for position in positions:
+            product = products.get(position['product'])
+            if not product:
+                errors.append({'product': [
+                    f'Недопустимый первичный ключ "{position["product"]}"'
+                    f' - объект не существует или недоступен.'
+                ]})
+                continue
+            position['product'] = product
+            position['price'] = product.price
+            errors.append({})
+        if any(errors):
+            raise ValidationError(errors)
+        return positions
 
 
 class OrderPositionSerializer(ModelSerializer):
+    product = IntegerField(min_value=1)
+
     class Meta:
         model = OrderPosition
         fields = ['product', 'quantity']
+        list_serializer_class = OrderPositionListSerializer
 
 
 class OrderSerializer(ModelSerializer):
@@ -18,4 +80,6 @@ class OrderSerializer(ModelSerializer):
 
     class Meta:
         model = Order
-        fields = ['firstname', 'lastname', 'phonenumber', 'address']
+        fields = [
+            'firstname', 'lastname', 'phonenumber', 'address', 'products'
+        ]
@@ -0,0 +1,108 @@
+from django.db import transaction
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save
+)
+from django.dispatch import receiver
+
+from location.signals import addresses_located
+from location.tasks import schedule_geocoding
+
+from .availability import update_availability
+from .banners import BANNERS_VERSION
+from .candidates import (
+    get_unassigned_orders, refresh_candidates, schedule_refresh
+)
+from .catalog import CATALOG_VERSION
+from .models import (
+    Banner, OrderPosition, Product, ProductCategory, Restaurant,
+    RestaurantMenuItem
+)
+from .orders import schedule_totals_recalculation
+from .restaurant_index import RESTAURANTS_VERSION
+from .versions import bump_version
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductCategory)
+@receiver(post_delete, sender=ProductCategory)
+@receiver(post_save, sender=RestaurantMenuItem)
+@receiver(post_delete, sender=RestaurantMenuItem)
+def invalidate_catalog(sender, **kwargs):
+    transaction.on_commit(lambda: bump_version(CATALOG_VERSION))
+
+
+@receiver(post_save, sender=RestaurantMenuItem)
+def update_menu_item_availability(sender, instance, **kwargs):
+    transaction.on_commit(lambda: update_availability(
+        instance.restaurant_id, instance.product_id, instance.availability
+    ))
+
+
+@receiver(post_delete, sender=RestaurantMenuItem)
+def remove_menu_item_availability(sender, instance, **kwargs):
+    transaction.on_commit(lambda: update_availability(
+        instance.restaurant_id, instance.product_id, False
+    ))
+
+
+@receiver(post_save, sender=Banner)
+@receiver(post_delete, sender=Banner)
+def invalidate_banners(sender, **kwargs):
+    transaction.on_commit(lambda: bump_version(BANNERS_VERSION))
+
+
+@receiver(post_save, sender=OrderPosition)
+@receiver(post_delete, sender=OrderPosition)
+def recalculate_order_total(sender, instance, **kwargs):
+    schedule_totals_recalculation([instance.order_id])
+
+
+@receiver(pre_save, sender=Restaurant)
+def remember_restaurant_address(sender, instance, **kwargs):
+    instance.previous_address = Restaurant.objects\
+        .filter(pk=instance.pk)\
+        .values_list('address', flat=True)\
+        .first()
+
+
+@receiver(post_save, sender=Restaurant)
+def geocode_restaurant(sender, instance, **kwargs):
+    """Locating new address also refreshes candidates of all orders."""
+    if instance.address == instance.previous_address:
+        return
+    transaction.on_commit(lambda: schedule_geocoding([instance.address]))
+
+
+@receiver(post_save, sender=Restaurant)
+@receiver(post_delete, sender=Restaurant)
+def invalidate_restaurant_index(sender, **kwargs):
+    transaction.on_commit(lambda: bump_version(RESTAURANTS_VERSION))
+
+
+@receiver(post_save, sender=RestaurantMenuItem)
+@receiver(post_delete, sender=RestaurantMenuItem)
+def refresh_menu_item_candidates(sender, instance, **kwargs):
+    schedule_refresh(product_ids=[instance.product_id])
+
+
+@receiver(pre_delete, sender=Restaurant)
+def refresh_restaurant_candidates(sender, instance, **kwargs):
+    order_ids = list(
+        instance.order_candidates.values_list('order_id', flat=True)
+    )
+    transaction.on_commit(lambda: refresh_candidates(
+        get_unassigned_orders().filter(id__in=order_ids)
+    ))
+
+
+@receiver(addresses_located)
+def refresh_located_candidates(sender, address_coordinates, **kwargs):
+    addresses = list(address_coordinates)
+    if Restaurant.objects.filter(address__in=addresses).exists():
+        bump_version(RESTAURANTS_VERSION)
+        refresh_candidates(get_unassigned_orders())
+        return
+    refresh_candidates(
+        get_unassigned_orders().filter(address__in=addresses)
+    )
@@ -0,0 +1,1331 @@
+import gzip
+import itertools
+import json
+import math
+import os
+import random
+import tempfile
+from datetime import timedelta
+from importlib import import_module
+from io import StringIO
+from unittest import mock, skipUnless
+
+import numpy as np
+from django.apps import apps
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection
+from django.test import (
+    RequestFactory, SimpleTestCase, TestCase, override_settings
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import parse_http_date
+from rest_framework.test import APIClient
+
+from location.distances import (
+    EARTH_RADIUS_KM, geodesic_matrix, haversine_matrix
+)
+from location.signals import addresses_located
+from location.spatial import GridIndex
+
+from . import banners, catalog, idempotency, response_cache
+from .availability import AVAILABILITY_VERSION, get_availability_index
+from .candidates import refresh_candidates, schedule_refresh
+from .catalog import (
+    BUILD_LOCK_KEY, CATALOG_VERSION, get_catalog_snapshot
+)
+from .dispatch import plan_dispatch, solve_assignment
+from .idempotency import REPLAYED_HEADER
+from .journal import drain, get_journal
+from .matching import MatchingEngine
+from .models import (
+    Banner, IdempotencyKey, Order, OrderCandidate, OrderPosition, Product,
+    ProductCategory, Restaurant, RestaurantMenuItem
+)
+from .orders import create_orders
+from .partners import PartnerRateThrottle
+from .response_cache import choose_encoding
+from .restaurant_index import RestaurantIndex
+from .serializers import OrderSerializer
+from .versions import bump_version, get_version
+
+
+@override_settings(GEOCODE_WORKER_IN_PROCESS=False)
+class AvailabilityIndexSignalsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.restaurant = Restaurant.objects.create(
+            name='Центр', address='Москва, Тверская 1'
+        )
+        self.burger = Product.objects.create(
+            name='Бургер', price=100, image='burger.jpg'
+        )
+        self.fries = Product.objects.create(
+            name='Картошка', price=50, image='fries.jpg'
+        )
+        self.menu_item = RestaurantMenuItem.objects.create(
+            restaurant=self.restaurant, product=self.burger
+        )
+
+    def test_saved_menu_item_patches_index_in_place(self):
+        index = get_availability_index()
+        self.assertFalse(
+            index.can_perform(self.restaurant.id, [self.fries.id])
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            RestaurantMenuItem.objects.create(
+                restaurant=self.restaurant, product=self.fries
+            )
+
+        self.assertIs(get_availability_index(), index)
+        self.assertTrue(index.can_perform(
+            self.restaurant.id, [self.burger.id, self.fries.id]
+        ))
+
+    def test_unavailable_menu_item_leaves_index(self):
+        index = get_availability_index()
+        self.assertTrue(
+            index.can_perform(self.restaurant.id, [self.burger.id])
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.menu_item.availability = False
+            self.menu_item.save()
+
+        self.assertIs(get_availability_index(), index)
+        self.assertEqual(index.get_products(self.restaurant.id), frozenset())
+
+    def test_deleted_menu_item_leaves_index(self):
+        index = get_availability_index()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.menu_item.delete()
+
+        self.assertIs(get_availability_index(), index)
+        self.assertEqual(index.get_restaurant_ids([self.burger.id]), [])
+
+    def test_index_waits_for_commit(self):
+        index = get_availability_index()
+
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            RestaurantMenuItem.objects.create(
+                restaurant=self.restaurant, product=self.fries
+            )
+            self.assertFalse(
+                index.can_perform(self.restaurant.id, [self.fries.id])
+            )
+
+        self.assertTrue(callbacks)
+
+    def test_change_by_other_worker_rebuilds_index(self):
+        index = get_availability_index()
+        RestaurantMenuItem.objects.filter(pk=self.menu_item.pk).update(
+            availability=False
+        )
+        bump_version(AVAILABILITY_VERSION)
+
+        rebuilt_index = get_availability_index()
+        self.assertIsNot(rebuilt_index, index)
+        self.assertEqual(
+            rebuilt_index.get_products(self.restaurant.id), frozenset()
+        )
+
+
+class DispatchTest(SimpleTestCase):
+    def test_assignment_is_optimal(self):
+        generator = np.random.default_rng(0)
+        for rows, columns in [(1, 1), (3, 3), (3, 5), (5, 5), (4, 7)]:
+            cost = generator.integers(0, 100, (rows, columns)).astype(float)
+            best_cost = min(
+                cost[range(rows), list(assignment)].sum()
+                for assignment in itertools.permutations(range(columns), rows)
+            )
+            with self.subTest(rows=rows, columns=columns):
+                assignment = solve_assignment(cost)
+                self.assertEqual(len(set(assignment)), rows)
+                self.assertEqual(
+                    cost[range(rows), assignment].sum(), best_cost
+                )
+
+    def test_plan_minimizes_total_distance(self):
+        candidates = {
+            1: [(1, 'near'), (2, 'far')],
+            2: [(1.5, 'near'), (10, 'far')],
+        }
+        plan = plan_dispatch(candidates, {'near': 1, 'far': 1})
+        # Greedy by order would give order 1 the near restaurant, 11 km
+        self.assertEqual(plan, {1: 'far', 2: 'near'})
+
+    def test_plan_respects_capacities(self):
+        generator = random.Random(0)
+        restaurants = ['first', 'second', 'third']
+        candidates = {
+            order_id: sorted(
+                (generator.uniform(0, 10), restaurant)
+                for restaurant in generator.sample(restaurants, 2)
+            )
+            for order_id in range(20)
+        }
+        capacities = {'first': 3, 'second': 2, 'third': 0}
+        plan = plan_dispatch(candidates, capacities)
+        for restaurant, capacity in capacities.items():
+            self.assertLessEqual(
+                list(plan.values()).count(restaurant), capacity
+            )
+        self.assertEqual(len(plan), 5)
+        for order_id, restaurant in plan.items():
+            self.assertIn(
+                restaurant, [name for _, name in candidates[order_id]]
+            )
+
+    def test_orders_without_candidates_stay_unassigned(self):
+        plan = plan_dispatch({1: [], 2: [(3, 'near')]}, {'near': 5})
+        self.assertEqual(plan, {2: 'near'})
+
+
+@override_settings(GEOCODE_WORKER_IN_PROCESS=False, ORDER_INTAKE_MODE='sync')
+class IdempotencyKeyTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        restaurant = Restaurant.objects.create(
+            name='Центр', address='Москва, Тверская 1'
+        )
+        self.burger = Product.objects.create(
+            name='Бургер', price=100, image='burger.jpg'
+        )
+        RestaurantMenuItem.objects.create(
+            restaurant=restaurant, product=self.burger
+        )
+        self.order_data = {
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': '+79291000000',
+            'address': 'Москва, Арбат 2',
+            'products': [{'product': self.burger.id, 'quantity': 2}],
+        }
+
+    def post_order(self, order_data, key='order-1'):
+        return self.client.post(
+            '/api/order/', order_data, format='json',
+            HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_retry_replays_response(self):
+        response = self.post_order(self.order_data)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(REPLAYED_HEADER, response)
+
+        retried_response = self.post_order(self.order_data)
+        self.assertEqual(retried_response.status_code, 200)
+        self.assertEqual(retried_response[REPLAYED_HEADER], 'true')
+        self.assertEqual(retried_response.json(), response.json())
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_retry_is_replayed_from_database_after_cache_loss(self):
+        response = self.post_order(self.order_data)
+        cache.clear()
+
+        retried_response = self.post_order(self.order_data)
+        self.assertEqual(retried_response[REPLAYED_HEADER], 'true')
+        self.assertEqual(retried_response.json(), response.json())
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_key_reused_with_other_data_is_rejected(self):
+        self.post_order(self.order_data)
+
+        other_order_data = {**self.order_data, 'address': 'Москва, Арбат 3'}
+        response = self.post_order(other_order_data)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_failed_request_does_not_take_key(self):
+        invalid_order_data = {**self.order_data, 'products': []}
+        self.assertEqual(self.post_order(invalid_order_data).status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        self.assertEqual(self.post_order(self.order_data).status_code, 200)
+        self.assertEqual(Order.objects.count(), 1)
+
+
+@override_settings(GEOCODE_WORKER_IN_PROCESS=False)
+class OrderJournalTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        journal_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(journal_dir.cleanup)
+        journal_settings = self.settings(
+            ORDER_INTAKE_MODE='journal',
+            ORDER_JOURNAL_PATH=os.path.join(
+                journal_dir.name, 'order_journal.sqlite3'
+            ),
+        )
+        journal_settings.enable()
+        self.addCleanup(journal_settings.disable)
+        self.addCleanup(lambda: get_journal().connection.close())
+
+        restaurant = Restaurant.objects.create(
+            name='Центр', address='Москва, Тверская 1'
+        )
+        self.burger = Product.objects.create(
+            name='Бургер', price=100, image='burger.jpg'
+        )
+        RestaurantMenuItem.objects.create(
+            restaurant=restaurant, product=self.burger
+        )
+        self.client = APIClient()
+
+    def post_order(self, address='Москва, Арбат 2', **headers):
+        return self.client.post('/api/order/', {
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': '+79291000000',
+            'address': address,
+            'products': [{'product': self.burger.id, 'quantity': 2}],
+        }, format='json', **headers)
+
+    def test_accepted_order_is_saved_by_drain(self):
+        self.assertEqual(self.post_order().status_code, 202)
+        self.assertFalse(Order.objects.exists())
+
+        self.assertEqual(drain(), 1)
+        order = Order.objects.get()
+        self.assertEqual(order.address, 'Москва, Арбат 2')
+        self.assertEqual(order.positions.get().quantity, 2)
+        self.assertEqual(get_journal().count_pending(), 0)
+        self.assertEqual(drain(), 0)
+
+    def test_concurrent_retries_are_journaled_once(self):
+        find_stored_response = idempotency.find_stored_response
+        lookups = []
+
+        def find_too_early(key):
+            lookups.append(key)
+            # The retry checks the key before the first request stores it
+            if len(lookups) <= 2:
+                return None
+            return find_stored_response(key)
+
+        with mock.patch.object(
+            idempotency, 'find_stored_response', side_effect=find_too_early
+        ):
+            response = self.post_order(HTTP_IDEMPOTENCY_KEY='order-1')
+            retried_response = self.post_order(HTTP_IDEMPOTENCY_KEY='order-1')
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(retried_response[REPLAYED_HEADER], 'true')
+        self.assertEqual(get_journal().count_pending(), 1)
+        drain()
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_replay_after_crash_saves_order_once(self):
+        self.post_order()
+        self.post_order('Москва, Арбат 3')
+        drain()
+        # Crash after saving orders, before marking entries drained
+        get_journal().connection.execute(
+            'UPDATE entries SET drained_at = NULL'
+        )
+
+        self.assertEqual(drain(), 2)
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(get_journal().count_pending(), 0)
+
+    def test_failing_entry_does_not_block_batch(self):
+        for address in ['Москва, Арбат 2', 'broken', 'Москва, Арбат 4']:
+            self.post_order(address)
+
+        def create_orders_failing(validated_orders):
+            if any(order['address'] == 'broken' for order in validated_orders):
+                raise IntegrityError('NOT NULL constraint failed')
+            return create_orders(validated_orders)
+
+        with mock.patch(
+            'foodcartapp.journal.create_orders',
+            side_effect=create_orders_failing,
+        ), self.assertLogs('foodcartapp.journal', 'WARNING'):
+            self.assertEqual(drain(), 3)
+
+        self.assertEqual(
+            sorted(Order.objects.values_list('address', flat=True)),
+            ['Москва, Арбат 2', 'Москва, Арбат 4'],
+        )
+        self.assertEqual(get_journal().count_pending(), 0)
+        error, = get_journal().connection.execute(
+            'SELECT error FROM entries WHERE error IS NOT NULL'
+        ).fetchone()
+        self.assertIn('NOT NULL constraint failed', error)
+
+    def test_entry_with_missing_product_is_set_aside(self):
+        self.post_order()
+        self.burger.delete()
+
+        self.assertEqual(drain(), 1)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(get_journal().count_pending(), 0)
+        error, = get_journal().connection.execute(
+            'SELECT error FROM entries'
+        ).fetchone()
+        self.assertEqual(error, 'product not found')
+
+
+@override_settings(GEOCODE_WORKER_IN_PROCESS=False)
+class RestaurantIndexTest(TestCase):
+    def setUp(self):
+        self.address_coordinates = {
+            'Москва, Тверская 1': (55.7576, 37.6136),
+            'Москва, Арбат 10': (55.7515, 37.5955),
+            'Москва, Профсоюзная 100': (55.6413, 37.5231),
+            'Москва, Новая 1': (None, None),
+        }
+        self.restaurants = {
+            address: Restaurant.objects.create(name=address, address=address)
+            for address in self.address_coordinates
+        }
+        patcher = mock.patch(
+            'foodcartapp.restaurant_index.get_address_coordinates',
+            return_value=self.address_coordinates,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.index = RestaurantIndex(version=1)
+
+    def test_within_radius(self):
+        found = self.index.within_radius((55.7558, 37.6173), 3)
+        self.assertEqual(
+            [restaurant for _, restaurant in found],
+            [
+                self.restaurants['Москва, Тверская 1'],
+                self.restaurants['Москва, Арбат 10'],
+            ],
+        )
+
+    def test_nearest(self):
+        found = self.index.nearest((55.64, 37.52), 2)
+        self.assertEqual(
+            [restaurant for _, restaurant in found],
+            [
+                self.restaurants['Москва, Профсоюзная 100'],
+                self.restaurants['Москва, Арбат 10'],
+            ],
+        )
+        self.assertLess(found[0][0], found[1][0])
+
+    def test_unresolved_restaurants_are_left_out(self):
+        self.assertTrue(self.index.has_unresolved)
+        self.assertEqual(len(self.index.nearest((55.75, 37.6), 10)), 3)
+
+
+@override_settings(
+    GEOCODE_WORKER_IN_PROCESS=False,
+    PARTNER_API_TOKENS={'partner': 'secret', 'other': 'other-secret'},
+)
+class OrdersBatchTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        restaurant = Restaurant.objects.create(
+            name='Центр', address='Москва, Тверская 1'
+        )
+        self.burger = Product.objects.create(
+            name='Бургер', price=100, image='burger.jpg'
+        )
+        RestaurantMenuItem.objects.create(
+            restaurant=restaurant, product=self.burger
+        )
+        self.client = APIClient()
+
+    def make_order(self, address='Москва, Арбат 2', product_id=None):
+        return {
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': '+79291000000',
+            'address': address,
+            'products': [
+                {'product': product_id or self.burger.id, 'quantity': 2}
+            ],
+        }
+
+    def post_batch(self, orders_data, token='secret'):
+        headers = {'HTTP_AUTHORIZATION': f'Token {token}'} if token else {}
+        return self.client.post(
+            '/api/orders/batch/', orders_data, format='json', **headers
+        )
+
+    def test_partner_token_is_required(self):
+        for token in [None, 'wrong']:
+            with self.subTest(token=token):
+                response = self.post_batch([self.make_order()], token)
+                self.assertEqual(response.status_code, 401)
+        self.assertFalse(Order.objects.exists())
+
+    def test_mixed_batch_reports_result_of_every_order(self):
+        response = self.post_batch([
+            self.make_order('Москва, Арбат 2'),
+            self.make_order(product_id=self.burger.id + 100),
+            self.make_order('Москва, Арбат 4'),
+            'not an order',
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        orders = list(Order.objects.order_by('id'))
+        self.assertEqual(
+            [order.address for order in orders],
+            ['Москва, Арбат 2', 'Москва, Арбат 4'],
+        )
+        self.assertEqual(results[0], {'id': orders[0].id})
+        self.assertIn('products', results[1]['errors'])
+        self.assertEqual(results[2], {'id': orders[1].id})
+        self.assertIn('errors', results[3])
+        self.assertEqual(orders[0].total, 200)
+
+    def test_batch_without_valid_orders_is_rejected(self):
+        response = self.post_batch([self.make_order(product_id=10 ** 6)])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_queries_do_not_grow_with_positions_and_products(self):
+        with CaptureQueriesContext(connection) as single_order_queries:
+            self.post_batch([self.make_order()])
+        orders_data = [self.make_order(f'Москва, Арбат {number}')
+                       for number in range(20)]
+        with CaptureQueriesContext(connection) as batch_queries:
+            self.post_batch(orders_data)
+
+        # Backends without ids from bulk insert save orders one by one
+        per_order_queries = \
+            0 if connection.features.can_return_rows_from_bulk_insert else 1
+        self.assertEqual(
+            len(batch_queries),
+            len(single_order_queries) + 19 * per_order_queries,
+        )
+
+    @mock.patch.object(
+        PartnerRateThrottle, 'THROTTLE_RATES', {'partner': '2/min'}
+    )
+    def test_each_partner_is_throttled(self):
+        for _ in range(2):
+            response = self.post_batch([self.make_order()])
+            self.assertEqual(response.status_code, 200)
+        response = self.post_batch([self.make_order()])
+        self.assertEqual(response.status_code, 429)
+        response = self.post_batch([self.make_order()], 'other-secret')
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(GEOCODE_WORKER_IN_PROCESS=False)
+class OrderTotalTest(TestCase):
+    def setUp(self):
+        self.burger = Product.objects.create(
+            name='Бургер', price=100, image='burger.jpg'
+        )
+        self.order = Order.objects.create(
+            firstname='Иван',
+            lastname='Петров',
+            phonenumber='+79291000000',
+            address='Москва, Арбат 2',
+        )
+
+    def add_position(self, quantity, price=100):
+        with self.captureOnCommitCallbacks(execute=True):
+            return OrderPosition.objects.create(
+                order=self.order,
+                product=self.burger,
+                quantity=quantity,
+                price=price,
+            )
+
+    def assertTotal(self, total):
+        self.order.refresh_from_db(fields=['total'])
+        self.assertEqual(self.order.total, total)
+
+    def test_total_follows_positions(self):
+        position = self.add_position(2)
+        self.assertTotal(200)
+        self.add_position(1, price=50)
+        self.assertTotal(250)
+
+        position.quantity = 3
+        with self.captureOnCommitCallbacks(execute=True):
+            position.save()
+        self.assertTotal(350)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            position.delete()
+        self.assertTotal(50)
+
+    def test_order_delete_recalculates_once(self):
+        for quantity in range(1, 6):
+            self.add_position(quantity)
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.order.delete()
+        updates = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('UPDATE "foodcartapp_order"')
+        ]
+        self.assertEqual(len(updates), 1)
+
+    def make_drifted_orders(self):
+        self.add_position(2)
+        consistent_order = Order.objects.create(
+            firstname='Пётр',
+            lastname='Иванов',
+            phonenumber='+79291000001',
+            address='Москва, Арбат 3',
+        )
+        Order.objects.filter(pk=self.order.pk).update(total=0)
+        return consistent_order
+
+    def test_check_reports_drifted_orders(self):
+        self.make_drifted_orders()
+        stdout = StringIO()
+        with self.assertRaisesMessage(CommandError, '1 orders drifted'):
+            call_command('check_order_totals', stdout=stdout)
+        self.assertIn(
+            f'Order {self.order.pk}: stored 0.00, positions 200',
+            stdout.getvalue(),
+        )
+        self.assertEqual(len(stdout.getvalue().splitlines()), 1)
+
+    def test_backfill_fixes_drifted_orders_only(self):
+        self.make_drifted_orders()
+        stdout = StringIO()
+        call_command('backfill_order_totals', drifted_only=True, stdout=stdout)
+        self.assertEqual(stdout.getvalue(), 'Updated 1 orders\n')
+        self.assertTotal(200)
+        call_command('check_order_totals', stdout=StringIO())
+
+    def test_migration_fills_totals(self):
+        consistent_order = self.make_drifted_orders()
+        Order.objects.update(total=999)
+        migration = import_module('foodcartapp.migrations.0055_order_total')
+        migration.fill_order_totals(apps, None)
+        self.assertTotal(200)
+        consistent_order.refresh_from_db(fields=['total'])
+        self.assertEqual(consistent_order.total, 0)
+
+
+@override_settings(GEOCODE_WORKER_IN_PROCESS=False)
+class CatalogPageTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        restaurant = Restaurant.objects.create(
+            name='Центр', address='Москва, Тверская 1'
+        )
+        self.category = ProductCategory.objects.create(name='Бургеры')
+        self.products = []
+        for number in range(7):
+            product = Product.objects.create(
+                name=f'Бургер {number}',
+                price=100 + number,
+                image='burger.jpg',
+                category=self.category if number % 2 else None,
+                special_status=number % 3 == 0,
+            )
+            RestaurantMenuItem.objects.create(
+                restaurant=restaurant, product=product
+            )
+            self.products.append(product)
+        hidden = Product.objects.create(
+            name='Снятый', price=1, image='burger.jpg'
+        )
+        RestaurantMenuItem.objects.create(
+            restaurant=restaurant, product=hidden, availability=False
+        )
+
+    def collect_pages(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            ids.extend(product['id'] for product in page['results'])
+            url = page['next']
+        return ids
+
+    def test_pages_cover_catalog_once(self):
+        ids = self.collect_pages('/api/products/?limit=3')
+        self.assertEqual(ids, [product.id for product in self.products])
+
+    def test_pages_keep_filters(self):
+        ids = self.collect_pages(
+            f'/api/products/?limit=1&category={self.category.id}'
+            '&special=false&utm_source=mail'
+        )
+        expected_ids = [
+            product.id for product in self.products
+            if product.category_id and not product.special_status
+        ]
+        self.assertEqual(ids, expected_ids)
+
+    def test_last_page_has_no_next(self):
+        response = self.client.get('/api/products/?limit=7')
+        self.assertIsNone(response.json()['next'])
+        self.assertEqual(len(response.json()['results']), 7)
+
+    def test_page_costs_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                '/api/products/?limit=5&fields=id,name,category'
+            )
+        self.assertEqual(len(response.json()['results']), 5)
+        with self.assertNumQueries(0):
+            self.client.get('/api/products/?limit=5&fields=id,name,category')
+
+    def test_invalid_params_are_rejected(self):
+        for query, error in [
+            ('category=burgers', 'Invalid category: burgers'),
+            ('special=maybe', 'Invalid special: maybe'),
+            ('limit=ten', 'Invalid limit: ten'),
+            ('limit=0', 'Invalid limit: 0'),
+            ('limit=2&cursor=%25%25', 'Invalid cursor: %%'),
+        ]:
+            with self.subTest(query=query):
+                response = self.client.get(f'/api/products/?{query}')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'error': error})
+
+
+@override_settings(GEOCODE_WORKER_IN_PROCESS=False)
+class CatalogSnapshotTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(catalog, '_local_snapshot', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.restaurant = Restaurant.objects.create(
+            name='Центр', address='Москва, Тверская 1'
+        )
+        self.add_product('Бургер')
+
+    def add_product(self, name):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(
+                name=name, price=100, image='burger.jpg'
+            )
+            RestaurantMenuItem.objects.create(
+                restaurant=self.restaurant, product=product
+            )
+        return product
+
+    def get_names(self):
+        response = self.client.get('/api/products/')
+        self.assertEqual(response.status_code, 200)
+        return [product['name'] for product in response.json()]
+
+    def test_snapshot_is_served_from_memory(self):
+        self.assertEqual(self.get_names(), ['Бургер'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_names(), ['Бургер'])
+
+    def test_catalog_change_rebuilds_snapshot(self):
+        snapshot = get_catalog_snapshot()
+        self.add_product('Картошка')
+
+        rebuilt_snapshot = get_catalog_snapshot()
+        self.assertGreater(rebuilt_snapshot.version, snapshot.version)
+        self.assertEqual(self.get_names(), ['Бургер', 'Картошка'])
+
+    def test_other_worker_uses_shared_snapshot(self):
+        snapshot = get_catalog_snapshot()
+        catalog._local_snapshot = None
+        with self.assertNumQueries(0):
+            self.assertEqual(get_catalog_snapshot(), snapshot)
+
+    def test_previous_snapshot_served_while_other_worker_builds(self):
+        snapshot = get_catalog_snapshot()
+        catalog._local_snapshot = None
+        bump_version(CATALOG_VERSION)
+        cache.set(BUILD_LOCK_KEY, 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_catalog_snapshot(), snapshot)
+
+        cache.delete(BUILD_LOCK_KEY)
+        self.assertEqual(
+            get_catalog_snapshot().version, get_version(CATALOG_VERSION)
+        )
+
+
+@override_settings(GEOCODE_WORKER_IN_PROCESS=False)
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        for module in [banners, catalog]:
+            patcher = mock.patch.object(module, '_local_snapshot', None)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.restaurant = Restaurant.objects.create(
+            name='Центр', address='Москва, Тверская 1'
+        )
+        self.add_product('Бургер')
+
+    def add_product(self, name):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(
+                name=name, price=100, image='burger.jpg'
+            )
+            RestaurantMenuItem.objects.create(
+                restaurant=self.restaurant, product=product
+            )
+
+    def test_catalog_revalidation(self):
+        for url in ['/api/products/', '/api/products/?limit=1']:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                etag = response['ETag']
+                last_modified = response['Last-Modified']
+                self.assertIn('no-cache', response['Cache-Control'])
+
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+                self.assertEqual(response['ETag'], etag)
+
+                response = self.client.get(
+                    url, HTTP_IF_MODIFIED_SINCE=last_modified
+                )
+                self.assertEqual(response.status_code, 304)
+
+    def test_queries_have_own_etags(self):
+        etags = {
+            self.client.get(url)['ETag']
+            for url in [
+                '/api/products/',
+                '/api/products/?limit=1',
+                '/api/products/?limit=2',
+                '/api/products/?special=true',
+            ]
+        }
+        self.assertEqual(len(etags), 4)
+        self.assertEqual(
+            self.client.get('/api/products/?special=true&utm=1')['ETag'],
+            self.client.get('/api/products/?special=true')['ETag'],
+        )
+
+    def test_catalog_change_invalidates_etag(self):
+        etag = self.client.get('/api/products/')['ETag']
+        self.add_product('Картошка')
+
+        response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.json()), 2)
+
+    def test_banner_window_changes_validators(self):
+        now = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            Banner.objects.create(
+                title='Скидки',
+                image='sale.jpg',
+                active_from=now + timedelta(hours=1),
+            )
+        response = self.client.get('/api/banners/')
+        self.assertEqual(response.json(), [])
+        etag = response['ETag']
+        last_modified = response['Last-Modified']
+        self.assertEqual(
+            self.client.get(
+                '/api/banners/', HTTP_IF_NONE_MATCH=etag
+            ).status_code,
+            304,
+        )
+
+        with mock.patch(
+            'django.utils.timezone.now',
+            return_value=now + timedelta(hours=2),
+        ):
+            response = self.client.get(
+                '/api/banners/', HTTP_IF_NONE_MATCH=etag
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [banner['title'] for banner in response.json()], ['Скидки']
+        )
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertGreater(
+            parse_http_date(response['Last-Modified']),
+            parse_http_date(last_modified),
+        )
+
+
+@override_settings(GEOCODE_WORKER_IN_PROCESS=False)
+class OrderSerializerTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        restaurant = Restaurant.objects.create(
+            name='Центр', address='Москва, Тверская 1'
+        )
+        self.products = []
+        for number in range(10):
+            product = Product.objects.create(
+                name=f'Бургер {number}', price=100 + number,
+                image='burger.jpg',
+            )
+            RestaurantMenuItem.objects.create(
+                restaurant=restaurant, product=product
+            )
+            self.products.append(product)
+        self.hidden = Product.objects.create(
+            name='Снятый', price=1, image='burger.jpg'
+        )
+        RestaurantMenuItem.objects.create(
+            restaurant=restaurant, product=self.hidden, availability=False
+        )
+
+    def make_order(self, products):
+        return {
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': '+79291000000',
+            'address': 'Москва, Арбат 2',
+            'products': [
+                {'product': product_id, 'quantity': 2}
+                for product_id in products
+            ],
+        }
+
+    def test_products_resolved_with_one_query(self):
+        serializer = OrderSerializer(data=self.make_order(
+            [product.id for product in self.products]
+        ))
+        with self.assertNumQueries(1):
+            self.assertTrue(serializer.is_valid())
+        positions = serializer.validated_data['products']
+        self.assertEqual(
+            [
+                (position['product'], position['price'])
+                for position in positions
+            ],
+            [(product, product.price) for product in self.products],
+        )
+
+    def test_preloaded_products_need_no_queries(self):
+        product_ids = [product.id for product in self.products]
+        serializer = OrderSerializer(
+            data=self.make_order(product_ids),
+            context={'products': Product.objects.in_bulk(product_ids)},
+        )
+        with self.assertNumQueries(0):
+            self.assertTrue(serializer.is_valid())
+
+    def test_missing_and_unavailable_products_are_reported(self):
+        serializer = OrderSerializer(data=self.make_order([
+            self.products[0].id, self.hidden.id, self.hidden.id + 100,
+        ]))
+        self.assertFalse(serializer.is_valid())
+        errors = serializer.errors['products']
+        self.assertEqual(errors[0], {})
+        self.assertIn('product', errors[1])
+        self.assertIn('product', errors[2])
+
+    def test_order_intake_queries_do_not_grow_with_positions(self):
+        for products in [self.products[:1], self.products]:
+            order_data = self.make_order([product.id for product in products])
+            # Products lookup, order and positions inserts, savepoint pair
+            with self.assertNumQueries(5):
+                response = self.client.post(
+                    '/api/order/', order_data, content_type='application/json'
+                )
+            self.assertEqual(response.status_code, 200)
+
+
+class ChooseEncodingTest(SimpleTestCase):
+    def choose(self, accept_encoding):
+        request = RequestFactory().get(
+            '/', HTTP_ACCEPT_ENCODING=accept_encoding
+        )
+        return choose_encoding(request)
+
+    def test_gzip_negotiation(self):
+        for accept_encoding, expected in [
+            ('', 'identity'),
+            ('gzip', 'gzip'),
+            ('GZIP, deflate', 'gzip'),
+            ('gzip;q=0', 'identity'),
+            ('deflate, identity', 'identity'),
+            ('gzip;q=oops', 'identity'),
+        ]:
+            with self.subTest(accept_encoding=accept_encoding):
+                self.assertEqual(self.choose(accept_encoding), expected)
+
+    @skipUnless(response_cache.brotli, 'brotli is not installed')
+    def test_brotli_negotiation(self):
+        for accept_encoding, expected in [
+            ('gzip, deflate, br', 'br'),
+            ('*', 'br'),
+            ('br;q=0.5, gzip', 'gzip'),
+            ('*;q=0.1, gzip;q=0.5', 'gzip'),
+            ('br;q=0, *', 'gzip'),
+        ]:
+            with self.subTest(accept_encoding=accept_encoding):
+                self.assertEqual(self.choose(accept_encoding), expected)
+
+
+@override_settings(GEOCODE_WORKER_IN_PROCESS=False)
+class PrecompressedResponseTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(catalog, '_local_snapshot', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        restaurant = Restaurant.objects.create(
+            name='Центр', address='Москва, Тверская 1'
+        )
+        for number in range(3):
+            product = Product.objects.create(
+                name=f'Бургер {number}', price=100, image='burger.jpg'
+            )
+            RestaurantMenuItem.objects.create(
+                restaurant=restaurant, product=product
+            )
+
+    def test_gzip_variant_matches_identity(self):
+        for url in ['/api/products/', '/api/products/?limit=2']:
+            with self.subTest(url=url):
+                plain = self.client.get(url)
+                compressed = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+                self.assertNotIn('Content-Encoding', plain)
+                self.assertEqual(compressed['Content-Encoding'], 'gzip')
+                self.assertEqual(
+                    gzip.decompress(compressed.content), plain.content
+                )
+                for response in [plain, compressed]:
+                    self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_variants_have_own_etags(self):
+        plain = self.client.get('/api/products/')
+        compressed = self.client.get(
+            '/api/products/', HTTP_ACCEPT_ENCODING='gzip'
+        )
+        self.assertNotEqual(plain['ETag'], compressed['ETag'])
+
+        response = self.client.get(
+            '/api/products/',
+            HTTP_ACCEPT_ENCODING='gzip',
+            HTTP_IF_NONE_MATCH=compressed['ETag'],
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertIn('Accept-Encoding', response['Vary'])
+        response = self.client.get(
+            '/api/products/',
+            HTTP_ACCEPT_ENCODING='gzip',
+            HTTP_IF_NONE_MATCH=plain['ETag'],
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_streamed_catalog_is_not_compressed(self):
+        response = self.client.get(
+            '/api/products/?special=false', HTTP_ACCEPT_ENCODING='gzip'
+        )
+        self.assertTrue(response.streaming)
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(len(json.loads(b''.join(response))), 3)
+
+    def test_page_bodies_are_cached(self):
+        self.client.get('/api/products/?limit=2')
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                '/api/products/?limit=2', HTTP_ACCEPT_ENCODING='gzip'
+            )
+        self.assertEqual(
+            len(json.loads(gzip.decompress(response.content))['results']), 2
+        )
+
+
+class MatchingEngineTest(SimpleTestCase):
+    def make_backlog(self):
+        generator = random.Random(0)
+        self.restaurant_points = {
+            restaurant_id: (
+                generator.uniform(55.5, 56), generator.uniform(37.2, 38)
+            )
+            for restaurant_id in range(60)
+        }
+        self.restaurant_products = {
+            restaurant_id: set(generator.sample(range(20), 12))
+            for restaurant_id in self.restaurant_points
+        }
+        self.orders = {
+            order_id: (
+                (generator.uniform(55.4, 56.1), generator.uniform(37.1, 38.1)),
+                set(generator.sample(range(21), generator.randint(1, 3))),
+            )
+            for order_id in range(300)
+        }
+
+    def match_brute_force(self, max_distance_km=None, limit=None) -> dict:
+        restaurant_ids = list(self.restaurant_points)
+        candidates = {}
+        for order_id, (point, product_ids) in self.orders.items():
+            distances = haversine_matrix(
+                [point], list(self.restaurant_points.values())
+            )[0]
+            found = sorted(
+                (distance, restaurant_id)
+                for distance, restaurant_id in zip(
+                    distances.tolist(), restaurant_ids
+                )
+                if product_ids <= self.restaurant_products[restaurant_id]
+                and (max_distance_km is None or distance <= max_distance_km)
+            )
+            candidates[order_id] = found[:limit]
+        return candidates
+
+    def assertCandidatesEqual(self, candidates, expected):
+        self.assertEqual(candidates.keys(), expected.keys())
+        for order_id, order_candidates in candidates.items():
+            self.assertEqual(
+                [restaurant_id for _, restaurant_id in order_candidates],
+                [restaurant_id for _, restaurant_id in expected[order_id]],
+            )
+            np.testing.assert_allclose(
+                [distance for distance, _ in order_candidates],
+                [distance for distance, _ in expected[order_id]],
+            )
+
+    def test_pruned_match_equals_brute_force(self):
+        self.make_backlog()
+        engine = MatchingEngine(
+            GridIndex(self.restaurant_points, cell_km=2),
+            self.restaurant_products,
+        )
+        for max_distance_km, limit in [
+            (None, None), (None, 5), (3, None), (8, 3), (30, 10),
+        ]:
+            with self.subTest(max_distance_km=max_distance_km, limit=limit):
+                self.assertCandidatesEqual(
+                    engine.match(self.orders, max_distance_km, limit),
+                    self.match_brute_force(max_distance_km, limit),
+                )
+
+    def test_chunks_give_same_result(self):
+        self.make_backlog()
+        engine = MatchingEngine(
+            GridIndex(self.restaurant_points), self.restaurant_products
+        )
+        with mock.patch('foodcartapp.matching.CHUNK_SIZE', 7):
+            chunked = engine.match(self.orders, 5, 3)
+        self.assertCandidatesEqual(chunked, self.match_brute_force(5, 3))
+
+    def test_feasibility(self):
+        engine = MatchingEngine(
+            GridIndex({1: (55.75, 37.6), 2: (55.76, 37.6)}),
+            {1: {10, 11}, 2: {11}},
+        )
+        feasibility = engine.get_feasibility([{10, 11}, {11}, {12}, set()])
+        self.assertEqual(feasibility.tolist(), [
+            [True, False],
+            [True, True],
+            [False, False],
+            [True, True],
+        ])
+
+    def test_empty_grid(self):
+        engine = MatchingEngine(GridIndex({}), {})
+        self.assertEqual(
+            engine.match({1: ((55.75, 37.6), {1})}, max_distance_km=5),
+            {1: []},
+        )
+
+    def test_exact_limit_reranks_by_geodesic(self):
+        order_point = (55.75, 37.6)
+        lat_step = math.degrees(5 / EARTH_RADIUS_KM)
+        lon_step = math.degrees(
+            4.995 / EARTH_RADIUS_KM / math.cos(math.radians(55.75))
+        )
+        restaurant_points = {
+            'north': (55.75 + lat_step, 37.6),
+            'east': (55.75, 37.6 + lon_step),
+        }
+        engine = MatchingEngine(
+            GridIndex(restaurant_points),
+            {'north': {1}, 'east': {1}},
+        )
+        orders = {1: (order_point, {1})}
+
+        approximate = engine.match(orders)[1]
+        self.assertEqual(
+            [restaurant for _, restaurant in approximate], ['east', 'north']
+        )
+
+        exact = engine.match(orders, exact_limit=2)[1]
+        self.assertEqual(
+            [restaurant for _, restaurant in exact], ['north', 'east']
+        )
+        geodesic = geodesic_matrix(
+            [order_point], list(restaurant_points.values())
+        )[0]
+        self.assertEqual(
+            dict((restaurant, value) for value, restaurant in exact),
+            dict(zip(restaurant_points, geodesic.tolist())),
+        )
+
+    def test_exact_limit_refines_only_nearest(self):
+        restaurant_points = {
+            number: (55.75 + number / 100, 37.6) for number in range(5)
+        }
+        engine = MatchingEngine(
+            GridIndex(restaurant_points),
+            {number: {1} for number in restaurant_points},
+        )
+        with mock.patch(
+            'foodcartapp.matching.geodesic_matrix', wraps=geodesic_matrix
+        ) as exact_matrix:
+            candidates = engine.match(
+                {1: ((55.75, 37.6), {1})}, limit=4, exact_limit=2
+            )[1]
+        mask = exact_matrix.call_args.args[2]
+        self.assertEqual(mask.sum(), 2)
+        self.assertEqual(
+            [restaurant for _, restaurant in candidates], [0, 1, 2, 3]
+        )
+
+
+@override_settings(
+    GEOCODE_WORKER_IN_PROCESS=False,
+    RESTAURANT_SEARCH_RADIUS_KM=30,
+    ORDER_CANDIDATES_LIMIT=20,
+)
+class OrderCandidatesTest(TestCase):
+    address_coordinates = {
+        'Москва, Тверская 1': (55.7576, 37.6136),
+        'Москва, Профсоюзная 100': (55.6413, 37.5231),
+        'Тверь, Советская 1': (56.8587, 35.9176),
+        'Москва, Арбат 10': (55.7515, 37.5955),
+        'Москва, Новая 1': (None, None),
+    }
+
+    def setUp(self):
+        cache.clear()
+        for module in ['candidates', 'restaurant_index']:
+            patcher = mock.patch(
+                f'foodcartapp.{module}.get_address_coordinates',
+                side_effect=self.get_address_coordinates,
+            )
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.burger = Product.objects.create(
+            name='Бургер', price=100, image='burger.jpg'
+        )
+        self.fries = Product.objects.create(
+            name='Картошка', price=50, image='fries.jpg'
+        )
+        self.restaurants = {}
+        for address, products in [
+            ('Москва, Тверская 1', [self.burger, self.fries]),
+            ('Москва, Профсоюзная 100', [self.burger]),
+            ('Тверь, Советская 1', [self.burger, self.fries]),
+        ]:
+            restaurant = Restaurant.objects.create(
+                name=address, address=address
+            )
+            for product in products:
+                RestaurantMenuItem.objects.create(
+                    restaurant=restaurant, product=product
+                )
+            self.restaurants[address] = restaurant
+
+    def get_address_coordinates(self, addresses):
+        return {
+            address: self.address_coordinates[address]
+            for address in addresses if address in self.address_coordinates
+        }
+
+    def create_order(self, products, address='Москва, Арбат 10', **fields):
+        order = Order.objects.create(
+            firstname='Иван',
+            lastname='Петров',
+            phonenumber='+79291000000',
+            address=address,
+            **fields,
+        )
+        for product in products:
+            OrderPosition.objects.create(
+                order=order, product=product, quantity=1, price=product.price
+            )
+        return order
+
+    def get_candidates(self, order) -> list:
+        return list(
+            order.candidates.order_by('rank')
+            .values_list('restaurant__address', flat=True)
+        )
+
+    def test_candidates_are_ranked_by_distance(self):
+        burger_order = self.create_order([self.burger])
+        combo_order = self.create_order([self.burger, self.fries])
+
+        self.assertEqual(refresh_candidates(Order.objects.all()), 2)
+
+        self.assertEqual(
+            self.get_candidates(burger_order),
+            ['Москва, Тверская 1', 'Москва, Профсоюзная 100'],
+        )
+        self.assertEqual(
+            self.get_candidates(combo_order), ['Москва, Тверская 1']
+        )
+        candidates = list(burger_order.candidates.order_by('rank'))
+        self.assertEqual([candidate.rank for candidate in candidates], [1, 2])
+        self.assertLess(candidates[0].distance, candidates[1].distance)
+
+    def test_refresh_replaces_previous_candidates(self):
+        order = self.create_order([self.burger])
+        OrderCandidate.objects.create(
+            order=order,
+            restaurant=self.restaurants['Тверь, Советская 1'],
+            distance=1,
+            rank=1,
+        )
+        refresh_candidates(Order.objects.all())
+        refresh_candidates(Order.objects.all())
+        self.assertEqual(
+            self.get_candidates(order),
+            ['Москва, Тверская 1', 'Москва, Профсоюзная 100'],
+        )
+
+    def test_unlocated_and_assigned_orders_are_skipped(self):
+        unlocated_order = self.create_order(
+            [self.burger], address='Москва, Новая 1'
+        )
+        assigned_order = self.create_order(
+            [self.burger], performer=self.restaurants['Москва, Тверская 1']
+        )
+        self.assertEqual(refresh_candidates(Order.objects.all()), 1)
+        self.assertEqual(self.get_candidates(unlocated_order), [])
+        self.assertEqual(self.get_candidates(assigned_order), [])
+
+    def test_refreshes_of_one_transaction_are_coalesced(self):
+        order = self.create_order([self.burger])
+        other_order = self.create_order([self.fries])
+        with mock.patch(
+            'foodcartapp.candidates.refresh_candidates'
+        ) as refresh:
+            with self.captureOnCommitCallbacks(execute=True):
+                schedule_refresh(product_ids=[self.burger.id])
+                schedule_refresh(order_ids=[other_order.id])
+        refresh.assert_called_once()
+        orders, = refresh.call_args.args
+        self.assertEqual(
+            set(orders.values_list('id', flat=True)),
+            {order.id, other_order.id},
+        )
+
+    def test_located_address_refreshes_its_orders(self):
+        order = self.create_order([self.burger])
+        other_order = self.create_order(
+            [self.burger], address='Москва, Профсоюзная 100'
+        )
+        addresses_located.send(
+            sender=Order,
+            address_coordinates={
+                'Москва, Арбат 10': self.address_coordinates[
+                    'Москва, Арбат 10'
+                ],
+            },
+        )
+        self.assertEqual(len(self.get_candidates(order)), 2)
+        self.assertEqual(self.get_candidates(other_order), [])
@@ -0,0 +1,32 @@
+import time
+
+from django.core.cache import cache
+
+
+VERSION_KEY_TEMPLATE = 'version:{name}'
+
+
+def get_version(name: str) -> int:
+    """Returns current version stamp of the named data set.
+
+    Stamp is a nanosecond timestamp of the last change, so it also
+    serves as modification time. Stamps live in the shared cache,
+    so all workers see the same value.
+    """
+    key = VERSION_KEY_TEMPLATE.format(name=name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(name: str) -> int:
+    key = VERSION_KEY_TEMPLATE.format(name=name)
+    version = max(time.time_ns(), (cache.get(key) or 0) + 1)
+    cache.set(key, version, timeout=None)
+    return version
+
+
+def version_timestamp(version: int) -> float:
+    return version / 1e9
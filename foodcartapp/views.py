@@ -1,85 +1,237 @@
+import hashlib
+from urllib.parse import urlencode
+
+from django.conf import settings
 from django.http import JsonResponse
-from django.templatetags.static import static
-from rest_framework.decorators import api_view
+from rest_framework import status
+from rest_framework.decorators import (
+    api_view, authentication_classes, permission_classes, throttle_classes
+)
 from rest_framework.response import Response
-from django.db import transaction
 
-from .models import Product, Order, OrderPosition
-from .serializers import OrderSerializer
+from .banners import get_banners_snapshot
+from .catalog import (
+    CATALOG_FIELDS,
+    CATALOG_VERSION,
+    decode_cursor,
+    dump_json,
+    encode_cursor,
+    get_catalog_page,
+    get_catalog_queryset,
+    get_catalog_snapshot,
+    iter_catalog_json,
+    serialize_product,
+)
+from .idempotency import IDEMPOTENCY_HEADER, idempotent
+from .journal import journal_order
+from .orders import create_orders
+from .partners import (
+    IsPartner, PartnerRateThrottle, PartnerTokenAuthentication
+)
+from .response_cache import (
+    conditional_json_response, get_cached_bodies
+)
+from .serializers import (
+    OrderSerializer, collect_product_ids, load_order_products
+)
+from .versions import get_version
+
+
+CATALOG_PAGE_MAX_LIMIT = 100
+ORDERS_BATCH_MAX_SIZE = 500
 
 
 def banners_list_api(request):
-    # FIXME move data to db?
-    return JsonResponse([
-        {
-            'title': 'Burger',
-            'src': static('burger.jpg'),
-            'text': 'Tasty Burger at your door step',
-        },
-        {
-            'title': 'Spices',
-            'src': static('food.jpg'),
-            'text': 'All Cuisines',
-        },
-        {
-            'title': 'New York',
-            'src': static('tasty.jpg'),
-            'text': 'Food is incomplete without a tasty dessert',
-        }
-    ], safe=False, json_dumps_params={
-        'ensure_ascii': False,
-        'indent': 4,
-    })
+    snapshot = get_banners_snapshot()
+    return conditional_json_response(
+        request, snapshot.bodies, f'banners-{snapshot.stamp}', snapshot.stamp
+    )
+
+
+def parse_catalog_params(params) -> dict:
+    """Returns validated filters of the catalog, other params are ignored."""
+    catalog_params = {}
+    if params.get('category'):
+        try:
+            catalog_params['category'] = int(params['category'])
+        except ValueError:
+            raise ValueError(
+                f'Invalid category: {params["category"]}'
+            ) from None
+    if params.get('special'):
+        special = params['special'].lower()
+        if special not in ('true', 'false', '1', '0'):
+            raise ValueError(f'Invalid special: {params["special"]}')
+        catalog_params['special'] = special in ('true', '1')
+    if params.get('fields'):
+        fields = params['fields'].split(',')
+        unknown_fields = set(fields) - set(CATALOG_FIELDS)
+        if unknown_fields:
+            raise ValueError(f'Unknown fields: {", ".join(unknown_fields)}')
+        catalog_params['fields'] = fields
+    return catalog_params
+
+
+def get_catalog_query(catalog_params: dict, limit: int = None,
+                      after_id: int = None) -> str:
+    """Returns canonical query string of parsed catalog parameters.
+
+    Unknown parameters, like cache busters and utm tags, are not in
+    it, so they share cached pages with the plain query.
+    """
+    query = dict(catalog_params)
+    if 'special' in query:
+        query['special'] = 'true' if query['special'] else 'false'
+    if 'fields' in query:
+        query['fields'] = ','.join(query['fields'])
+    if limit is not None:
+        query['limit'] = limit
+    if after_id is not None:
+        query['cursor'] = encode_cursor(after_id)
+    return urlencode(sorted(query.items()))
 
 
 def product_list_api(request):
-    products = Product.objects.select_related('category').available()
-
-    dumped_products = []
-    for product in products:
-        dumped_product = {
-            'id': product.id,
-            'name': product.name,
-            'price': product.price,
-            'special_status': product.special_status,
-            'description': product.description,
-            'category': {
-                'id': product.category.id,
-                'name': product.category.name,
-            } if product.category else None,
-            'image': product.image.url,
-            'restaurant': {
-                'id': product.id,
-                'name': product.name,
-            }
-        }
-        dumped_products.append(dumped_product)
-    return JsonResponse(dumped_products, safe=False, json_dumps_params={
-        'ensure_ascii': False,
-        'indent': 4,
-    })
+    """Returns catalog of available products.
+
+    Without query parameters the whole catalog snapshot is returned,
+    unknown parameters are ignored. Supported parameters:
+        category - category id,
+        special - true/false, special offers only or excluding them,
+        fields - comma-separated list of product fields,
+        limit, cursor - cursor pagination, otherwise the result is
+            streamed as one JSON array.
+    """
+    try:
+        catalog_params = parse_catalog_params(request.GET)
+        limit = request.GET.get('limit')
+        if limit is not None:
+            if not limit.isdigit() or int(limit) < 1:
+                raise ValueError(f'Invalid limit: {limit}')
+            limit = min(int(limit), CATALOG_PAGE_MAX_LIMIT)
+        cursor = request.GET.get('cursor')
+        after_id = decode_cursor(cursor) if cursor else None
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+
+    if not catalog_params and limit is None and after_id is None:
+        snapshot = get_catalog_snapshot()
+        return conditional_json_response(
+            request,
+            snapshot.bodies,
+            f'catalog-{snapshot.version}',
+            snapshot.version,
+        )
+
+    fields = catalog_params.get('fields', CATALOG_FIELDS)
+    products = get_catalog_queryset(**catalog_params)
+    version = get_version(CATALOG_VERSION)
+    query_hash = hashlib.md5(
+        get_catalog_query(catalog_params, limit, after_id).encode()
+    ).hexdigest()
+    etag = f'catalog-{version}-{query_hash}'
+
+    if limit is None and after_id is None:
+        return conditional_json_response(
+            request,
+            lambda: iter_catalog_json(products, fields),
+            etag,
+            version,
+            streaming=True,
+        )
+
+    def dump_page():
+        page, next_cursor = get_catalog_page(
+            products, limit or CATALOG_PAGE_MAX_LIMIT, after_id
+        )
+        next_url = None
+        if next_cursor:
+            next_query = get_catalog_query(
+                catalog_params, limit, decode_cursor(next_cursor)
+            )
+            next_url = request.build_absolute_uri(
+                f'{request.path}?{next_query}'
+            )
+        return dump_json({
+            'next': next_url,
+            'results': [
+                serialize_product(product, fields) for product in page
+            ],
+        }).encode()
+
+    return conditional_json_response(
+        request,
+        lambda: get_cached_bodies(
+            f'catalog:page:{version}:{query_hash}', dump_page
+        ),
+        etag,
+        version,
+    )
 
 
 @api_view(['POST'])
+@idempotent
 def register_order(request):
     serializer = OrderSerializer(data=request.data)
     serializer.is_valid(raise_exception=True)
-    with transaction.atomic():
-        order = Order.objects.create(
-            firstname=serializer.validated_data['firstname'],
-            lastname=serializer.validated_data['lastname'],
-            phonenumber=serializer.validated_data['phonenumber'],
-            address=serializer.validated_data['address'],
+    if settings.ORDER_INTAKE_MODE == 'journal':
+        # Journal is outside of the idempotency transaction, so the key
+        # is kept with the entry to journal concurrent retries once
+        journal_order(
+            serializer.validated_data,
+            request.headers.get(IDEMPOTENCY_HEADER),
         )
-        order_position_fields = serializer.validated_data['products']
-        order_positions = [
-            OrderPosition(
-                order=order,
-                product=fields['product'],
-                quantity=fields['quantity'],
-                price=fields['product'].price
-            ) for fields in order_position_fields
-        ]
-        OrderPosition.objects.bulk_create(order_positions)
-
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+    order, = create_orders([serializer.validated_data])
     return Response(OrderSerializer(order).data)
+
+
+@api_view(['POST'])
+@authentication_classes([PartnerTokenAuthentication])
+@permission_classes([IsPartner])
+@throttle_classes([PartnerRateThrottle])
+@idempotent
+def register_orders_batch(request):
+    """Registers a batch of orders from partner channels.
+
+    Partners authenticate with a token from PARTNER_API_TOKENS, each
+    partner is limited by the 'partner' throttle rate.
+
+    Products of all orders are loaded with one query, valid orders
+    are saved by bulk inserts in one transaction. Response contains
+    result for every order in the same order as in the request.
+    """
+    orders_data = request.data
+    if not isinstance(orders_data, list) or not orders_data:
+        return Response(
+            {'error': 'Ожидается непустой список заказов.'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if len(orders_data) > ORDERS_BATCH_MAX_SIZE:
+        return Response(
+            {'error': f'Не больше {ORDERS_BATCH_MAX_SIZE} заказов за раз.'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    context = {
+        'products': load_order_products(collect_product_ids(orders_data))
+    }
+    results = []
+    validated_orders = []
+    for order_data in orders_data:
+        serializer = OrderSerializer(data=order_data, context=context)
+        if serializer.is_valid():
+            validated_orders.append(serializer.validated_data)
+            results.append(None)
+        else:
+            results.append({'errors': serializer.errors})
+
+    orders = iter(create_orders(validated_orders))
+    results = [
+        result or {'id': next(orders).id} for result in results
+    ]
+    if not validated_orders:
+        return Response(
+            {'results': results}, status=status.HTTP_400_BAD_REQUEST
+        )
+    return Response({'results': results})
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import random
+import time
+
+import requests
+from django.conf import settings
+from django.utils.module_loading import import_string
+from requests.adapters import HTTPAdapter
+
+from location.normalization import normalize_address
+from location.resilience import CallMetrics, RateLimiter
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+geocoder_metrics = CallMetrics()
+geocoder_rate_limiter = RateLimiter(
+    settings.GEOCODER_RATE_LIMIT, settings.GEOCODER_RATE_BURST
+)
+
+
+class GeocoderError(Exception):
+    """Geocoder failed to answer, the address may be retried later."""
+
+
+class GeocoderUnavailable(GeocoderError):
+    """Circuit breaker is open, the geocoder was not called."""
+
+
+class GeocoderBackend:
+    """Resolves an address to (lat, lon).
+
+    Returns (None, None) if the address is unknown to the geocoder
+    and raises GeocoderError if the geocoder could not answer.
+    """
+    def geocode(self, address: str) -> tuple:
+        raise NotImplementedError
+
+
+class YandexGeocoder(GeocoderBackend):
+    """Client of Yandex Geocoder API.
+
+    Keeps connections in a pool shared by geocoding threads. Connection
+    errors, timeouts and 429/5xx answers are retried with jittered
+    exponential backoff. Every attempt takes a token of the process
+    wide rate limiter.
+    """
+    def __init__(self, apikey: str = None,
+                 base_url: str = 'https://geocode-maps.yandex.ru/1.x',
+                 timeout: float = None, connect_timeout: float = None,
+                 retries: int = None, retry_backoff: float = None):
+        self.apikey = apikey or settings.YANDEX_GEOCODER_APIKEY
+        self.base_url = base_url
+        self.timeout = (
+            connect_timeout or settings.GEOCODER_CONNECT_TIMEOUT,
+            timeout or settings.GEOCODER_TIMEOUT,
+        )
+        self.retries = settings.GEOCODER_RETRIES \
+            if retries is None else retries
+        self.retry_backoff = retry_backoff or settings.GEOCODER_RETRY_BACKOFF
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(
+            pool_maxsize=settings.GEOCODER_MAX_WORKERS
+        ))
+
+    def request(self, address: str) -> requests.Response:
+        for attempt in range(self.retries + 1):
+            if attempt:
+                geocoder_metrics.count('retries')
+                delay = self.retry_backoff * 2 ** attempt
+                time.sleep(random.uniform(0, delay))
+            geocoder_rate_limiter.acquire()
+            try:
+                response = self.session.get(
+                    self.base_url, params={
+                        "geocode": address,
+                        "apikey": self.apikey,
+                        "format": "json",
+                    },
+                    timeout=self.timeout,
+                )
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    raise
+                continue
+            if response.status_code not in RETRY_STATUS_CODES \
+                    or attempt == self.retries:
+                return response
+
+    def geocode(self, address: str) -> tuple:
+        try:
+            response = self.request(address)
+            response.raise_for_status()
+            found_places = response.json()['response'][
+                'GeoObjectCollection']['featureMember']
+            if not found_places:
+                return None, None
+
+            most_relevant = found_places[0]
+            lon, lat = most_relevant['GeoObject']['Point']['pos'].split(" ")
+            return float(lat), float(lon)
+        except (requests.RequestException, KeyError, IndexError, TypeError,
+                ValueError) as error:
+            raise GeocoderError(error) from error
+
+
+class LocalGeocoder(GeocoderBackend):
+    """Offline geocoder for development and load tests.
+
+    Looks addresses up in a JSON fixture {"address": [lat, lon]},
+    matching them by canonical form. Unknown addresses get stable
+    coordinates synthesized from the address hash inside the
+    bounding box, unless synthesize is off. Delay imitates the
+    network latency of a real geocoder.
+    """
+    def __init__(self, fixture_path: str = None, synthesize: bool = True,
+                 bbox: tuple = (55.55, 37.35, 55.95, 37.85),
+                 delay: float = 0):
+        self.fixtures = {}
+        if fixture_path:
+            with open(fixture_path, encoding='utf-8') as fixture_file:
+                self.fixtures = {
+                    normalize_address(address): coordinates
+                    for address, coordinates in json.load(fixture_file).items()
+                }
+        self.synthesize = synthesize
+        self.bbox = bbox
+        self.delay = delay
+
+    def geocode(self, address: str) -> tuple:
+        if self.delay:
+            time.sleep(self.delay)
+        canonical_address = normalize_address(address)
+        if canonical_address in self.fixtures:
+            coordinates = self.fixtures[canonical_address]
+            return tuple(coordinates) if coordinates else (None, None)
+        if not self.synthesize:
+            return None, None
+
+        digest = hashlib.sha256(canonical_address.encode()).digest()
+        lat_share = int.from_bytes(digest[:8], 'big') / 2 ** 64
+        lon_share = int.from_bytes(digest[8:16], 'big') / 2 ** 64
+        min_lat, min_lon, max_lat, max_lon = self.bbox
+        return (
+            round(min_lat + (max_lat - min_lat) * lat_share, 6),
+            round(min_lon + (max_lon - min_lon) * lon_share, 6),
+        )
+
+
+_geocoder = None
+
+
+def get_geocoder() -> GeocoderBackend:
+    """Returns geocoder configured by GEOCODER_BACKEND setting."""
+    global _geocoder
+    if _geocoder is None:
+        backend_class = import_string(settings.GEOCODER_BACKEND)
+        _geocoder = backend_class(**settings.GEOCODER_OPTIONS)
+    return _geocoder
@@ -0,0 +1,202 @@
+import hashlib
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from location.models import GeocodeTask, Location
+from location.normalization import normalize_address
+
+
+MEMORY = 'memory'
+SHARED = 'shared'
+DATABASE = 'database'
+
+
+class LRUCache:
+    """Bounded thread-safe mapping with expiring entries."""
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+def is_negative(coordinates: tuple) -> bool:
+    return coordinates[0] is None or coordinates[1] is None
+
+
+def get_ttl(coordinates: tuple) -> float:
+    if is_negative(coordinates):
+        return settings.GEOCODE_CACHE_NEGATIVE_TTL
+    return settings.GEOCODE_CACHE_POSITIVE_TTL
+
+
+def get_shared_key(key: str) -> str:
+    return 'geocode:v3:' + hashlib.md5(key.encode()).hexdigest()
+
+
+class GeocodeCache:
+    """Geocoding results cache with three tiers.
+
+    Lookups go through per-process LRU, shared Django cache and
+    Location table, results found in a lower tier are copied to the
+    upper ones. Entries are keyed by canonical address, so different
+    spellings of one address share an entry. Addresses the geocoder
+    could not resolve are cached as (None, None) with a shorter TTL.
+    Hits and misses are counted per tier.
+
+    Expired Location entries are still returned, but only for
+    GEOCODE_CACHE_STALE_TTL, and a geocoding task is queued to refresh
+    them. Used keys are flushed to Location.last_used_at at most once
+    per GEOCODE_USAGE_FLUSH_INTERVAL, so the sweeper knows which
+    addresses are worth refreshing ahead.
+    """
+    def __init__(self, max_size: int):
+        self.memory = LRUCache(max_size)
+        self.stats = Counter()
+        self.used_keys = set()
+        self.used_keys_lock = threading.Lock()
+        self.flushed_at = time.monotonic()
+
+    def get_many(self, addresses) -> dict:
+        addresses_by_key = {}
+        for address in addresses:
+            addresses_by_key.setdefault(
+                normalize_address(address), []
+            ).append(address)
+        found = self._get_many(set(addresses_by_key))
+        self._mark_used(found.keys())
+        return {
+            address: coordinates
+            for key, coordinates in found.items()
+            for address in addresses_by_key[key]
+        }
+
+    def set_many(self, address_coordinates: dict):
+        shared_entries = {}
+        for address, coordinates in address_coordinates.items():
+            key = normalize_address(address)
+            coordinates = tuple(coordinates)
+            self.memory.set(key, coordinates, get_ttl(coordinates))
+            shared_entries.setdefault(get_ttl(coordinates), {})[
+                get_shared_key(key)] = coordinates
+        for ttl, entries in shared_entries.items():
+            cache.set_many(entries, ttl)
+
+    def clear(self):
+        self.memory.clear()
+        self.stats.clear()
+
+    def flush_usage(self):
+        with self.used_keys_lock:
+            used_keys, self.used_keys = self.used_keys, set()
+            self.flushed_at = time.monotonic()
+        if used_keys:
+            Location.objects\
+                .filter(canonical_address__in=used_keys)\
+                .update(last_used_at=timezone.now())
+
+    def _mark_used(self, keys):
+        with self.used_keys_lock:
+            self.used_keys.update(keys)
+            flush_due = time.monotonic() - self.flushed_at \
+                >= settings.GEOCODE_USAGE_FLUSH_INTERVAL
+        if flush_due:
+            self.flush_usage()
+
+    def _get_many(self, keys: set) -> dict:
+        found = {}
+
+        for key in keys:
+            coordinates = self.memory.get(key)
+            if coordinates is not None:
+                found[key] = coordinates
+        self._count(MEMORY, len(found), len(keys) - len(found))
+
+        missing = {get_shared_key(key): key for key in keys - found.keys()}
+        if missing:
+            shared_found = cache.get_many(list(missing))
+            for shared_key, coordinates in shared_found.items():
+                key = missing[shared_key]
+                found[key] = coordinates
+                self.memory.set(key, coordinates, get_ttl(coordinates))
+            self._count(
+                SHARED, len(shared_found), len(missing) - len(shared_found)
+            )
+
+        missing = keys - found.keys()
+        if missing:
+            database_found = self._get_from_database(missing)
+            found.update(database_found)
+            self._count(
+                DATABASE,
+                len(database_found),
+                len(missing) - len(database_found),
+            )
+        return found
+
+    def _get_from_database(self, keys) -> dict:
+        now = timezone.now()
+        found = {}
+        stale_addresses = []
+        locations = Location.objects\
+            .filter(canonical_address__in=keys)\
+            .order_by('updated_at')
+        for location in locations:
+            coordinates = (location.lat, location.lon)
+            age = (now - location.updated_at).total_seconds()
+            ttl = get_ttl(coordinates) - age
+            if ttl <= 0:
+                ttl = settings.GEOCODE_CACHE_STALE_TTL
+                stale_addresses.append(location.address)
+            key = location.canonical_address
+            found[key] = coordinates
+            self.memory.set(key, coordinates, ttl)
+            cache.set(get_shared_key(key), coordinates, ttl)
+        if stale_addresses:
+            self.stats['stale_hits'] += len(stale_addresses)
+            GeocodeTask.objects.bulk_create(
+                [
+                    GeocodeTask(address=address, refresh=True)
+                    for address in stale_addresses
+                ],
+                ignore_conflicts=True,
+            )
+        return found
+
+    def _count(self, tier: str, hits: int, misses: int):
+        self.stats[f'{tier}_hits'] += hits
+        self.stats[f'{tier}_misses'] += misses
+
+
+geocode_cache = GeocodeCache(settings.GEOCODE_MEMORY_CACHE_SIZE)
@@ -1,54 +1,173 @@
-import requests
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
 from django.conf import settings
-from django.utils import timezone
 from geopy import distance
 
+from location.backends import (
+    GeocoderError,
+    GeocoderUnavailable,
+    geocoder_metrics,
+    get_geocoder,
+)
+from location.cache import geocode_cache
 from location.models import Location
+from location.normalization import normalize_address
+from location.resilience import CircuitBreaker
+from location.signals import addresses_located
+
+logger = logging.getLogger(__name__)
+
+geocoder_breaker = CircuitBreaker(
+    settings.GEOCODER_BREAKER_THRESHOLD,
+    settings.GEOCODER_BREAKER_RESET_TIMEOUT,
+)
 
 
-def fetch_coordinates(
-    address: str, apikey: str = settings.YANDEX_GEOCODER_APIKEY
-) -> tuple:
-    base_url = "https://geocode-maps.yandex.ru/1.x"
-    response = requests.get(
-        base_url, params={
-            "geocode": address,
-            "apikey": apikey,
-            "format": "json",
-        }
-        )
-    response.raise_for_status()
-    found_places = response.json()['response']['GeoObjectCollection'][
-        'featureMember']
+def fetch_coordinates(address: str) -> tuple:
+    """Returns (lat, lon) of address from the configured geocoder.
+
+    While the circuit breaker is open GeocoderUnavailable is raised
+    right away, readers keep getting cached and stale coordinates
+    from geocode_cache.
+    """
+    if not geocoder_breaker.allow():
+        geocoder_metrics.count('short_circuited')
+        raise GeocoderUnavailable('Geocoder circuit breaker is open')
+    started_at = time.monotonic()
+    try:
+        coordinates = get_geocoder().geocode(address)
+    except Exception:
+        # Any error must be recorded, or a failed trial call would leave
+        # the breaker half open
+        geocoder_breaker.record_failure()
+        geocoder_metrics.count('failures')
+        raise
+    finally:
+        geocoder_metrics.count('requests')
+        geocoder_metrics.observe(time.monotonic() - started_at)
+    geocoder_breaker.record_success()
+    return coordinates
 
-    if not found_places:
-        return None, None
 
-    most_relevant = found_places[0]
-    lon, lat = most_relevant['GeoObject']['Point']['pos'].split(" ")
-    return lon, lat
+def get_geocoder_metrics() -> dict:
+    return {
+        'breaker': geocoder_breaker.get_state(),
+        'calls': geocoder_metrics.get_state(),
+        'cache': dict(geocode_cache.stats),
+    }
 
 
 def get_distance(location1: tuple, location2: tuple) -> float:
     return distance.distance(location1, location2).km
 
 
-def get_coordinates(address: str) -> [tuple, None]:
-    try:
-        lat, lon = fetch_coordinates(address)
-        Location.objects.update_or_create(
-            address=address,
-            defaults={'lat': lat, 'lon': lon}
-        )
-        return lat, lon
-    except requests.HTTPError:
-        return None
+def save_coordinates(address_coordinates: dict):
+    """Saves geocoding results to Location and to the geocode cache.
+
+    Locations with the same canonical address are updated too, so
+    differently written forms of one address share coordinates.
+    All rows are written with a single batched upsert.
+    """
+    if not address_coordinates:
+        return
+    canonical_coordinates = {
+        normalize_address(address): coordinates
+        for address, coordinates in address_coordinates.items()
+    }
+    known_locations = Location.objects\
+        .filter(canonical_address__in=canonical_coordinates)\
+        .values_list('address', 'canonical_address')
+    rows = dict(address_coordinates)
+    for address, canonical_address in known_locations:
+        rows[address] = canonical_coordinates[canonical_address]
+    Location.objects.upsert_coordinates(rows)
+    geocode_cache.set_many(address_coordinates)
+    addresses_located.send(
+        sender=Location, address_coordinates=address_coordinates
+    )
+
+
+def geocode_addresses(addresses, max_workers: int = None,
+                      batch_timeout: float = None) -> tuple:
+    """Geocodes addresses concurrently without touching the database.
+
+    Requests are spread over a thread pool of max_workers threads,
+    GEOCODER_MAX_WORKERS by default, and for geocoders with quota are
+    limited by the process wide rate limiter. Returns coordinates of
+    geocoded addresses and errors of the failed ones. Unexpected errors
+    are logged and reported as None, so one address can not abort the
+    batch. Addresses not finished within batch_timeout,
+    GEOCODER_BATCH_TIMEOUT by default, are reported as failed too.
+    """
+    if max_workers is None:
+        max_workers = settings.GEOCODER_MAX_WORKERS
+    if batch_timeout is None:
+        batch_timeout = settings.GEOCODER_BATCH_TIMEOUT
+    addresses = list(dict.fromkeys(addresses))
+    coordinates = {}
+    failures = {}
+    if not addresses:
+        return coordinates, failures
+
+    executor = ThreadPoolExecutor(
+        max_workers=min(max_workers, len(addresses))
+    )
+    futures = {
+        executor.submit(fetch_coordinates, address): address
+        for address in addresses
+    }
+    done, not_done = wait(futures, timeout=batch_timeout)
+    for future in done:
+        address = futures[future]
+        try:
+            coordinates[address] = future.result()
+        except GeocoderError as error:
+            failures[address] = error
+        except Exception:
+            logger.exception('Geocoding of %r failed', address)
+            failures[address] = None
+    for future in not_done:
+        future.cancel()
+        failures[futures[future]] = TimeoutError('Geocoding timed out')
+    executor.shutdown(wait=False)
+    return coordinates, failures
+
+
+def get_coordinates_batch(addresses) -> tuple:
+    """Geocodes addresses concurrently and saves results to Location.
+
+    Addresses with the same canonical form are geocoded once. Returns
+    coordinates of resolved addresses and errors of the failed ones.
+    """
+    canonical_addresses = {
+        address: normalize_address(address) for address in addresses
+    }
+    representatives = {}
+    for address, canonical_address in canonical_addresses.items():
+        representatives.setdefault(canonical_address, address)
+
+    fetched_coordinates, fetch_failures = geocode_addresses(
+        representatives.values()
+    )
+
+    coordinates = {}
+    failures = {}
+    for address, canonical_address in canonical_addresses.items():
+        representative = representatives[canonical_address]
+        if representative in fetched_coordinates:
+            coordinates[address] = fetched_coordinates[representative]
+        else:
+            failures[address] = fetch_failures.get(representative)
+    save_coordinates(coordinates)
+    return coordinates, failures
 
 
 def get_address_coordinates(address_list: list) -> dict:
-    address_coordinates = {}
-    for location in Location.objects.filter(address__in=address_list):
-        if (timezone.now() - location.updated_at).days < \
-                settings.LOCATION_UPDATE_TIMEOUT:
-            address_coordinates[location.address] = (location.lat, location.lon)
-    return address_coordinates
+    """Returns cached coordinates of addresses.
+
+    Addresses the geocoder could not resolve are returned as
+    (None, None) until their negative cache entry expires.
+    """
+    return geocode_cache.get_many(address_list)
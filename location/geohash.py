@@ -0,0 +1,115 @@
+import math
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+DEFAULT_PRECISION = 9
+MAX_COVER_CELLS = 32
+
+
+def encode(lat: float, lon: float,
+           precision: int = DEFAULT_PRECISION) -> str:
+    """Returns geohash of the point, interleaving lon and lat bits."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    is_lon = True
+    while len(chars) < precision:
+        value, value_range = (lon, lon_range) if is_lon else (lat, lat_range)
+        middle = (value_range[0] + value_range[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            value_range[0] = middle
+        else:
+            value_range[1] = middle
+        is_lon = not is_lon
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def decode_bbox(geohash: str) -> tuple:
+    """Returns (min_lat, min_lon, max_lat, max_lon) of the cell."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    is_lon = True
+    for char in geohash:
+        bits = BASE32.index(char)
+        for shift in range(4, -1, -1):
+            value_range = lon_range if is_lon else lat_range
+            middle = (value_range[0] + value_range[1]) / 2
+            if bits >> shift & 1:
+                value_range[0] = middle
+            else:
+                value_range[1] = middle
+            is_lon = not is_lon
+    return lat_range[0], lon_range[0], lat_range[1], lon_range[1]
+
+
+def get_cell_size(precision: int) -> tuple:
+    """Returns (lat, lon) size in degrees of cells of given precision."""
+    bits = precision * 5
+    return 180 / 2 ** (bits // 2), 360 / 2 ** (bits - bits // 2)
+
+
+def neighbours(geohash: str) -> list:
+    """Returns geohashes of up to 8 cells around the given one."""
+    min_lat, min_lon, max_lat, max_lon = decode_bbox(geohash)
+    lat_size, lon_size = max_lat - min_lat, max_lon - min_lon
+    center_lat, center_lon = min_lat + lat_size / 2, min_lon + lon_size / 2
+    cells = []
+    for lat_step in (-1, 0, 1):
+        lat = center_lat + lat_step * lat_size
+        if not -90 < lat < 90:
+            continue
+        for lon_step in (-1, 0, 1):
+            if not lat_step and not lon_step:
+                continue
+            lon = (center_lon + lon_step * lon_size + 180) % 360 - 180
+            cell = encode(lat, lon, len(geohash))
+            if cell not in cells:
+                cells.append(cell)
+    return cells
+
+
+def cover_bbox(min_lat: float, min_lon: float,
+               max_lat: float, max_lon: float) -> list:
+    """Returns geohash prefixes whose cells together cover the bbox.
+
+    Precision is the finest one that needs no more than
+    MAX_COVER_CELLS prefixes. Boxes crossing the antimeridian
+    are not supported.
+    """
+    cells = []
+    for precision in range(DEFAULT_PRECISION, 0, -1):
+        lat_size, lon_size = get_cell_size(precision)
+        lat_cells = math.floor(max_lat / lat_size) \
+            - math.floor(min_lat / lat_size) + 1
+        lon_cells = math.floor(max_lon / lon_size) \
+            - math.floor(min_lon / lon_size) + 1
+        if lat_cells * lon_cells > MAX_COVER_CELLS and precision > 1:
+            continue
+        for lat_index in range(lat_cells):
+            lat = min(min_lat + lat_index * lat_size, max_lat)
+            for lon_index in range(lon_cells):
+                lon = min(min_lon + lon_index * lon_size, max_lon)
+                cell = encode(lat, lon, precision)
+                if cell not in cells:
+                    cells.append(cell)
+        return cells
+    return cells
+
+
+def get_prefix_upper_bound(prefix: str) -> [str, None]:
+    """Returns smallest geohash greater than all ones starting with prefix.
+
+    Lets prefix lookups run as B-tree range scans on any database.
+    """
+    prefix = prefix.rstrip(BASE32[-1])
+    if not prefix:
+        return None
+    return prefix[:-1] + BASE32[BASE32.index(prefix[-1]) + 1]
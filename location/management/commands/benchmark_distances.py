@@ -0,0 +1,60 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from location.distances import haversine_matrix, geodesic_matrix
+from location.geofunctions import get_distance
+
+
+class Command(BaseCommand):
+    help = 'Compares per-pair geodesic distances with the vectorized matrix'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=300)
+        parser.add_argument('--restaurants', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        generator = random.Random(options['seed'])
+
+        def random_points(count):
+            return [
+                (generator.uniform(55.55, 55.95),
+                 generator.uniform(37.35, 37.85))
+                for _ in range(count)
+            ]
+
+        orders = random_points(options['orders'])
+        restaurants = random_points(options['restaurants'])
+        pairs = len(orders) * len(restaurants)
+
+        started_at = time.perf_counter()
+        per_pair = [
+            [get_distance(order, restaurant) for restaurant in restaurants]
+            for order in orders
+        ]
+        per_pair_time = time.perf_counter() - started_at
+
+        started_at = time.perf_counter()
+        matrix = haversine_matrix(orders, restaurants)
+        matrix_time = time.perf_counter() - started_at
+
+        started_at = time.perf_counter()
+        geodesic_matrix(orders, restaurants)
+        geodesic_time = time.perf_counter() - started_at
+
+        max_error = max(
+            abs(matrix[row, column] - distance) / distance
+            for row, distances in enumerate(per_pair)
+            for column, distance in enumerate(distances)
+            if distance
+        )
+        self.stdout.write(
+            f'{pairs} pairs\n'
+            f'per-pair get_distance: {per_pair_time:.3f}s\n'
+            f'geodesic_matrix:       {geodesic_time:.3f}s\n'
+            f'haversine_matrix:      {matrix_time:.4f}s '
+            f'({per_pair_time / matrix_time:.0f}x faster)\n'
+            f'max relative error of haversine: {max_error:.3%}'
+        )
@@ -0,0 +1,88 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from foodcartapp.models import Order, Restaurant
+from location.models import Location
+from location.normalization import normalize_address
+
+
+def get_hit_rates(addresses: set) -> tuple:
+    """Share of addresses found in Location by exact and canonical key."""
+    if not addresses:
+        return 0, 0
+    exact_hits = Location.objects.filter(address__in=addresses).count()
+    canonical_addresses = {
+        normalize_address(address): address for address in addresses
+    }
+    canonical_hits = set(
+        Location.objects
+        .filter(canonical_address__in=canonical_addresses)
+        .values_list('canonical_address', flat=True)
+    )
+    canonical_hit_count = sum(
+        normalize_address(address) in canonical_hits
+        for address in addresses
+    )
+    return exact_hits / len(addresses), canonical_hit_count / len(addresses)
+
+
+class Command(BaseCommand):
+    help = 'Merges Location entries having the same canonical address'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report duplicates and hit rates',
+        )
+
+    def handle(self, *args, **options):
+        unnormalized = Location.objects.filter(canonical_address='')
+        if options['dry_run']:
+            self.stdout.write(
+                f'{unnormalized.count()} entries have no canonical address'
+            )
+        else:
+            for location in unnormalized:
+                location.save()
+
+        addresses = set(Order.objects.values_list('address', flat=True))\
+            | set(Restaurant.objects.values_list('address', flat=True))
+        exact_rate, canonical_rate = get_hit_rates(addresses)
+        self.stdout.write(
+            f'Cache hit rate over {len(addresses)} known addresses: '
+            f'{exact_rate:.1%} by exact address, '
+            f'{canonical_rate:.1%} by canonical address'
+        )
+
+        duplicated_keys = Location.objects\
+            .values('canonical_address')\
+            .annotate(entries=Count('id'))\
+            .filter(entries__gt=1)\
+            .values_list('canonical_address', flat=True)
+        removed = 0
+        with transaction.atomic():
+            for canonical_address in duplicated_keys:
+                locations = list(
+                    Location.objects
+                    .filter(canonical_address=canonical_address)
+                    .order_by('-updated_at')
+                )
+                resolved = [
+                    location for location in locations
+                    if location.lat is not None
+                ]
+                kept = (resolved or locations)[0]
+                duplicates = [
+                    location.id for location in locations
+                    if location.id != kept.id
+                ]
+                self.stdout.write(
+                    f'{canonical_address}: keeping "{kept.address}", '
+                    f'removing {len(duplicates)}'
+                )
+                removed += len(duplicates)
+                if not options['dry_run']:
+                    Location.objects.filter(id__in=duplicates).delete()
+        verb = 'Would remove' if options['dry_run'] else 'Removed'
+        self.stdout.write(f'{verb} {removed} duplicate entries')
@@ -0,0 +1,39 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from location.tasks import process_due_tasks, schedule_refresh_of_expiring
+
+
+class Command(BaseCommand):
+    help = 'Geocodes addresses of new orders and restaurants in background'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument(
+            '--interval', type=float, default=5,
+            help='Pause in seconds when there are no due tasks',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Process due tasks and exit',
+        )
+
+    def handle(self, *args, **options):
+        swept_at = None
+        while True:
+            now = time.monotonic()
+            if swept_at is None \
+                    or now - swept_at >= settings.GEOCODE_SWEEP_INTERVAL:
+                swept_at = now
+                queued = schedule_refresh_of_expiring()
+                if queued:
+                    self.stdout.write(f'Queued refresh of {queued} addresses')
+            processed = process_due_tasks(options['batch_size'])
+            if processed:
+                self.stdout.write(f'Processed {processed} addresses')
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.15 on 2026-10-18 05:28
+
+from django.db import migrations, models
+
+from location.normalization import normalize_address
+
+
+def fill_canonical_addresses(apps, schema_editor):
+    Location = apps.get_model('location', 'Location')
+    locations = list(Location.objects.only('id', 'address'))
+    for location in locations:
+        location.canonical_address = normalize_address(location.address)
+    Location.objects.bulk_update(
+        locations, ['canonical_address'], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('location', '0003_geocodetask'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='canonical_address',
+            field=models.CharField(blank=True, db_index=True, max_length=200, verbose_name='Нормализованный адрес'),
+        ),
+        migrations.RunPython(
+            fill_canonical_addresses, migrations.RunPython.noop
+        ),
+    ]
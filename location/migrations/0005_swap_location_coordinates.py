@@ -0,0 +1,19 @@
+from django.db import migrations
+from django.db.models import F
+
+
+def swap_coordinates(apps, schema_editor):
+    """Geocoder answers "lon lat", but they were saved as lat and lon."""
+    Location = apps.get_model('location', 'Location')
+    Location.objects.update(lat=F('lon'), lon=F('lat'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('location', '0004_location_canonical_address'),
+    ]
+
+    operations = [
+        migrations.RunPython(swap_coordinates, swap_coordinates),
+    ]
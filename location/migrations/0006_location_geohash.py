@@ -0,0 +1,32 @@
+# Generated by Django 3.2.15 on 2026-10-18 05:32
+
+from django.db import migrations, models
+
+from location.geohash import encode
+
+
+def fill_geohashes(apps, schema_editor):
+    Location = apps.get_model('location', 'Location')
+    locations = list(
+        Location.objects.filter(lat__isnull=False, lon__isnull=False)
+        .only('id', 'lat', 'lon')
+    )
+    for location in locations:
+        location.geohash = encode(location.lat, location.lon)
+    Location.objects.bulk_update(locations, ['geohash'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('location', '0005_swap_location_coordinates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, max_length=12, verbose_name='Геохэш'),
+        ),
+        migrations.RunPython(fill_geohashes, migrations.RunPython.noop),
+    ]
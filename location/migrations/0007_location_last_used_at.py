@@ -0,0 +1,23 @@
+# Generated by Django 3.2.15 on 2026-10-18 05:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('location', '0006_location_geohash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='last_used_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Последнее использование'),
+        ),
+        migrations.AlterField(
+            model_name='location',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations
+
+from location.normalization import normalize_address
+
+
+def recompute_canonical_addresses(apps, schema_editor):
+    """Normalization now glues building parts and strips «д» prefix."""
+    Location = apps.get_model('location', 'Location')
+    locations = list(Location.objects.only('id', 'address'))
+    for location in locations:
+        location.canonical_address = normalize_address(location.address)
+    Location.objects.bulk_update(
+        locations, ['canonical_address'], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('location', '0007_location_last_used_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            recompute_canonical_addresses, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.15 on 2026-10-18 05:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('location', '0008_recompute_canonical_addresses'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='geocodetask',
+            name='refresh',
+            field=models.BooleanField(default=False, help_text='Геокодировать заново, даже если координаты известны', verbose_name='Обновить координаты'),
+        ),
+    ]
@@ -1,4 +1,109 @@
-from django.db import models
+import math
+import sqlite3
+
+from django.db import connections, models
+from django.db.models import Q
+from django.utils import timezone
+
+from location import geohash
+from location.normalization import normalize_address
+
+KM_PER_DEGREE = 111.32
+UPSERT_BATCH_SIZE = 100
+UPSERT_FIELDS = (
+    'address', 'canonical_address', 'lat', 'lon', 'geohash',
+    'created_at', 'updated_at',
+)
+UPDATED_ON_CONFLICT_FIELDS = ('lat', 'lon', 'geohash', 'updated_at')
+
+
+def supports_upsert(connection) -> bool:
+    if connection.vendor == 'postgresql':
+        return True
+    return connection.vendor == 'sqlite' \
+        and sqlite3.sqlite_version_info >= (3, 24)
+
+
+class LocationQuerySet(models.QuerySet):
+    def upsert_coordinates(self, address_coordinates: dict):
+        """Inserts or updates coordinates of many addresses at once.
+
+        Runs INSERT ... ON CONFLICT DO UPDATE in batches, which both
+        SQLite and PostgreSQL support. Other databases fall back to
+        update_or_create() per address.
+        """
+        connection = connections[self.db]
+        if not supports_upsert(connection):
+            for address, (lat, lon) in address_coordinates.items():
+                self.update_or_create(
+                    address=address, defaults={'lat': lat, 'lon': lon}
+                )
+            return
+
+        now = timezone.now()
+        fields = [self.model._meta.get_field(name) for name in UPSERT_FIELDS]
+        rows = [
+            [
+                field.get_db_prep_save(value, connection)
+                for field, value in zip(fields, (
+                    address, normalize_address(address), lat, lon,
+                    get_geohash(lat, lon), now, now,
+                ))
+            ]
+            for address, (lat, lon) in address_coordinates.items()
+        ]
+        quote_name = connection.ops.quote_name
+        columns = ', '.join(quote_name(field.column) for field in fields)
+        updates = ', '.join(
+            f'{quote_name(name)} = EXCLUDED.{quote_name(name)}'
+            for name in UPDATED_ON_CONFLICT_FIELDS
+        )
+        placeholders = '(' + ', '.join(['%s'] * len(fields)) + ')'
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+                batch = rows[start:start + UPSERT_BATCH_SIZE]
+                cursor.execute(
+                    f'INSERT INTO {quote_name(self.model._meta.db_table)} '
+                    f'({columns}) VALUES '
+                    f'{", ".join([placeholders] * len(batch))} '
+                    f'ON CONFLICT ({quote_name("address")}) '
+                    f'DO UPDATE SET {updates}',
+                    [value for row in batch for value in row],
+                )
+
+    def in_geohash_cells(self, cells):
+        """Filters by geohash prefixes with index range scans."""
+        condition = Q(pk__in=[])
+        for cell in cells:
+            cell_condition = Q(geohash__gte=cell)
+            upper_bound = geohash.get_prefix_upper_bound(cell)
+            if upper_bound:
+                cell_condition &= Q(geohash__lt=upper_bound)
+            condition |= cell_condition
+        return self.filter(condition)
+
+    def in_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        cells = geohash.cover_bbox(min_lat, min_lon, max_lat, max_lon)
+        return self.in_geohash_cells(cells).filter(
+            lat__range=(min_lat, max_lat),
+            lon__range=(min_lon, max_lon),
+        )
+
+    def near(self, lat, lon, radius_km):
+        """Filters by bbox around the point, to be refined by distance."""
+        lat_delta = radius_km / KM_PER_DEGREE
+        lon_delta = radius_km / (
+            KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01)
+        )
+        return self.in_bbox(
+            lat - lat_delta, lon - lon_delta,
+            lat + lat_delta, lon + lon_delta
+        )
+
+    def neighbours_of(self, lat, lon, precision=6):
+        """Filters by geohash cell of the point and 8 cells around it."""
+        cell = geohash.encode(lat, lon, precision)
+        return self.in_geohash_cells([cell, *geohash.neighbours(cell)])
 
 
 class Location(models.Model):
@@ -8,7 +113,59 @@ class Location(models.Model):
         db_index=True,
         unique=True
     )
+    canonical_address = models.CharField(
+        'Нормализованный адрес',
+        max_length=200,
+        db_index=True,
+        blank=True
+    )
     lat = models.FloatField('Широта', null=True)
     lon = models.FloatField('Долгота', null=True)
+    geohash = models.CharField(
+        'Геохэш',
+        max_length=12,
+        db_index=True,
+        blank=True
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    last_used_at = models.DateTimeField(
+        'Последнее использование',
+        null=True,
+        blank=True,
+        db_index=True
+    )
+
+    objects = LocationQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        self.canonical_address = normalize_address(self.address)
+        self.geohash = get_geohash(self.lat, self.lon)
+        super().save(*args, **kwargs)
+
+
+def get_geohash(lat, lon) -> str:
+    if lat is None or lon is None:
+        return ''
+    return geohash.encode(lat, lon)
+
+
+class GeocodeTask(models.Model):
+    address = models.CharField(
+        'Адрес',
+        max_length=100,
+        unique=True
+    )
+    attempts = models.PositiveSmallIntegerField('Попыток', default=0)
+    next_attempt_at = models.DateTimeField(
+        'Следующая попытка',
+        default=timezone.now,
+        db_index=True
+    )
+    last_error = models.TextField('Последняя ошибка', blank=True)
+    refresh = models.BooleanField(
+        'Обновить координаты',
+        default=False,
+        help_text='Геокодировать заново, даже если координаты известны'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
@@ -0,0 +1,150 @@
+import re
+
+
+ABBREVIATIONS = {
+    'город': 'г',
+    'улица': 'ул',
+    'проспект': 'пр-кт',
+    'просп': 'пр-кт',
+    'пр-т': 'пр-кт',
+    'переулок': 'пер',
+    'пер-к': 'пер',
+    'шоссе': 'ш',
+    'бульвар': 'б-р',
+    'бул': 'б-р',
+    'площадь': 'пл',
+    'набережная': 'наб',
+    'проезд': 'проезд',
+    'пр-д': 'проезд',
+    'тупик': 'туп',
+    'аллея': 'ал',
+    'микрорайон': 'мкр',
+    'мкрн': 'мкр',
+    'область': 'обл',
+    'район': 'р-н',
+    'дом': 'д',
+    'корпус': 'к',
+    'корп': 'к',
+    'строение': 'с',
+    'стр': 'с',
+    'квартира': 'кв',
+}
+STREET_TYPES = {
+    'ул', 'пр-кт', 'пер', 'ш', 'б-р', 'пл', 'наб', 'проезд', 'туп', 'ал',
+    'мкр',
+}
+DROPPED_TOKENS = {'г', 'д'}
+HOUSE_PARTS = {'к', 'с'}
+
+COMPONENT_SEPARATOR = ','
+PUNCTUATION_RE = re.compile(r'[^\w\s,-]')
+# Letters к and с are building parts, е, й and я end ordinals like «2-я»
+HOUSE_LETTER_RE = re.compile(r'\b(\d+)\s*-?\s*([абвгджзи])\b')
+HOUSE_PREFIX_RE = re.compile(r'^д(?=\d)')
+NUMBER_RE = re.compile(r'^\d+[а-я]?([кс]\d+[а-я]?)*$')
+HOUSE_PART_RE = re.compile(r'^[кс]\d+[а-я]?$')
+PLAIN_NUMBER_RE = re.compile(r'^\d+[а-я]?$')
+ADJECTIVE_RE = re.compile(r'^[а-я-]+(ый|ий|ой|ая|яя|ое|ее)$')
+ORDINAL_RE = re.compile(r'^\d+-(й|я|е|ой|ий|ый|ая|ое|го)$')
+
+
+def is_number(token: [str, None]) -> bool:
+    return bool(token and NUMBER_RE.match(token))
+
+
+def is_ordinal(token: [str, None]) -> bool:
+    return bool(token and ORDINAL_RE.match(token))
+
+
+def is_name(token: [str, None]) -> bool:
+    return bool(token) and token not in STREET_TYPES \
+        and not is_number(token)
+
+
+def normalize_tokens(tokens: list) -> list:
+    normalized = []
+    for token in tokens:
+        token = token.strip('-')
+        token = HOUSE_PREFIX_RE.sub('', ABBREVIATIONS.get(token, token))
+        if token and token not in DROPPED_TOKENS:
+            normalized.append(token)
+    return normalized
+
+
+def put_street_type_first(tokens: list) -> list:
+    """Moves street type before the street name it follows.
+
+    The name is one word with adjectives and ordinals before it, like
+    «Новый Арбат» or «2-я Тверская-Ямская». Ordinals are put first,
+    so «Тверская-Ямская 2-я ул» gives «ул 2-я тверская-ямская» too.
+    """
+    tokens = list(tokens)
+    for position, token in enumerate(tokens):
+        if token not in STREET_TYPES or not position:
+            continue
+        next_token = tokens[position + 1] \
+            if position + 1 < len(tokens) else None
+        if is_name(next_token):
+            continue
+        start = position
+        while start and is_ordinal(tokens[start - 1]):
+            start -= 1
+        if start and is_name(tokens[start - 1]):
+            start -= 1
+            while start and is_name(tokens[start - 1]) and (
+                is_ordinal(tokens[start - 1])
+                or ADJECTIVE_RE.match(tokens[start - 1])
+            ):
+                start -= 1
+        if start == position:
+            continue
+        tokens[start:position + 1] = [token, *tokens[start:position]]
+
+    for position, token in enumerate(tokens):
+        if token in STREET_TYPES:
+            name = []
+            end = position + 1
+            while end < len(tokens) and is_name(tokens[end]) \
+                    and len(name) < 3:
+                name.append(tokens[end])
+                end += 1
+            tokens[position + 1:end] = sorted(
+                name, key=lambda name_token: not is_ordinal(name_token)
+            )
+    return tokens
+
+
+def glue_house_parts(tokens: list) -> list:
+    """Glues «1 к 2», «1 к2» and «1 с 3» into «1к2» and «1с3»."""
+    glued = []
+    for token in tokens:
+        if glued and is_number(glued[-1]) and HOUSE_PART_RE.match(token):
+            glued[-1] += token
+            continue
+        if len(glued) > 1 and glued[-1] in HOUSE_PARTS \
+                and is_number(glued[-2]) and PLAIN_NUMBER_RE.match(token):
+            house_part = glued.pop()
+            glued[-1] += house_part + token
+            continue
+        glued.append(token)
+    return glued
+
+
+def normalize_address(address: str) -> str:
+    """Returns canonical form of address used as geocoding cache key.
+
+    Folds case and «ё», drops punctuation, brings common Russian
+    abbreviations to one form, drops «г.» and «д.» markers, glues
+    house letters and building parts to numbers and puts street type
+    before the street name. For example «Москва, ул. Тверская 1» and
+    «москва  Тверская улица, д.1» both give «москва ул тверская 1».
+    """
+    address = address.casefold().replace('ё', 'е')
+    address = PUNCTUATION_RE.sub(' ', address)
+    address = HOUSE_LETTER_RE.sub(r'\1\2', address)
+    tokens = []
+    for component in address.split(COMPONENT_SEPARATOR):
+        tokens.extend(put_street_type_first(
+            normalize_tokens(component.split())
+        ))
+    return ' '.join(glue_house_parts(tokens))
@@ -0,0 +1,124 @@
+import threading
+import time
+from collections import Counter, deque
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """Stops calls to a failing service for a while.
+
+    After failure_threshold consecutive failures the breaker opens and
+    rejects calls for reset_timeout seconds. Then a single trial call
+    is let through: success closes the breaker, failure opens it again.
+    A trial call not reported within reset_timeout is given up and the
+    next call becomes the trial.
+    """
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.trial_started_at = None
+        self.times_opened = 0
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == OPEN and \
+                    now - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self.trial_started_at = now
+                return True
+            if self.state == HALF_OPEN and \
+                    now - self.trial_started_at >= self.reset_timeout:
+                self.trial_started_at = now
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.state = CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN \
+                    or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.times_opened += 1
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def get_state(self) -> dict:
+        with self.lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'times_opened': self.times_opened,
+            }
+
+
+class CallMetrics:
+    """Call counters and latency percentiles of recent calls."""
+    def __init__(self, window: int = 1000):
+        self.counters = Counter()
+        self.latencies = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def count(self, name: str, value: int = 1):
+        with self.lock:
+            self.counters[name] += value
+
+    def observe(self, seconds: float):
+        with self.lock:
+            self.latencies.append(seconds)
+
+    def get_state(self) -> dict:
+        with self.lock:
+            latencies = sorted(self.latencies)
+            counters = dict(self.counters)
+        if not latencies:
+            return {**counters, 'latency': None}
+        return {
+            **counters,
+            'latency': {
+                'count': len(latencies),
+                'avg': sum(latencies) / len(latencies),
+                'p50': latencies[len(latencies) // 2],
+                'p95': latencies[int(len(latencies) * 0.95)],
+                'max': latencies[-1],
+            },
+        }
+
+
+class RateLimiter:
+    """Token bucket shared by all threads of the process."""
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.burst,
+                    self.tokens + (now - self.updated_at) * self.rate
+                )
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
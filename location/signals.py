@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Sent with address_coordinates argument when addresses got coordinates,
+# either geocoded and saved or found already known by the geocode worker
+addresses_located = Signal()
@@ -0,0 +1,113 @@
+import math
+from collections import defaultdict
+
+import numpy as np
+
+from location.distances import haversine_matrix
+
+KM_PER_DEGREE = 111.32
+
+
+class GridIndex:
+    """In-memory spatial index of points on a regular lat/lon grid.
+
+    Points are bucketed into cells about cell_km wide, so radius and
+    k-nearest queries look only at cells around the query point
+    instead of all points. Fits city scale, where cell width in
+    degrees of longitude is taken at the mean latitude of points.
+    """
+    def __init__(self, points: dict, cell_km: float = 2):
+        self.cell_km = cell_km
+        self.keys = list(points)
+        self.coordinates = np.asarray(
+            [points[key] for key in self.keys], dtype=float
+        ).reshape(-1, 2)
+        mean_lat = float(self.coordinates[:, 0].mean()) \
+            if len(self.keys) else 0
+        self.lat_step = cell_km / KM_PER_DEGREE
+        self.lon_step = cell_km / (
+            KM_PER_DEGREE * max(math.cos(math.radians(mean_lat)), 0.01)
+        )
+        self.cells = defaultdict(list)
+        for position, (lat, lon) in enumerate(self.coordinates):
+            self.cells[self.get_cell(lat, lon)].append(position)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def get_cell(self, lat: float, lon: float) -> tuple:
+        return math.floor(lat / self.lat_step), math.floor(lon / self.lon_step)
+
+    def _ring_positions(self, cell: tuple, ring: int) -> list:
+        """Returns positions of points in cells on the ring's perimeter."""
+        row, column = cell
+        if ring == 0:
+            return list(self.cells.get(cell, []))
+        ring_cells = [
+            (cell_row, cell_column)
+            for cell_row in (row - ring, row + ring)
+            for cell_column in range(column - ring, column + ring + 1)
+        ] + [
+            (cell_row, cell_column)
+            for cell_row in range(row - ring + 1, row + ring)
+            for cell_column in (column - ring, column + ring)
+        ]
+        positions = []
+        for ring_cell in ring_cells:
+            positions.extend(self.cells.get(ring_cell, []))
+        return positions
+
+    def get_positions_near(self, cell: tuple, radius_km: float) -> list:
+        """Returns positions of points that may be within radius of cell.
+
+        Covers every point within radius_km of any point of the cell,
+        with some points farther away, so callers filter by distance.
+        """
+        rings = math.ceil(radius_km / self.cell_km) + 1
+        positions = []
+        for ring in range(rings + 1):
+            positions.extend(self._ring_positions(cell, ring))
+        return positions
+
+    def _measure(self, point: tuple, positions: list) -> list:
+        if not positions:
+            return []
+        distances = haversine_matrix(
+            [point], self.coordinates[positions]
+        )[0]
+        return [
+            (float(distance), self.keys[position])
+            for distance, position in zip(distances, positions)
+        ]
+
+    def within_radius(self, point: tuple, radius_km: float) -> list:
+        """Returns (distance, key) of points within radius, nearest first."""
+        positions = self.get_positions_near(self.get_cell(*point), radius_km)
+        return sorted(
+            (distance, key)
+            for distance, key in self._measure(point, positions)
+            if distance <= radius_km
+        )
+
+    def nearest(self, point: tuple, k: int,
+                max_radius_km: float = None) -> list:
+        """Returns (distance, key) of up to k nearest points."""
+        cell = self.get_cell(*point)
+        found = []
+        seen = 0
+        ring = 0
+        while seen < len(self.keys):
+            ring_positions = self._ring_positions(cell, ring)
+            seen += len(ring_positions)
+            found.extend(self._measure(point, ring_positions))
+            found.sort()
+            # everything closer than this is already found
+            covered_km = ring * self.cell_km
+            if max_radius_km is not None and covered_km >= max_radius_km:
+                break
+            if len(found) >= k and found[k - 1][0] <= covered_km:
+                break
+            ring += 1
+        if max_radius_km is not None:
+            found = [item for item in found if item[0] <= max_radius_km]
+        return found[:k]
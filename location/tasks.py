@@ -0,0 +1,215 @@
+import logging
+import random
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from location.backends import GeocoderUnavailable
+from location.cache import geocode_cache
+from location.geofunctions import get_coordinates_batch
+from location.models import GeocodeTask, Location
+from location.signals import addresses_located
+
+
+logger = logging.getLogger(__name__)
+
+TASK_LEASE = timedelta(minutes=5)
+
+
+def get_retry_delay(attempts: int) -> timedelta:
+    """Exponential backoff with full jitter."""
+    delay = min(
+        settings.GEOCODE_RETRY_BASE_DELAY * 2 ** attempts,
+        settings.GEOCODE_RETRY_MAX_DELAY,
+    )
+    return timedelta(seconds=random.uniform(delay / 2, delay))
+
+
+def schedule_geocoding(addresses):
+    """Creates tasks locating addresses in background.
+
+    Addresses already known are not geocoded again, but the worker
+    still sends addresses_located for them, so receivers react the
+    same way to new and known addresses. Call it from
+    transaction.on_commit(), so tasks are scheduled only for committed
+    data.
+    """
+    addresses = set(filter(None, addresses))
+    if not addresses:
+        return
+    GeocodeTask.objects.bulk_create(
+        [GeocodeTask(address=address) for address in addresses],
+        ignore_conflicts=True,
+    )
+    if settings.GEOCODE_WORKER_IN_PROCESS:
+        get_worker().wake_up()
+
+
+def schedule_refresh_of_expiring(limit: int = 500) -> int:
+    """Queues refresh of recently used locations close to expiry.
+
+    Locations expiring within GEOCODE_REFRESH_AHEAD and used within
+    GEOCODE_REFRESH_RECENTLY_USED are re-geocoded before readers get
+    stale coordinates. Returns number of queued addresses.
+    """
+    now = timezone.now()
+    expiring_before = now - timedelta(
+        seconds=settings.GEOCODE_CACHE_POSITIVE_TTL
+        - settings.GEOCODE_REFRESH_AHEAD
+    )
+    used_after = now - timedelta(
+        seconds=settings.GEOCODE_REFRESH_RECENTLY_USED
+    )
+    addresses = list(
+        Location.objects
+        .filter(updated_at__lte=expiring_before, last_used_at__gte=used_after)
+        .order_by('updated_at')
+        .values_list('address', flat=True)[:limit]
+    )
+    GeocodeTask.objects.bulk_create(
+        [GeocodeTask(address=address, refresh=True) for address in addresses],
+        ignore_conflicts=True,
+    )
+    return len(addresses)
+
+
+def claim_due_tasks(limit: int) -> list:
+    """Leases due tasks, so concurrent workers don't take them twice.
+
+    Where the database can't skip locked rows, like SQLite, every task
+    is leased by a conditional update, which matches only while no
+    other worker has moved its next attempt.
+    """
+    now = timezone.now()
+    lease_until = now + TASK_LEASE
+    due_tasks = GeocodeTask.objects\
+        .filter(next_attempt_at__lte=now)\
+        .order_by('next_attempt_at')
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            tasks = list(due_tasks.select_for_update(skip_locked=True)[:limit])
+            GeocodeTask.objects\
+                .filter(id__in=[task.id for task in tasks])\
+                .update(next_attempt_at=lease_until)
+        return tasks
+
+    claimed_tasks = []
+    for task in due_tasks[:limit]:
+        claimed = GeocodeTask.objects\
+            .filter(id=task.id, next_attempt_at=task.next_attempt_at)\
+            .update(next_attempt_at=lease_until)
+        if claimed:
+            claimed_tasks.append(task)
+    return claimed_tasks
+
+
+def process_due_tasks(limit: int = 50) -> int:
+    """Locates addresses of one batch of due tasks.
+
+    Addresses found in geocode cache are announced with
+    addresses_located right away, unless the task asks for refresh.
+    The rest are geocoded by get_coordinates_batch, which saves them
+    to Location. Tasks of resolved addresses are removed.
+    Failed tasks are rescheduled with backoff, tasks that exhausted
+    GEOCODE_MAX_ATTEMPTS are dropped. Tasks rejected by the open circuit
+    breaker are postponed without spending an attempt.
+    """
+    tasks = claim_due_tasks(limit)
+    if not tasks:
+        return 0
+
+    known_coordinates = geocode_cache.get_many(
+        [task.address for task in tasks if not task.refresh]
+    )
+    if known_coordinates:
+        addresses_located.send(
+            sender=GeocodeTask, address_coordinates=known_coordinates
+        )
+
+    fetched_coordinates, failures = get_coordinates_batch([
+        task.address for task in tasks
+        if task.address not in known_coordinates
+    ])
+    coordinates = {**known_coordinates, **fetched_coordinates}
+
+    now = timezone.now()
+    finished_task_ids = []
+    failed_tasks = []
+    for task in tasks:
+        if task.address in coordinates:
+            finished_task_ids.append(task.id)
+            continue
+        error = failures.get(task.address)
+        task.last_error = repr(error)
+        if isinstance(error, GeocoderUnavailable):
+            task.next_attempt_at = now + timedelta(
+                seconds=settings.GEOCODER_BREAKER_RESET_TIMEOUT
+            )
+            failed_tasks.append(task)
+            continue
+        task.attempts += 1
+        if task.attempts >= settings.GEOCODE_MAX_ATTEMPTS:
+            logger.warning(
+                'Geocoding of %s failed %s times, giving up: %s',
+                task.address, task.attempts, task.last_error,
+            )
+            finished_task_ids.append(task.id)
+            continue
+        task.next_attempt_at = now + get_retry_delay(task.attempts)
+        failed_tasks.append(task)
+
+    GeocodeTask.objects.filter(id__in=finished_task_ids).delete()
+    GeocodeTask.objects.bulk_update(
+        failed_tasks, ['attempts', 'last_error', 'next_attempt_at']
+    )
+    return len(tasks)
+
+
+class GeocodeWorker(threading.Thread):
+    """Background thread of a web process that processes due tasks.
+
+    Every GEOCODE_SWEEP_INTERVAL it also queues refresh of locations
+    that are about to expire.
+    """
+    def __init__(self, interval: float):
+        super().__init__(name='geocode-worker', daemon=True)
+        self.interval = interval
+        self.event = threading.Event()
+        self.swept_at = None
+
+    def wake_up(self):
+        self.event.set()
+
+    def run(self):
+        while True:
+            self.event.wait(self.interval)
+            self.event.clear()
+            try:
+                now = time.monotonic()
+                if self.swept_at is None or now - self.swept_at \
+                        >= settings.GEOCODE_SWEEP_INTERVAL:
+                    self.swept_at = now
+                    schedule_refresh_of_expiring()
+                while process_due_tasks():
+                    pass
+            except Exception:
+                logger.exception('Geocode worker failed')
+            finally:
+                close_old_connections()
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_worker() -> GeocodeWorker:
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = GeocodeWorker(settings.GEOCODE_WORKER_INTERVAL)
+            _worker.start()
+    return _worker
@@ -1,3 +1,906 @@
-from django.test import TestCase
+import json
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import requests
+from django.apps import apps
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import (
+    SimpleTestCase, TestCase, override_settings, skipIfDBFeature
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from geopy import distance
+
+from location import backends, geohash
+from location.backends import (
+    GeocoderError, LocalGeocoder, YandexGeocoder, get_geocoder
+)
+from location.cache import GeocodeCache, LRUCache, get_shared_key
+from location.distances import geodesic_matrix, haversine_matrix
+from location.geofunctions import (
+    fetch_coordinates, geocode_addresses, save_coordinates
+)
+from location.models import GeocodeTask, Location
+from location.normalization import normalize_address
+from location.resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from location.spatial import GridIndex
+from location.tasks import (
+    claim_due_tasks, process_due_tasks, schedule_refresh_of_expiring
+)
+
+
+SAME_ADDRESS_VARIANTS = [
+    (
+        'москва ул тверская 1',
+        [
+            'Москва, ул. Тверская 1',
+            'москва  Тверская улица, д.1',
+            'Москва, улица Тверская, дом 1',
+            'г. Москва, Тверская ул., д. 1',
+            'Москва, ул. Тверская, д1',
+        ],
+    ),
+    (
+        'москва ул тверская 1к2',
+        [
+            'Москва, ул. Тверская, д. 1, корп. 2',
+            'Москва, ул. Тверская, д. 1 корп. 2',
+            'Москва, ул. Тверская 1 к 2',
+            'Москва, ул. Тверская 1к2',
+            'Москва, ул. Тверская, д1 к2',
+            'Москва, ул. Тверская, дом 1, корпус 2',
+        ],
+    ),
+    (
+        'москва ул новый арбат 10с1',
+        [
+            'Москва, ул. Новый Арбат, 10 стр. 1',
+            'Москва, Новый Арбат ул, д 10с1',
+            'Москва, улица Новый Арбат, дом 10, строение 1',
+        ],
+    ),
+    (
+        'москва пр-кт ленинский 32а',
+        [
+            'Москва, Ленинский проспект, 32а',
+            'москва ленинский пр-т 32 А',
+            'Москва, просп. Ленинский, д. 32-а',
+        ],
+    ),
+    (
+        'москва ул 2-я тверская-ямская 10',
+        [
+            'Москва, 2-я Тверская-Ямская ул., 10',
+            'Москва, ул. 2-я Тверская-Ямская, д. 10',
+            'Москва, Тверская-Ямская 2-я ул, 10',
+            'Москва, ул. Тверская-Ямская 2-я, д.10',
+        ],
+    ),
+    (
+        'москва пер 3-й люсиновский 5',
+        [
+            'Москва, 3-й Люсиновский переулок, 5',
+            'москва пер. 3-й Люсиновский д 5',
+        ],
+    ),
+    (
+        'санкт-петербург пр-кт невский 28',
+        [
+            'Санкт-Петербург, Невский пр-т, 28',
+            'г. Санкт-Петербург, Невский проспект, д. 28',
+            'САНКТ-ПЕТЕРБУРГ НЕВСКИЙ ПРОСПЕКТ 28',
+        ],
+    ),
+    (
+        'москва ул щербаковская 3',
+        [
+            'Москва, Щербаковская улица, 3',
+            'москва, ул. щербаковская, д.3',
+        ],
+    ),
+    (
+        'москва ул семеновская 1',
+        [
+            'Москва, Семёновская ул., 1',
+            'Москва, улица Семеновская, 1',
+        ],
+    ),
+]
+
+DIFFERENT_ADDRESSES = [
+    ('Москва, ул. Тверская 1', 'Москва, ул. Тверская 1к2'),
+    ('Москва, ул. Тверская 1к2', 'Москва, ул. Тверская 1с2'),
+    ('Москва, ул. Тверская 1а', 'Москва, ул. Тверская 1б'),
+    ('Москва, 2-я Тверская-Ямская 10', 'Москва, 3-я Тверская-Ямская 10'),
+]
+
+
+class NormalizeAddressTest(SimpleTestCase):
+    def test_variants_share_canonical_form(self):
+        for canonical_address, variants in SAME_ADDRESS_VARIANTS:
+            for variant in variants:
+                with self.subTest(variant=variant):
+                    self.assertEqual(
+                        normalize_address(variant), canonical_address
+                    )
+
+    def test_different_addresses_stay_different(self):
+        for address, other_address in DIFFERENT_ADDRESSES:
+            with self.subTest(address=address, other_address=other_address):
+                self.assertNotEqual(
+                    normalize_address(address),
+                    normalize_address(other_address),
+                )
+
+    def test_normalization_is_idempotent(self):
+        for canonical_address, variants in SAME_ADDRESS_VARIANTS:
+            with self.subTest(canonical_address=canonical_address):
+                self.assertEqual(
+                    normalize_address(canonical_address), canonical_address
+                )
+
+
+def make_response(status_code: int, pos: str = '37.6 55.7'):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = (
+        '{"response": {"GeoObjectCollection": {"featureMember": '
+        '[{"GeoObject": {"Point": {"pos": "%s"}}}]}}}' % pos
+    ).encode()
+    return response
+
+
+@mock.patch('location.backends.time.sleep')
+@mock.patch('location.backends.geocoder_rate_limiter')
+class YandexGeocoderTest(SimpleTestCase):
+    def setUp(self):
+        self.geocoder = YandexGeocoder(
+            apikey='key', retries=2, retry_backoff=0.01
+        )
+        self.geocoder.session = mock.Mock()
+
+    def test_parses_coordinates(self, rate_limiter, sleep):
+        self.geocoder.session.get.return_value = make_response(200)
+        self.assertEqual(self.geocoder.geocode('Москва'), (55.7, 37.6))
+
+    def test_malformed_position_is_geocoder_error(self, rate_limiter, sleep):
+        for pos in ['', '37.6', 'east north']:
+            with self.subTest(pos=pos):
+                self.geocoder.session.get.return_value = make_response(
+                    200, pos
+                )
+                with self.assertRaises(GeocoderError):
+                    self.geocoder.geocode('Москва')
+
+    def test_every_attempt_takes_rate_limiter_token(self, rate_limiter,
+                                                    sleep):
+        self.geocoder.session.get.side_effect = [
+            make_response(503), requests.Timeout(), make_response(200),
+        ]
+        self.assertEqual(self.geocoder.geocode('Москва'), (55.7, 37.6))
+        self.assertEqual(rate_limiter.acquire.call_count, 3)
+
+
+class GeocodeAddressesTest(SimpleTestCase):
+    @mock.patch('location.geofunctions.fetch_coordinates')
+    def test_unexpected_error_does_not_abort_batch(self, fetch_coordinates):
+        def fetch(address):
+            if address == 'broken':
+                raise RuntimeError('bug in the backend')
+            return 55.7, 37.6
+
+        fetch_coordinates.side_effect = fetch
+        with self.assertLogs('location.geofunctions', 'ERROR'):
+            coordinates, failures = geocode_addresses(['good', 'broken'])
+        self.assertEqual(coordinates, {'good': (55.7, 37.6)})
+        self.assertEqual(failures, {'broken': None})
+
+    @mock.patch('location.geofunctions.fetch_coordinates')
+    def test_pool_size_resolved_from_settings(self, fetch_coordinates):
+        fetch_coordinates.return_value = 55.7, 37.6
+        with self.settings(GEOCODER_MAX_WORKERS=1), mock.patch(
+            'location.geofunctions.ThreadPoolExecutor',
+            wraps=ThreadPoolExecutor,
+        ) as executor_class:
+            coordinates, failures = geocode_addresses(['first', 'second'])
+        executor_class.assert_called_once_with(max_workers=1)
+        self.assertEqual(len(coordinates), 2)
+        self.assertEqual(failures, {})
+
+
+class ClaimDueTasksTest(TestCase):
+    def setUp(self):
+        for address in ['Москва, Тверская 1', 'Москва, Арбат 2']:
+            GeocodeTask.objects.create(
+                address=address, next_attempt_at=timezone.now()
+            )
+
+    def test_claimed_tasks_are_leased(self):
+        self.assertEqual(len(claim_due_tasks(10)), 2)
+        self.assertEqual(claim_due_tasks(10), [])
+
+    @skipIfDBFeature('has_select_for_update_skip_locked')
+    def test_task_claimed_by_other_worker_is_skipped(self):
+        seen_tasks = list(GeocodeTask.objects.order_by('next_attempt_at'))
+        # Other worker leases the first task after this one has read it
+        GeocodeTask.objects.filter(id=seen_tasks[0].id).update(
+            next_attempt_at=timezone.now()
+        )
+        filter_tasks = GeocodeTask.objects.filter
+
+        def filter_seen_tasks(*args, **kwargs):
+            if 'next_attempt_at__lte' in kwargs:
+                return mock.Mock(order_by=mock.Mock(return_value=seen_tasks))
+            return filter_tasks(*args, **kwargs)
+
+        with mock.patch.object(
+            GeocodeTask.objects, 'filter', side_effect=filter_seen_tasks
+        ):
+            claimed_tasks = claim_due_tasks(10)
+        self.assertEqual(
+            [task.id for task in claimed_tasks], [seen_tasks[1].id]
+        )
+
+
+class GridIndexTest(SimpleTestCase):
+    def setUp(self):
+        generator = random.Random(0)
+        self.points = {
+            key: (generator.uniform(55.5, 56), generator.uniform(37.2, 38))
+            for key in range(300)
+        }
+        self.queries = [
+            (generator.uniform(55.4, 56.1), generator.uniform(37.1, 38.1))
+            for _ in range(30)
+        ]
+        self.grid = GridIndex(self.points, cell_km=2)
+
+    def measure_all(self, point: tuple) -> list:
+        distances = haversine_matrix([point], list(self.points.values()))[0]
+        return sorted(zip(distances.tolist(), self.points))
+
+    def test_within_radius_matches_brute_force(self):
+        for point in self.queries:
+            for radius_km in [0.5, 3, 7.5]:
+                with self.subTest(point=point, radius_km=radius_km):
+                    expected = [
+                        key for distance, key in self.measure_all(point)
+                        if distance <= radius_km
+                    ]
+                    found = self.grid.within_radius(point, radius_km)
+                    self.assertEqual([key for _, key in found], expected)
+
+    def test_nearest_matches_brute_force(self):
+        for point in self.queries:
+            for k in [1, 5, 20]:
+                with self.subTest(point=point, k=k):
+                    expected = [key for _, key in self.measure_all(point)[:k]]
+                    found = self.grid.nearest(point, k)
+                    self.assertEqual([key for _, key in found], expected)
+
+    def test_nearest_within_radius(self):
+        point = self.queries[0]
+        expected = [
+            key for distance, key in self.measure_all(point)
+            if distance <= 4
+        ][:10]
+        found = self.grid.nearest(point, 10, max_radius_km=4)
+        self.assertEqual([key for _, key in found], expected)
+
+    def test_empty_index(self):
+        grid = GridIndex({})
+        self.assertEqual(grid.within_radius((55.7, 37.6), 10), [])
+        self.assertEqual(grid.nearest((55.7, 37.6), 3), [])
+
+
+@mock.patch('location.resilience.time.monotonic')
+class CircuitBreakerTest(SimpleTestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+
+    def open_breaker(self, monotonic):
+        monotonic.return_value = 100
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+
+    def test_opens_after_threshold_and_lets_trial_through(self, monotonic):
+        self.open_breaker(monotonic)
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertFalse(self.breaker.allow())
+
+        monotonic.return_value = 130
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.assertFalse(self.breaker.allow())
+
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_lost_trial_is_given_up(self, monotonic):
+        self.open_breaker(monotonic)
+        monotonic.return_value = 130
+        self.assertTrue(self.breaker.allow())
+
+        monotonic.return_value = 159
+        self.assertFalse(self.breaker.allow())
+        monotonic.return_value = 160
+        self.assertTrue(self.breaker.allow())
+
+
+class FetchCoordinatesTest(SimpleTestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        patcher = mock.patch(
+            'location.geofunctions.geocoder_breaker', self.breaker
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @mock.patch('location.geofunctions.get_geocoder')
+    def test_unexpected_error_of_trial_call_reopens_breaker(self,
+                                                           get_geocoder):
+        self.breaker.record_failure()
+        get_geocoder.return_value.geocode.side_effect = TypeError('fixture')
+
+        with self.assertRaises(TypeError):
+            fetch_coordinates('Москва, Тверская 1')
+        self.assertEqual(self.breaker.state, OPEN)
+
+        get_geocoder.return_value.geocode.side_effect = None
+        get_geocoder.return_value.geocode.return_value = (55.7, 37.6)
+        self.assertEqual(fetch_coordinates('Москва, Тверская 1'), (55.7, 37.6))
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    @mock.patch('location.geofunctions.get_geocoder')
+    def test_misconfigured_geocoder_counts_as_failure(self, get_geocoder):
+        get_geocoder.side_effect = ImproperlyConfigured('no backend')
+
+        with self.assertRaises(ImproperlyConfigured):
+            fetch_coordinates('Москва, Тверская 1')
+        self.assertEqual(self.breaker.state, OPEN)
+
+
+class ProcessDueTasksTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    @mock.patch('location.geofunctions.fetch_coordinates')
+    def test_spellings_of_one_address_are_geocoded_once(self,
+                                                        fetch_coordinates):
+        fetch_coordinates.return_value = 55.7576, 37.6136
+        addresses = ['Москва, ул. Тверская, д. 1', 'москва тверская улица 1']
+        for address in addresses:
+            GeocodeTask.objects.create(address=address)
+
+        self.assertEqual(process_due_tasks(), 2)
+
+        fetch_coordinates.assert_called_once()
+        self.assertFalse(GeocodeTask.objects.exists())
+        self.assertEqual(
+            set(Location.objects.values_list('address', 'lat', 'lon')),
+            {(address, 55.7576, 37.6136) for address in addresses},
+        )
+
+    @mock.patch('location.geofunctions.fetch_coordinates')
+    def test_failed_task_is_rescheduled(self, fetch_coordinates):
+        fetch_coordinates.side_effect = GeocoderError('timeout')
+        task = GeocodeTask.objects.create(address='Москва, Арбат 2')
+
+        process_due_tasks()
+
+        task.refresh_from_db()
+        self.assertEqual(task.attempts, 1)
+        self.assertGreater(task.next_attempt_at, timezone.now())
+        self.assertIn('timeout', task.last_error)
+
+
+GEOHASH_VECTORS = [
+    ((57.64911, 10.40744), 'u4pruydqqvj'),
+    ((42.6, -5.6), 'ezs42'),
+    ((-25.382708, -49.265506), '6gkzwgjzn820'),
+    ((37.8324, 112.5584), 'ww8p1r4t8'),
+    ((0, 0), 's0000'),
+]
+
+
+class GeohashTest(SimpleTestCase):
+    def test_known_vectors(self):
+        for (lat, lon), expected in GEOHASH_VECTORS:
+            with self.subTest(expected=expected):
+                self.assertEqual(
+                    geohash.encode(lat, lon, len(expected)), expected
+                )
+
+    def test_cell_contains_point(self):
+        for (lat, lon), cell in GEOHASH_VECTORS:
+            with self.subTest(cell=cell):
+                min_lat, min_lon, max_lat, max_lon = geohash.decode_bbox(cell)
+                self.assertTrue(min_lat <= lat < max_lat)
+                self.assertTrue(min_lon <= lon < max_lon)
+                lat_size, lon_size = geohash.get_cell_size(len(cell))
+                self.assertAlmostEqual(max_lat - min_lat, lat_size)
+                self.assertAlmostEqual(max_lon - min_lon, lon_size)
+
+    def test_neighbours_touch_cell(self):
+        self.assertEqual(
+            sorted(geohash.neighbours('ezs42')),
+            sorted([
+                'ezs40', 'ezs41', 'ezs43', 'ezs48', 'ezs49',
+                'ezefp', 'ezefr', 'ezefx',
+            ]),
+        )
+
+    def test_prefix_upper_bound(self):
+        self.assertEqual(geohash.get_prefix_upper_bound('u4p'), 'u4q')
+        self.assertEqual(geohash.get_prefix_upper_bound('u4z'), 'u5')
+        self.assertIsNone(geohash.get_prefix_upper_bound('zz'))
+
+
+class LocationQuerySetTest(TestCase):
+    def setUp(self):
+        generator = random.Random(0)
+        points = [
+            (generator.uniform(55.5, 56), generator.uniform(37.2, 38))
+            for _ in range(300)
+        ] + [
+            (generator.uniform(-0.5, 0.5), generator.uniform(-0.5, 0.5))
+            for _ in range(100)
+        ]
+        Location.objects.upsert_coordinates({
+            f'Адрес {number}': point for number, point in enumerate(points)
+        })
+        self.locations = list(Location.objects.all())
+        self.bboxes = [
+            (55.7, 37.5, 55.8, 37.7),
+            (55.5, 37.2, 56, 38),
+            (55.751, 37.611, 55.752, 37.613),
+            (-0.2, -0.3, 0.1, 0.2),
+        ]
+
+    def test_in_bbox_matches_brute_force(self):
+        for min_lat, min_lon, max_lat, max_lon in self.bboxes:
+            with self.subTest(bbox=(min_lat, min_lon, max_lat, max_lon)):
+                expected = {
+                    location.id for location in self.locations
+                    if min_lat <= location.lat <= max_lat
+                    and min_lon <= location.lon <= max_lon
+                }
+                found = Location.objects.in_bbox(
+                    min_lat, min_lon, max_lat, max_lon
+                ).values_list('id', flat=True)
+                self.assertEqual(set(found), expected)
+
+    def test_near_covers_radius(self):
+        for point in [(55.75, 37.6), (55.9, 37.9), (0, 0)]:
+            distances = haversine_matrix(
+                [point],
+                [(location.lat, location.lon) for location in self.locations],
+            )[0]
+            for radius_km in [1, 5, 15]:
+                with self.subTest(point=point, radius_km=radius_km):
+                    expected = {
+                        location.id
+                        for location, distance in zip(
+                            self.locations, distances
+                        )
+                        if distance <= radius_km
+                    }
+                    found = set(
+                        Location.objects.near(*point, radius_km)
+                        .values_list('id', flat=True)
+                    )
+                    self.assertLessEqual(expected, found)
+
+    def test_neighbours_of_matches_cells(self):
+        for lat, lon in [(55.75, 37.6), (0.01, -0.01)]:
+            with self.subTest(point=(lat, lon)):
+                cell = geohash.encode(lat, lon, 4)
+                cells = {cell, *geohash.neighbours(cell)}
+                expected = {
+                    location.id for location in self.locations
+                    if location.geohash[:4] in cells
+                }
+                found = Location.objects.neighbours_of(lat, lon, 4)
+                self.assertEqual(
+                    set(found.values_list('id', flat=True)), expected
+                )
+
+
+@mock.patch('location.cache.time.monotonic')
+class LRUCacheTest(SimpleTestCase):
+    def test_least_recently_used_entry_is_evicted(self, monotonic):
+        monotonic.return_value = 0
+        lru = LRUCache(2)
+        lru.set('a', 1, ttl=10)
+        lru.set('b', 2, ttl=10)
+        lru.get('a')
+        lru.set('c', 3, ttl=10)
+        self.assertEqual(
+            [lru.get('a'), lru.get('b'), lru.get('c')], [1, None, 3]
+        )
+
+    def test_entry_expires(self, monotonic):
+        monotonic.return_value = 0
+        lru = LRUCache(2)
+        lru.set('a', 1, ttl=10)
+        monotonic.return_value = 9
+        self.assertEqual(lru.get('a'), 1)
+        monotonic.return_value = 10
+        self.assertIsNone(lru.get('a'))
+        self.assertEqual(lru.entries, {})
+
+
+@override_settings(GEOCODE_USAGE_FLUSH_INTERVAL=60 * 60)
+class GeocodeCacheTest(TestCase):
+    address = 'Москва, ул. Тверская 1'
+    variant = 'г. Москва, Тверская ул., д. 1'
+
+    def setUp(self):
+        cache.clear()
+        self.geocode_cache = GeocodeCache(100)
+
+    def test_spellings_share_memory_entry(self):
+        self.geocode_cache.set_many({self.address: (55.7, 37.6)})
+        with self.assertNumQueries(0):
+            found = self.geocode_cache.get_many([self.address, self.variant])
+        self.assertEqual(
+            found, {self.address: (55.7, 37.6), self.variant: (55.7, 37.6)}
+        )
+        self.assertEqual(self.geocode_cache.stats['memory_hits'], 1)
+
+    def test_other_process_reads_shared_tier(self):
+        self.geocode_cache.set_many({self.address: (55.7, 37.6)})
+        other_cache = GeocodeCache(100)
+        with self.assertNumQueries(0):
+            found = other_cache.get_many([self.variant])
+        self.assertEqual(found, {self.variant: (55.7, 37.6)})
+        self.assertEqual(other_cache.stats['shared_hits'], 1)
+
+        other_cache.get_many([self.variant])
+        self.assertEqual(other_cache.stats['memory_hits'], 1)
+
+    def test_database_hit_fills_upper_tiers(self):
+        Location.objects.create(address=self.address, lat=55.7, lon=37.6)
+        with self.assertNumQueries(1):
+            found = self.geocode_cache.get_many([self.variant])
+        self.assertEqual(found, {self.variant: (55.7, 37.6)})
+        self.assertEqual(self.geocode_cache.stats['database_hits'], 1)
+
+        with self.assertNumQueries(0):
+            self.geocode_cache.get_many([self.variant])
+            GeocodeCache(100).get_many([self.variant])
+
+    def test_unknown_address_is_a_miss_of_all_tiers(self):
+        self.assertEqual(self.geocode_cache.get_many(['Нигде, 1']), {})
+        self.assertEqual(
+            {
+                tier: self.geocode_cache.stats[f'{tier}_misses']
+                for tier in ['memory', 'shared', 'database']
+            },
+            {'memory': 1, 'shared': 1, 'database': 1},
+        )
+
+    @override_settings(
+        GEOCODE_CACHE_NEGATIVE_TTL=60, GEOCODE_CACHE_POSITIVE_TTL=3600
+    )
+    def test_unresolved_address_is_cached_shorter(self):
+        with mock.patch('location.cache.cache.set_many') as set_many:
+            self.geocode_cache.set_many({
+                self.address: (55.7, 37.6), 'Нигде, 1': (None, None),
+            })
+        self.assertEqual(set_many.call_count, 2)
+        self.assertEqual(
+            {call.args[1]: list(call.args[0]) for call in set_many.mock_calls},
+            {
+                3600: [get_shared_key(normalize_address(self.address))],
+                60: [get_shared_key(normalize_address('Нигде, 1'))],
+            },
+        )
+        with self.assertNumQueries(0):
+            found = self.geocode_cache.get_many(['Нигде, 1'])
+        self.assertEqual(found, {'Нигде, 1': (None, None)})
+
+
+@override_settings(
+    GEOCODE_CACHE_POSITIVE_TTL=24 * 60 * 60,
+    GEOCODE_CACHE_STALE_TTL=5 * 60,
+    GEOCODE_USAGE_FLUSH_INTERVAL=60 * 60,
+    GEOCODE_REFRESH_AHEAD=60 * 60,
+    GEOCODE_REFRESH_RECENTLY_USED=60 * 60,
+)
+class StaleWhileRevalidateTest(TestCase):
+    address = 'Москва, ул. Тверская 1'
+
+    def setUp(self):
+        cache.clear()
+        self.geocode_cache = GeocodeCache(100)
+        self.location = Location.objects.create(
+            address=self.address, lat=55.7, lon=37.6
+        )
+
+    def age_location(self, hours, **fields):
+        Location.objects.filter(pk=self.location.pk).update(
+            updated_at=timezone.now() - timedelta(hours=hours), **fields
+        )
+
+    def test_expired_location_is_served_and_refreshed(self):
+        self.age_location(25)
+
+        found = self.geocode_cache.get_many([self.address])
+
+        self.assertEqual(found, {self.address: (55.7, 37.6)})
+        self.assertEqual(self.geocode_cache.stats['stale_hits'], 1)
+        task = GeocodeTask.objects.get()
+        self.assertEqual(task.address, self.address)
+        self.assertTrue(task.refresh)
+        _, expires_at = self.geocode_cache.memory.entries[
+            normalize_address(self.address)
+        ]
+        self.assertLessEqual(expires_at - time.monotonic(), 5 * 60)
+
+    def test_fresh_location_is_not_refreshed(self):
+        self.age_location(23)
+        self.geocode_cache.get_many([self.address])
+        self.assertEqual(self.geocode_cache.stats['stale_hits'], 0)
+        self.assertFalse(GeocodeTask.objects.exists())
+
+    @mock.patch('location.geofunctions.fetch_coordinates')
+    def test_refresh_task_geocodes_known_address(self, fetch_coordinates):
+        fetch_coordinates.return_value = 55.71, 37.61
+        self.age_location(25)
+        self.geocode_cache.get_many([self.address])
+
+        with mock.patch('location.tasks.geocode_cache', self.geocode_cache):
+            process_due_tasks()
+
+        fetch_coordinates.assert_called_once_with(self.address)
+        self.location.refresh_from_db()
+        self.assertEqual(
+            (self.location.lat, self.location.lon), (55.71, 37.61)
+        )
+        self.assertGreater(
+            self.location.updated_at, timezone.now() - timedelta(minutes=1)
+        )
+        self.assertFalse(GeocodeTask.objects.exists())
+
+    def test_usage_is_flushed_to_location(self):
+        self.geocode_cache.get_many([self.address])
+        self.location.refresh_from_db()
+        self.assertIsNone(self.location.last_used_at)
+
+        with self.assertNumQueries(1):
+            self.geocode_cache.flush_usage()
+        self.location.refresh_from_db()
+        self.assertIsNotNone(self.location.last_used_at)
+
+        with self.assertNumQueries(0):
+            self.geocode_cache.flush_usage()
+
+    def test_recently_used_expiring_locations_are_queued(self):
+        now = timezone.now()
+        self.age_location(23.5, last_used_at=now)
+        Location.objects.create(
+            address='Москва, Арбат 2', lat=55.75, lon=37.59
+        )
+        unused = Location.objects.create(
+            address='Москва, Арбат 3', lat=55.75, lon=37.59
+        )
+        Location.objects.filter(pk=unused.pk).update(
+            updated_at=now - timedelta(hours=23.5),
+            last_used_at=now - timedelta(hours=2),
+        )
+
+        self.assertEqual(schedule_refresh_of_expiring(), 1)
+        task = GeocodeTask.objects.get()
+        self.assertEqual(task.address, self.address)
+        self.assertTrue(task.refresh)
+
+
+class UpsertCoordinatesTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.location = Location.objects.create(
+            address='Москва, ул. Тверская 1', lat=1, lon=1
+        )
+        Location.objects.filter(pk=self.location.pk).update(
+            updated_at=timezone.now() - timedelta(days=1)
+        )
+        self.location.refresh_from_db()
+
+    def assertCoordinates(self, address_coordinates: dict):
+        locations = Location.objects.in_bulk(
+            list(address_coordinates), field_name='address'
+        )
+        for address, (lat, lon) in address_coordinates.items():
+            location = locations[address]
+            self.assertEqual((location.lat, location.lon), (lat, lon))
+            self.assertEqual(location.geohash, geohash.encode(lat, lon))
+            self.assertEqual(
+                location.canonical_address, normalize_address(address)
+            )
+
+    def test_inserts_and_updates_rows(self):
+        address_coordinates = {
+            'Москва, ул. Тверская 1': (55.7576, 37.6136),
+            'Москва, Арбат 2': (55.7522, 37.5965),
+        }
+        with self.assertNumQueries(1):
+            Location.objects.upsert_coordinates(address_coordinates)
+
+        self.assertCoordinates(address_coordinates)
+        self.assertEqual(Location.objects.count(), 2)
+        location = Location.objects.get(pk=self.location.pk)
+        self.assertEqual(location.created_at, self.location.created_at)
+        self.assertGreater(location.updated_at, self.location.updated_at)
+
+    def test_rows_are_written_in_batches(self):
+        address_coordinates = {
+            f'Москва, Арбат {number}': (55 + number / 1000, 37.6)
+            for number in range(250)
+        }
+        with self.assertNumQueries(3):
+            Location.objects.upsert_coordinates(address_coordinates)
+        self.assertCoordinates(address_coordinates)
+
+    @mock.patch('location.models.supports_upsert', return_value=False)
+    def test_fallback_without_upsert_support(self, supports_upsert):
+        address_coordinates = {
+            'Москва, ул. Тверская 1': (55.7576, 37.6136),
+            'Москва, Арбат 2': (55.7522, 37.5965),
+        }
+        Location.objects.upsert_coordinates(address_coordinates)
+        self.assertCoordinates(address_coordinates)
+        self.assertEqual(Location.objects.count(), 2)
+
+    def test_save_updates_every_spelling(self):
+        address_coordinates = {
+            'г. Москва, Тверская ул., д. 1': (55.7576, 37.6136),
+            'Москва, Арбат 2': (55.7522, 37.5965),
+        }
+        with CaptureQueriesContext(connection) as queries:
+            save_coordinates(address_coordinates)
+
+        location_queries = [
+            query for query in queries.captured_queries
+            if 'location_location' in query['sql']
+        ]
+        self.assertEqual(len(location_queries), 2)
+        self.assertCoordinates({
+            **address_coordinates,
+            'Москва, ул. Тверская 1': (55.7576, 37.6136),
+        })
+
+
+class LocalGeocoderTest(SimpleTestCase):
+    def setUp(self):
+        fixture_file = tempfile.NamedTemporaryFile(
+            'w', suffix='.json', encoding='utf-8', delete=False
+        )
+        with fixture_file:
+            json.dump({
+                'Москва, ул. Тверская 1': [55.7576, 37.6136],
+                'Москва, ул. Несуществующая 1': None,
+            }, fixture_file, ensure_ascii=False)
+        self.addCleanup(os.remove, fixture_file.name)
+        self.fixture_path = fixture_file.name
+
+    def test_fixtures_are_matched_by_canonical_form(self):
+        geocoder = LocalGeocoder(self.fixture_path)
+        self.assertEqual(
+            geocoder.geocode('г. Москва, Тверская ул., д. 1'),
+            (55.7576, 37.6136),
+        )
+        self.assertEqual(
+            geocoder.geocode('Москва, ул. Несуществующая 1'), (None, None)
+        )
+
+    def test_unknown_addresses_are_synthesized(self):
+        bbox = (55.55, 37.35, 55.95, 37.85)
+        geocoder = LocalGeocoder(self.fixture_path, bbox=bbox)
+        coordinates = {
+            address: geocoder.geocode(address)
+            for address in [f'Москва, Арбат {number}' for number in range(50)]
+        }
+        for lat, lon in coordinates.values():
+            self.assertTrue(bbox[0] <= lat <= bbox[2])
+            self.assertTrue(bbox[1] <= lon <= bbox[3])
+        self.assertEqual(len(set(coordinates.values())), 50)
+        self.assertEqual(
+            LocalGeocoder().geocode('москва арбат 1'),
+            coordinates['Москва, Арбат 1'],
+        )
+
+    def test_synthesis_can_be_turned_off(self):
+        geocoder = LocalGeocoder(self.fixture_path, synthesize=False)
+        self.assertEqual(geocoder.geocode('Москва, Арбат 2'), (None, None))
+
+    def test_backend_is_configured_by_settings(self):
+        with mock.patch.object(backends, '_geocoder', None), \
+                override_settings(
+                    GEOCODER_BACKEND='location.backends.LocalGeocoder',
+                    GEOCODER_OPTIONS={
+                        'fixture_path': self.fixture_path,
+                        'synthesize': False,
+                    },
+                ):
+            geocoder = get_geocoder()
+            self.assertIsInstance(geocoder, LocalGeocoder)
+            self.assertIs(get_geocoder(), geocoder)
+            self.assertEqual(
+                geocoder.geocode('Москва, Арбат 2'), (None, None)
+            )
+
+
+class SwapLocationCoordinatesTest(TestCase):
+    def test_coordinates_are_swapped_both_ways(self):
+        migration = import_module(
+            'location.migrations.0005_swap_location_coordinates'
+        )
+        location = Location.objects.create(
+            address='Москва, ул. Тверская 1', lat=37.6136, lon=55.7576
+        )
+        unknown = Location.objects.create(address='Нигде, 1')
+
+        migration.swap_coordinates(apps, None)
+        location.refresh_from_db()
+        self.assertEqual((location.lat, location.lon), (55.7576, 37.6136))
+        unknown.refresh_from_db()
+        self.assertEqual((unknown.lat, unknown.lon), (None, None))
+
+        migration.swap_coordinates(apps, None)
+        location.refresh_from_db()
+        self.assertEqual((location.lat, location.lon), (37.6136, 55.7576))
+
+
+class DistanceMatrixTest(SimpleTestCase):
+    def setUp(self):
+        generator = random.Random(0)
+        self.origins = [
+            (generator.uniform(55.5, 56), generator.uniform(37.2, 38))
+            for _ in range(20)
+        ]
+        self.destinations = [
+            (generator.uniform(55.5, 56), generator.uniform(37.2, 38))
+            for _ in range(15)
+        ]
+
+    def test_haversine_is_close_to_geodesic(self):
+        matrix = haversine_matrix(self.origins, self.destinations)
+        self.assertEqual(matrix.shape, (20, 15))
+        for row, origin in enumerate(self.origins):
+            for column, destination in enumerate(self.destinations):
+                geodesic = distance.distance(origin, destination).km
+                self.assertAlmostEqual(
+                    matrix[row, column], geodesic, delta=geodesic * 0.005
+                )
+
+    def test_same_points_are_at_zero_distance(self):
+        matrix = haversine_matrix(self.origins, self.origins)
+        np.testing.assert_allclose(np.diag(matrix), 0, atol=1e-9)
+        np.testing.assert_allclose(matrix, matrix.T)
+
+    def test_empty_sides(self):
+        self.assertEqual(
+            haversine_matrix([], self.destinations).shape, (0, 15)
+        )
+        self.assertEqual(haversine_matrix(self.origins, []).shape, (20, 0))
+
+    def test_geodesic_matrix_computes_masked_pairs(self):
+        mask = np.zeros((20, 15), dtype=bool)
+        mask[0, 0] = mask[3, 7] = True
+        matrix = geodesic_matrix(self.origins, self.destinations, mask)
+        self.assertEqual(np.count_nonzero(~np.isnan(matrix)), 2)
+        self.assertAlmostEqual(
+            matrix[3, 7],
+            distance.distance(self.origins[3], self.destinations[7]).km,
+        )
@@ -15,6 +15,12 @@ urlpatterns = [
     # TODO заглушка для нереализованного функционала
     path('orders/', views.view_orders, name="view_orders"),
 
+    path(
+        'geocoder-metrics/',
+        views.view_geocoder_metrics,
+        name="view_geocoder_metrics"
+    ),
+
     path('login/', views.LoginView.as_view(), name="login"),
     path('logout/', views.LogoutView.as_view(), name="logout"),
 ]
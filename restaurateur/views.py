@@ -1,4 +1,6 @@
 from django import forms
+from django.db.models import Prefetch
+from django.http import JsonResponse
 from django.shortcuts import redirect, render
 from django.views import View
 from django.urls import reverse_lazy
@@ -6,11 +8,10 @@ from django.contrib.auth.decorators import user_passes_test
 from django.contrib.auth import authenticate, login
 from django.contrib.auth import views as auth_views
 
-from foodcartapp.models import Product, Restaurant, Order
+from foodcartapp.models import Product, Restaurant, Order, OrderCandidate
 from location.geofunctions import (
-    get_coordinates,
-    get_distance,
     get_address_coordinates,
+    get_geocoder_metrics,
 )
 
 
@@ -110,27 +111,22 @@ def view_restaurants(request):
 
 @user_passes_test(is_manager, login_url='restaurateur:login')
 def view_orders(request):
-    restaurants = Restaurant.objects.prefetch_related('menu_items')
-
-    restaurants_with_availability = {}
-    for restaurant in restaurants:
-        restaurants_with_availability[restaurant] = [
-            item.product_id for item in restaurant.menu_items.all()
-            if item.availability]
-
     active_orders = Order.objects \
         .filter(status__in=['10', '20', '30', '40']) \
         .prefetch_related('positions') \
         .prefetch_related('performer') \
-        .order_by('status') \
-        .fetch_with_total()
-
-    new_orders_addresses = active_orders.filter(status='10')\
-        .values_list('address', flat=True)
-    restaurant_addresses = restaurants.values_list('address', flat=True)
-    address_coordinates = get_address_coordinates(
-        list(new_orders_addresses) + list(restaurant_addresses)
-    )
+        .prefetch_related(Prefetch(
+            'candidates',
+            queryset=OrderCandidate.objects
+            .select_related('restaurant')
+            .order_by('rank')
+        )) \
+        .order_by('status')
+
+    unassigned_addresses = [
+        order.address for order in active_orders if not order.performer
+    ]
+    address_coordinates = get_address_coordinates(unassigned_addresses)
 
     for order in active_orders:
         order.possible_restaurants = []
@@ -138,29 +134,15 @@ def view_orders(request):
             continue
         order_location = address_coordinates.get(order.address)
         if not order_location:
-            order_location = get_coordinates(order.address)
-        if not order_location or not order_location[0]:
+            order.error = 'Адрес ещё не обработан'
+            continue
+        if not order_location[0]:
             order.error = 'Ошибка геолокации'
             continue
-        for restaurant in restaurants:
-            can_perform = all(
-                [product.product_id in restaurants_with_availability[restaurant]
-                 for product in order.positions.all()]
-            )
-            if not can_perform:
-                continue
-            restaurant_location = address_coordinates.get(
-                restaurant.address
-            )
-            if not restaurant_location:
-                restaurant_location = get_coordinates(restaurant.address)
-            distance = round(get_distance(
-                order_location, restaurant_location
-                ), 2)
-            order.possible_restaurants.append(
-                (distance, restaurant.name)
-                )
-        order.possible_restaurants.sort()
+        order.possible_restaurants = [
+            (round(candidate.distance, 2), candidate.restaurant.name)
+            for candidate in order.candidates.all()
+        ]
 
     return render(
         request, template_name='order_items.html', context={
@@ -168,3 +150,8 @@ def view_orders(request):
             'opts': Order._meta,
         }
     )
+
+
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def view_geocoder_metrics(request):
+    return JsonResponse(get_geocoder_metrics())
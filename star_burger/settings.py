@@ -89,6 +89,10 @@ DATABASES = {
     )
 }
 
+CACHES = {
+    'default': env.dj_cache_url('CACHE_URL', 'locmem://'),
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -126,8 +130,47 @@ STATICFILES_DIRS = [
     os.path.join(BASE_DIR, "bundles"),
 ]
 
-YANDEX_GEOCODER_APIKEY = env('YANDEX_GEOCODER_APIKEY')
+YANDEX_GEOCODER_APIKEY = env('YANDEX_GEOCODER_APIKEY', '')
+GEOCODER_BACKEND = env(
+    'GEOCODER_BACKEND', 'location.backends.YandexGeocoder'
+)
+GEOCODER_OPTIONS = env.json('GEOCODER_OPTIONS', '{}')
 LOCATION_UPDATE_TIMEOUT = 3
+GEOCODE_CACHE_POSITIVE_TTL = LOCATION_UPDATE_TIMEOUT * 24 * 60 * 60
+GEOCODE_CACHE_NEGATIVE_TTL = 60 * 60
+GEOCODE_CACHE_STALE_TTL = 5 * 60
+GEOCODE_USAGE_FLUSH_INTERVAL = 60
+GEOCODE_REFRESH_AHEAD = 12 * 60 * 60
+GEOCODE_REFRESH_RECENTLY_USED = 24 * 60 * 60
+GEOCODE_SWEEP_INTERVAL = 10 * 60
+GEOCODE_MEMORY_CACHE_SIZE = 10000
+GEOCODER_MAX_WORKERS = 8
+GEOCODER_RATE_LIMIT = 10
+GEOCODER_RATE_BURST = 5
+GEOCODER_TIMEOUT = 5
+GEOCODER_CONNECT_TIMEOUT = 2
+GEOCODER_RETRIES = 2
+GEOCODER_RETRY_BACKOFF = 0.2
+GEOCODER_BREAKER_THRESHOLD = 5
+GEOCODER_BREAKER_RESET_TIMEOUT = 30
+GEOCODER_BATCH_TIMEOUT = 15
+RESTAURANT_INDEX_CELL_KM = 2
+RESTAURANT_SEARCH_RADIUS_KM = 30
+ORDER_CANDIDATES_LIMIT = 20
+ORDER_CANDIDATES_EXACT_LIMIT = 5
+DISPATCH_RESTAURANT_CAPACITY = 10
+GEOCODE_WORKER_IN_PROCESS = env.bool('GEOCODE_WORKER_IN_PROCESS', True)
+GEOCODE_WORKER_INTERVAL = 30
+GEOCODE_MAX_ATTEMPTS = 8
+GEOCODE_RETRY_BASE_DELAY = 30
+GEOCODE_RETRY_MAX_DELAY = 60 * 60
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+
+ORDER_INTAKE_MODE = env('ORDER_INTAKE_MODE', 'sync')
+PARTNER_API_TOKENS = env.dict('PARTNER_API_TOKENS', {})
+ORDER_JOURNAL_PATH = env(
+    'ORDER_JOURNAL_PATH', os.path.join(BASE_DIR, 'order_journal.sqlite3')
+)
 
 ROLLBAR = {
     'access_token': env('ROLLBAR_TOKEN'),
@@ -136,6 +179,9 @@ ROLLBAR = {
     'root': BASE_DIR,
 }
 REST_FRAMEWORK = {
-    'EXCEPTION_HANDLER': 'rollbar.contrib.django_rest_framework.post_exception_handler'
+    'EXCEPTION_HANDLER': 'rollbar.contrib.django_rest_framework.post_exception_handler',
+    'DEFAULT_THROTTLE_RATES': {
+        'partner': env('PARTNER_THROTTLE_RATE', '60/min'),
+    },
 }
 